@@ -0,0 +1,73 @@
+# coding=UTF-8
+"""
+Author: trickerer (https://github.com/trickerer, https://github.com/trickerer01)
+"""
+#########################################
+#
+#
+
+from __future__ import annotations
+
+import functools
+import os
+from asyncio import get_running_loop
+from collections.abc import Callable
+from concurrent.futures import ThreadPoolExecutor
+from typing import TypeVar
+
+from .defs import FS_THREADS_MAX
+from .metrics import Metrics
+
+__all__ = ('call', 'getsize', 'isdir', 'isfile', 'makedirs', 'remove', 'rename', 'samefile')
+
+T = TypeVar('T')
+
+_executor: ThreadPoolExecutor | None = None
+
+
+def _get_executor() -> ThreadPoolExecutor:
+    global _executor
+    if _executor is None:
+        _executor = ThreadPoolExecutor(FS_THREADS_MAX, 'rv_fs')
+    return _executor
+
+
+async def call(func: Callable[..., T], *args, op='') -> T:
+    """
+    Runs blocking filesystem **func** in a bounded thread pool so a slow (network) filesystem can't stall the event loop.
+    Call time is recorded as the time the loop would have been blocked otherwise (see 'fs_call_seconds' metric)
+    """
+    with Metrics.timer('fs_call_seconds', op=op or func.__name__):
+        return await get_running_loop().run_in_executor(_get_executor(), func, *args)
+
+
+async def isfile(path: str) -> bool:
+    return await call(os.path.isfile, path, op='isfile')
+
+
+async def isdir(path: str) -> bool:
+    return await call(os.path.isdir, path, op='isdir')
+
+
+async def getsize(path: str) -> int:
+    return await call(os.path.getsize, path, op='stat')
+
+
+async def samefile(path1: str, path2: str) -> bool:
+    return await call(os.path.samefile, path1, path2, op='stat')
+
+
+async def makedirs(path: str, exist_ok=False) -> None:
+    return await call(functools.partial(os.makedirs, exist_ok=exist_ok), path, op='makedirs')
+
+
+async def rename(oldpath: str, newpath: str) -> None:
+    return await call(os.rename, oldpath, newpath, op='rename')
+
+
+async def remove(path: str) -> None:
+    return await call(os.remove, path, op='remove')
+
+#
+#
+#########################################
@@ -0,0 +1,267 @@
+# coding=UTF-8
+"""
+Author: trickerer (https://github.com/trickerer, https://github.com/trickerer01)
+"""
+#########################################
+#
+#
+
+from __future__ import annotations
+
+import json
+import multiprocessing
+import os
+import random
+import re
+import sys
+import time
+from asyncio import Event, run, sleep
+from collections.abc import Sequence
+from multiprocessing.connection import Connection
+from multiprocessing.sharedctypes import Synchronized
+from typing import NamedTuple
+
+from aiohttp import web
+
+from .config import Config
+from .defs import UTF8, Mem
+from .main import main_sync
+
+try:
+    import resource
+except ImportError:  # Windows
+    resource = None
+
+__all__ = ('BenchResult', 'StubSite', 'StubSiteParams')
+
+STUB_CHUNK_SIZE = 64 * Mem.KB
+STUB_TAGS = ('3d', 'animated', 'blender', 'sfm', 'sound', 'loop', 'female', 'male', 'solo', 'outdoors')
+re_range = re.compile(r'bytes=(\d+)-(\d*)')
+
+
+class StubSiteParams(NamedTuple):
+    """Local stub site behavior"""
+    latency: float = 0.0
+    '''delay before each response, seconds'''
+    bandwidth: int = 0
+    '''media bytes per second for each response, 0 - unlimited'''
+    file_size: int = 4 * Mem.MB
+    ratio_404: float = 0.0
+    '''share of video ids which don't exist'''
+    throttle_after: int = 0
+    '''media bytes sent within single response after which bandwidth drops to **throttle_bandwidth**, 0 - never'''
+    throttle_bandwidth: int = 1 * Mem.KB
+    listing_pages: int = 5
+    page_size: int = 24
+    max_id: int = 10000
+    '''listing pages list ids from this one down'''
+    seed: int = 0
+
+
+class BenchResult(NamedTuple):
+    exit_code: int
+    pages_served: int
+    '''video pages requested from stub site, retries included'''
+    seconds: float
+    cpu_seconds: float
+    bytes_written: int
+    peak_rss: int
+    '''app process peak, bytes. 0 if not available'''
+
+    @property
+    def pages_per_second(self) -> float:
+        return self.pages_served / (self.seconds or 1.0)
+
+    @property
+    def mbytes_per_second(self) -> float:
+        return self.bytes_written / Mem.MB / (self.seconds or 1.0)
+
+    def __str__(self) -> str:
+        return (f'{self.pages_served:d} video pages in {self.seconds:.2f}s ({self.pages_per_second:.1f} pages/s),'
+                f' written {self.bytes_written / Mem.MB:.1f} Mb ({self.mbytes_per_second:.1f} Mb/s),'
+                f' cpu {self.cpu_seconds:.2f}s, peak rss {self.peak_rss / Mem.MB:.0f} Mb, exit code {self.exit_code:d}')
+
+
+def _make_app(params: StubSiteParams, popup_hits: Synchronized) -> web.Application:
+    payload = os.urandom(2 * Mem.MB)
+
+    def is_404(video_id: int) -> bool:
+        return random.Random(params.seed * 1000003 + video_id).random() < params.ratio_404
+
+    async def serve_popup(request: web.Request) -> web.Response:
+        await sleep(params.latency)
+        video_id = int(request.match_info['id'])
+        with popup_hits.get_lock():
+            popup_hits.value += 1
+        if is_404(video_id):
+            return web.Response(status=404, text='<html><head><title>404 Not Found</title></head></html>', content_type='text/html')
+        rng = random.Random(params.seed + video_id)
+        base_url = f'{request.scheme}://{request.host}'
+        tags = ''.join(f'<a class="tag_item" href="/tags/{tag}/">{tag}</a>' for tag in rng.sample(STUB_TAGS, 4))
+        links = ''.join(f'<a class="tag_item" href="{base_url}/get_file/{video_id:d}_{quality}.mp4/?br=1">MP4 {quality}</a>'
+                        for quality in ('360p', '720p'))
+        return web.Response(text=(
+            f'<html><head><title>Video {video_id:d}</title></head><body><div class="popup">'
+            f'<h1 class="title_video">Video {video_id:d}</h1>'
+            f'<div class="info row"><div class="item"><span>{rng.randint(1, 99999):d}</span>'
+            f'<span>{rng.randint(0, 9):d}:{rng.randint(10, 59):d}</span></div></div>'
+            f'<div class="voters"><span class="voters count">{rng.randint(50, 100):d}% ({rng.randint(1, 999):d})</span></div>'
+            f'<div class="row"><div class="col"><div class="label">Artist</div><a href="/models/a/"><span class="name">artist{video_id % 7:d}'
+            f'</span></a></div><div class="col"><div class="label">Uploaded by</div><a href="/members/1/">uploader1</a></div></div>'
+            f'<div class="row"><div class="label">Tags</div>{tags}</div>'
+            f'<div class="row"><em>Description of video {video_id:d}</em></div>'
+            f'<div class="row"><div class="label">Download</div>{links}</div>'
+            f'</div></body></html>'), content_type='text/html')
+
+    async def serve_listing(request: web.Request) -> web.Response:
+        await sleep(params.latency)
+        base_url = f'{request.scheme}://{request.host}'
+        page_num = next((int(request.query[key]) for key in ('from_videos', 'from_fav_videos', 'from') if key in request.query), 1)
+        first_id = params.max_id - (page_num - 1) * params.page_size
+        refs = ''.join(
+            f'<a class="th js-open-popup" href="{base_url}/video/{idi:d}/video-{idi:d}/"><div class="img wrap_image"'
+            f' data-preview="{base_url}/get_file/{idi:d}_preview.mp4/"></div><div class="thumb_title">Video {idi:d}</div>'
+            f'<div class="time">1:00</div></a>'
+            for idi in range(first_id, max(first_id - params.page_size, 0), -1) if page_num <= params.listing_pages)
+        return web.Response(text=(
+            f'<html><body><div class="thumbs clearfix">{refs}</div><div class="pagination">'
+            f'<a data-action="ajax" data-parameters="q:a;from:{params.listing_pages:d}">Last</a></div></body></html>'),
+            content_type='text/html')
+
+    async def serve_voting(request: web.Request) -> web.Response:
+        await sleep(params.latency)
+
+        def make_votes(ids_str: str) -> list[dict[str, int | str]]:
+            return [{'status': 'normal', 'up_score': 5, 'down_score': 0, 'up_users': 5, 'down_users': 0, 'user_vote': 0,
+                     'tag_id': int(id_), 'item_id': int(id_)} for id_ in ids_str.split(',') if id_]
+        return web.Response(text=json.dumps({
+            'status': 'success', 'video_id': int(request.query.get('video_id', '0')), 'logged_in': 0, 'can_vote': 0,
+            'tags': make_votes(request.query.get('tag_ids', '')),
+            'items': make_votes(f'{request.query.get("category_ids", "")},{request.query.get("model_ids", "")}'),
+            'pending_tags': [], 'pending_items': [],
+        }), content_type='application/json')
+
+    async def serve_screenshot(_: web.Request) -> web.Response:
+        await sleep(params.latency)
+        return web.Response(body=payload[:8 * Mem.KB], content_type='image/jpeg')
+
+    async def serve_media(request: web.Request) -> web.StreamResponse:
+        await sleep(params.latency)
+        total = params.file_size
+        start, end = 0, total - 1
+        range_match = re_range.fullmatch(request.headers.get('Range', ''))
+        if range_match:
+            start, end = int(range_match.group(1)), min(int(range_match.group(2) or total - 1), total - 1)
+            if start >= total:
+                return web.Response(status=416, headers={'Content-Range': f'bytes */{total:d}'})
+        headers = {'Accept-Ranges': 'bytes', 'Content-Length': str(end + 1 - start), 'Content-Type': 'video/mp4'}
+        if range_match:
+            headers['Content-Range'] = f'bytes {start:d}-{end:d}/{total:d}'
+        response = web.StreamResponse(status=206 if range_match else 200, headers=headers)
+        await response.prepare(request)
+        sent = 0
+        try:
+            while start + sent <= end:
+                nbytes = min(STUB_CHUNK_SIZE, end + 1 - start - sent)
+                offset = (start + sent) % Mem.MB
+                await response.write(payload[offset:offset + nbytes])
+                sent += nbytes
+                bandwidth = params.throttle_bandwidth if 0 < params.throttle_after <= sent else params.bandwidth
+                if bandwidth:
+                    await sleep(nbytes / bandwidth)
+        except ConnectionResetError:
+            pass  # dropped by client (throttle check)
+        return response
+
+    app = web.Application()
+    app.router.add_get('/popup-video/{id}/', serve_popup)
+    app.router.add_get('/tag_vote_state_public.php', serve_voting)
+    app.router.add_get('/contents/videos_screenshots/{group}/{id}/{size}/{num}.jpg', serve_screenshot)
+    app.router.add_get('/get_file/{name}/', serve_media)
+    for listing_path in ('/search/', '/members/{id}/videos/', '/members/{id}/favourites/videos/', '/models/{name}/',
+                         '/playlists/{id}/{name}/'):
+        app.router.add_get(listing_path, serve_listing)
+    return app
+
+
+def _serve(params: StubSiteParams, popup_hits: Synchronized, port_conn: Connection) -> None:
+    async def serve() -> None:
+        runner = web.AppRunner(_make_app(params, popup_hits), access_log=None)
+        await runner.setup()
+        await web.TCPSite(runner, '127.0.0.1', 0).start()
+        port_conn.send(runner.addresses[0][1])
+        await Event().wait()  # until terminated
+    run(serve())
+
+
+def _peak_rss() -> int:
+    try:
+        # unlike ru_maxrss VmHWM is not carried over from parent process through fork / exec
+        with open('/proc/self/status', 'rt', encoding=UTF8) as sfile:
+            return next(int(line.split()[1]) * Mem.KB for line in sfile if line.startswith('VmHWM:'))
+    except (OSError, StopIteration):
+        pass
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * (1 if sys.platform == 'darwin' else Mem.KB) if resource else 0
+
+
+def _run_app(args: Sequence[str], dest: str, nodelay: bool, base_url: str, result_conn: Connection) -> None:
+    Config.nodelay = nodelay
+    Config.site_base_url = base_url
+    cpu_start, time_start = time.process_time(), time.perf_counter()
+    exit_code = main_sync([*args, '-path', dest])
+    seconds, cpu_seconds = time.perf_counter() - time_start, time.process_time() - cpu_start
+    result_conn.send((exit_code, seconds, cpu_seconds, _peak_rss()))
+
+
+class StubSite:
+    """
+    Local stand-in for the site serving generated popup pages, listing pages, voting json, screenshots and media streams.
+    Server runs in a separate process so its cpu time and memory are not accounted to the app being measured.
+    Use run() to execute the app end to end against it, each run happens in a fresh process
+    """
+    def __init__(self, params: StubSiteParams | None = None) -> None:
+        self._params = params or StubSiteParams()
+        self._ctx = multiprocessing.get_context('spawn')
+        self._popup_hits: Synchronized = self._ctx.Value('q', 0)
+        self._proc: multiprocessing.Process | None = None
+        self.base_url = ''
+
+    def __enter__(self) -> StubSite:
+        port_conn, child_conn = self._ctx.Pipe(False)
+        self._proc = self._ctx.Process(target=_serve, args=(self._params, self._popup_hits, child_conn), daemon=True)
+        self._proc.start()
+        if not port_conn.poll(30.0):
+            self._proc.terminate()
+            raise OSError('Stub site failed to start!')
+        self.base_url = f'http://127.0.0.1:{port_conn.recv():d}'
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb) -> None:
+        self._proc.terminate()
+        self._proc.join()
+        self._proc = None
+
+    def run(self, args: Sequence[str], dest: str, *, nodelay=True) -> BenchResult:
+        """
+        Runs the app with **args** in a separate process against the stub site saving files to **dest** (empty folder),
+        so reported cpu time and peak memory belong to this run alone. **nodelay** disables request rate limiting
+        so only the app itself is measured
+        """
+        with self._popup_hits.get_lock():
+            self._popup_hits.value = 0
+        result_conn, child_conn = self._ctx.Pipe(False)
+        proc = self._ctx.Process(target=_run_app, args=(list(args), dest, nodelay, self.base_url, child_conn))
+        proc.start()
+        child_conn.close()
+        try:
+            exit_code, seconds, cpu_seconds, peak_rss = result_conn.recv()
+        except EOFError:
+            raise OSError(f'App process exited abnormally with code {proc.exitcode}!') from None
+        finally:
+            proc.join()
+        bytes_written = sum(os.path.getsize(os.path.join(folder, fname)) for folder, _, fnames in os.walk(dest) for fname in fnames)
+        return BenchResult(exit_code, self._popup_hits.value, seconds, cpu_seconds, bytes_written, peak_rss)
+
+#
+#
+#########################################
@@ -15,11 +15,14 @@ from .defs import (
     ACTION_APPEND,
     ACTION_EXTEND,
     ACTION_STORE_TRUE,
+    CONNECT_KEEPALIVE_TIMEOUT_DEFAULT,
+    CONNECT_REQUEST_BURST_DEFAULT,
     CONNECT_RETRIES_BASE,
     DEFAULT_QUALITY,
     DOWNLOAD_MODE_DEFAULT,
     DOWNLOAD_MODES,
     DOWNLOAD_POLICY_DEFAULT,
+    DOWNLOAD_SEGMENTS_DEFAULT,
     HELP_ARG_ALL_PAGES,
     HELP_ARG_BEGIN_STOP_ID,
     HELP_ARG_BLACKLIST,
@@ -27,9 +30,12 @@ from .defs import (
     HELP_ARG_CHECK_UPLOADER,
     HELP_ARG_CHECK_VOTES,
     HELP_ARG_CMDFILE,
+    HELP_ARG_CONNECTIONS_PER_HOST,
     HELP_ARG_CONTINUE,
     HELP_ARG_COOKIE,
+    HELP_ARG_DEST_SCAN_CACHE,
     HELP_ARG_DMMODE,
+    HELP_ARG_DOWNLOAD_SEGMENTS,
     HELP_ARG_DUMP_INFO,
     HELP_ARG_DUMP_SCREENSHOTS,
     HELP_ARG_DURATION,
@@ -40,14 +46,20 @@ from .defs import (
     HELP_ARG_FSLEVELUP,
     HELP_ARG_GET_MAXID,
     HELP_ARG_HEADER,
+    HELP_ARG_HTML_CONNECTIONS,
     HELP_ARG_ID_COUNT,
     HELP_ARG_ID_END,
     HELP_ARG_ID_START,
     HELP_ARG_IDSEQUENCE,
+    HELP_ARG_JOURNAL_FILE,
+    HELP_ARG_KEEPALIVE_TIMEOUT,
     HELP_ARG_LINKSEQUENCE,
     HELP_ARG_LOGGING,
     HELP_ARG_LOOKAHEAD,
+    HELP_ARG_MEDIA_CONNECTIONS,
     HELP_ARG_MERGE_LISTS,
+    HELP_ARG_METRICS_FILE,
+    HELP_ARG_METRICS_PORT,
     HELP_ARG_MINRATING,
     HELP_ARG_MINSCORE,
     HELP_ARG_MODEL,
@@ -56,7 +68,9 @@ from .defs import (
     HELP_ARG_NOMOVE,
     HELP_ARG_PAGE_COUNT,
     HELP_ARG_PAGE_END,
+    HELP_ARG_PAGE_PREFETCH,
     HELP_ARG_PAGE_START,
+    HELP_ARG_PARSE_PROCESSES,
     HELP_ARG_PATH,
     HELP_ARG_PLAYLIST,
     HELP_ARG_PREDICT_ID_GAPS,
@@ -65,7 +79,12 @@ from .defs import (
     HELP_ARG_PROXYNOHTML,
     HELP_ARG_QUALITY,
     HELP_ARG_REPORT_DUPLICATES,
+    HELP_ARG_REQUEST_BURST,
+    HELP_ARG_REQUEST_RATE,
     HELP_ARG_RETRIES,
+    HELP_ARG_SCAN_CACHE,
+    HELP_ARG_SCAN_CACHE_TTL,
+    HELP_ARG_SCAN_TASKS,
     HELP_ARG_SEARCH_ACT,
     HELP_ARG_SEARCH_RULE,
     HELP_ARG_SEARCH_STR,
@@ -73,6 +92,7 @@ from .defs import (
     HELP_ARG_SKIP_EMPTY_LISTS,
     HELP_ARG_SOLVE_TAG_CONFLICTS,
     HELP_ARG_STORE_CONTINUE_CMDFILE,
+    HELP_ARG_STREAM_PAGES,
     HELP_ARG_THROTTLE,
     HELP_ARG_THROTTLE_AUTO,
     HELP_ARG_TIMEOUT,
@@ -80,17 +100,22 @@ from .defs import (
     HELP_ARG_UPLOADER,
     HELP_ARG_UTPOLICY,
     HELP_ARG_VERSION,
+    HELP_ARG_WRITE_BUFFER_SIZE,
     IDGAP_PREDICTION_DEFAULT,
     IDGAP_PREDICTION_MODES,
     LOGGING_FLAGS_DEFAULT,
     MAX_DEST_SCAN_SUB_DEPTH_DEFAULT,
     MAX_DEST_SCAN_UPLEVELS_DEFAULT,
+    MAX_SCAN_QUEUE_SIZE,
     NAMING_FLAGS_DEFAULT,
+    PAGE_PREFETCH_DEFAULT,
     QUALITIES,
+    SCAN_CACHE_TTL_DEFAULT,
     SEARCH_RULE_DEFAULT,
     SEARCH_RULES,
     UNTAGGED_POLICIES,
     UTF8,
+    WRITE_BUFFER_SIZE_DEFAULT,
 )
 from .logger import Log
 from .scenario import DownloadScenario
@@ -108,17 +133,28 @@ from .validators import (
     naming_flags,
     positive_int,
     positive_nonzero_int,
+    valid_download_segments,
     valid_duration,
     valid_filepath_abs,
+    valid_filepath_new,
     valid_int,
+    valid_keepalive_timeout,
     valid_kwarg,
     valid_lookahead,
+    valid_page_prefetch,
+    valid_parse_processes,
     valid_path,
+    valid_pool_size,
+    valid_port,
     valid_proxy,
     valid_rating,
+    valid_request_burst,
+    valid_request_rate,
+    valid_scan_tasks,
     valid_search_string,
     valid_session_id,
     valid_timeout,
+    valid_write_buffer_size,
 )
 from .version import APP_NAME, APP_VERSION
 
@@ -269,6 +305,21 @@ def add_common_args(par: ArgumentParser) -> None:
     co.add_argument('-retries', metavar='#number', default=CONNECT_RETRIES_BASE, help=HELP_ARG_RETRIES, type=positive_int)
     co.add_argument('-throttle', metavar='#rate', default=0, help=HELP_ARG_THROTTLE, type=positive_nonzero_int)
     co.add_argument('-athrottle', '--throttle-auto', action=ACTION_STORE_TRUE, help=HELP_ARG_THROTTLE_AUTO)
+    co.add_argument('-reqrate', '--request-rate', metavar='#rate', default=0.0, help=HELP_ARG_REQUEST_RATE, type=valid_request_rate)
+    co.add_argument('-reqburst', '--request-burst', metavar='#number', default=CONNECT_REQUEST_BURST_DEFAULT, help=HELP_ARG_REQUEST_BURST,
+                    type=valid_request_burst)
+    co.add_argument('-scantasks', '--scan-tasks', metavar='#number', default=MAX_SCAN_QUEUE_SIZE, help=HELP_ARG_SCAN_TASKS,
+                    type=valid_scan_tasks)
+    co.add_argument('-parseproc', '--parse-processes', metavar='#number', default=0, help=HELP_ARG_PARSE_PROCESSES,
+                    type=valid_parse_processes)
+    co.add_argument('-htmlconns', '--html-connections', metavar='#number', default=0, help=HELP_ARG_HTML_CONNECTIONS,
+                    type=valid_pool_size)
+    co.add_argument('-mediaconns', '--media-connections', metavar='#number', default=0, help=HELP_ARG_MEDIA_CONNECTIONS,
+                    type=valid_pool_size)
+    co.add_argument('-hostconns', '--connections-per-host', metavar='#number', default=0, help=HELP_ARG_CONNECTIONS_PER_HOST,
+                    type=valid_pool_size)
+    co.add_argument('-keepalive', '--keepalive-timeout', metavar='#seconds', default=CONNECT_KEEPALIVE_TIMEOUT_DEFAULT,
+                    help=HELP_ARG_KEEPALIVE_TIMEOUT, type=valid_keepalive_timeout)
     co.add_argument('-header', metavar='#name=value', action=ACTION_APPEND, help=HELP_ARG_HEADER, type=valid_kwarg)
     co.add_argument('-cookie', metavar='#name=value', action=ACTION_APPEND, help=HELP_ARG_COOKIE, type=valid_kwarg)
     co.add_argument('-session_id', default=None, help=HELP_ARG_SESSION_ID, type=valid_session_id)
@@ -277,13 +328,22 @@ def add_common_args(par: ArgumentParser) -> None:
     do.add_argument('-quality', default=DEFAULT_QUALITY, help=HELP_ARG_QUALITY, choices=QUALITIES)
     do.add_argument('-fsdepth', metavar='#number', default=FSDEPTH_DEFAULT, help=HELP_ARG_FSDEPTH, type=positive_int)
     do.add_argument('-fslevelup', metavar='#number', default=FSUP_DEFAULT, help=HELP_ARG_FSLEVELUP, type=positive_nonzero_int)
+    do.add_argument('--dest-scan-cache', action=ACTION_STORE_TRUE, help=HELP_ARG_DEST_SCAN_CACHE)
     do.add_argument('-continue', '--continue-mode', action=ACTION_STORE_TRUE, help=HELP_ARG_CONTINUE)
     do.add_argument('-unfinish', '--keep-unfinished', action=ACTION_STORE_TRUE, help=HELP_ARG_UNFINISH)
     do.add_argument('--store-continue-cmdfile', action=ACTION_STORE_TRUE, help=HELP_ARG_STORE_CONTINUE_CMDFILE)
+    do.add_argument('-journal', '--journal-file', metavar='#filepath', default=None, help=HELP_ARG_JOURNAL_FILE, type=valid_filepath_new)
     do.add_argument('-nomove', '--no-rename-move', action=ACTION_STORE_TRUE, help=HELP_ARG_NOMOVE)
     do.add_argument('-naming', default=NAMING_DEFAULT, help=HELP_ARG_NAMING, type=naming_flags)
     do.add_argument('-dmode', '--download-mode', default=DM_DEFAULT, help=HELP_ARG_DMMODE, choices=DOWNLOAD_MODES)
     do.add_argument('-script', '--download-scenario', default=None, help=HELP_ARG_DWN_SCENARIO, type=DownloadScenario)
+    do.add_argument('-segments', metavar='#number', default=DOWNLOAD_SEGMENTS_DEFAULT, help=HELP_ARG_DOWNLOAD_SEGMENTS,
+                    type=valid_download_segments)
+    do.add_argument('-wbuf', '--write-buffer-size', metavar='#kilobytes', default=WRITE_BUFFER_SIZE_DEFAULT, help=HELP_ARG_WRITE_BUFFER_SIZE,
+                    type=valid_write_buffer_size)
+    do.add_argument('--scan-cache', action=ACTION_STORE_TRUE, help=HELP_ARG_SCAN_CACHE)
+    do.add_argument('--scan-cache-ttl', metavar='#minutes', default=SCAN_CACHE_TTL_DEFAULT, help=HELP_ARG_SCAN_CACHE_TTL,
+                    type=positive_nonzero_int)
     doex = par.add_argument_group(title='extra download options')
     doex.add_argument('-tdump', '--dump-tags', action=ACTION_STORE_TRUE, help='')
     doex.add_argument('-ddump', '--dump-descriptions', action=ACTION_STORE_TRUE, help='')
@@ -291,6 +351,9 @@ def add_common_args(par: ArgumentParser) -> None:
     doex.add_argument('-dmerge', '--merge-lists', action=ACTION_STORE_TRUE, help=HELP_ARG_MERGE_LISTS)
     doex.add_argument('-dnoempty', '--skip-empty-lists', action=ACTION_STORE_TRUE, help=HELP_ARG_SKIP_EMPTY_LISTS)
     doex.add_argument('-sdump', '--dump-screenshots', action=ACTION_STORE_TRUE, help=HELP_ARG_DUMP_SCREENSHOTS)
+    mo = par.add_argument_group(title='metrics options')
+    mo.add_argument('--metrics-file', metavar='#filepath', default=None, help=HELP_ARG_METRICS_FILE, type=valid_filepath_new)
+    mo.add_argument('--metrics-port', metavar='#port', default=0, help=HELP_ARG_METRICS_PORT, type=valid_port)
     dofi = par.add_argument_group(title='filtering options')
     dofi.add_argument(dest='extra_tags', nargs=ZERO_OR_MORE, action=ACTION_EXTEND, help=HELP_ARG_EXTRA_TAGS)
     dofi.add_argument('-duration', metavar='#min-max', default=valid_duration(''), help=HELP_ARG_DURATION, type=valid_duration)
@@ -366,6 +429,9 @@ def parse_arglist(args: Sequence[str]) -> Namespace:
     pcpg1.add_argument('-stop_id', metavar='#number', default=1, help='', type=positive_nonzero_int)
     pcpg1.add_argument('-begin_id', metavar='#number', default=10**9, help=HELP_ARG_BEGIN_STOP_ID, type=positive_nonzero_int)
     pcpg1.add_argument('-pall', '--scan-all-pages', action=ACTION_STORE_TRUE, help=HELP_ARG_ALL_PAGES)
+    pcpg1.add_argument('-prefetch', '--page-prefetch', metavar='#number', default=PAGE_PREFETCH_DEFAULT, help=HELP_ARG_PAGE_PREFETCH,
+                       type=valid_page_prefetch)
+    pcpg1.add_argument('-stream', '--stream-pages', action=ACTION_STORE_TRUE, help=HELP_ARG_STREAM_PAGES)
     pcpgm2 = pcpg1.add_mutually_exclusive_group()
     pcpgm2.add_argument('-playlist_id', metavar='#number', default=(0, ''), help='', type=valid_playlist_id)
     pcpgm2.add_argument('-playlist_name', metavar='#name', default=(0, ''), help=HELP_ARG_PLAYLIST, type=valid_playlist_name)
@@ -7,20 +7,29 @@ Author: trickerer (https://github.com/trickerer, https://github.com/trickerer01)
 #
 
 from .defs import (
+    CONNECT_KEEPALIVE_TIMEOUT_DEFAULT,
+    CONNECT_REQUEST_BURST_DEFAULT,
     CONNECT_RETRIES_BASE,
     DEFAULT_QUALITY,
     DOWNLOAD_MODE_DEFAULT,
     DOWNLOAD_POLICY_DEFAULT,
+    DOWNLOAD_SEGMENTS_DEFAULT,
     IDGAP_PREDICTION_DEFAULT,
     LOGGING_FLAGS,
     MAX_DEST_SCAN_SUB_DEPTH_DEFAULT,
     MAX_DEST_SCAN_UPLEVELS_DEFAULT,
+    MAX_SCAN_QUEUE_SIZE,
     NAMING_FLAGS_DEFAULT,
+    PAGE_PREFETCH_DEFAULT,
+    SCAN_CACHE_TTL_DEFAULT,
+    SITE,
+    WRITE_BUFFER_SIZE_DEFAULT,
 )
 
 if False is True:  # for hinting only
     from aiohttp import ClientTimeout  # noqa: I001
     from defs import Duration, Quality
+    from idplan import IdPlan
     from scenario import DownloadScenario
 
 __all__ = ('Config',)
@@ -49,6 +58,8 @@ class BaseConfig:
         'begin_id': 'end_id',
         'header': 'extra_headers',
         'cookie': 'extra_cookies',
+        'segments': 'download_segments',
+        'wbuf': 'write_buffer_size',
     }
 
     def __init__(self) -> None:
@@ -70,6 +81,9 @@ class BaseConfig:
         self.untagged_policy: str | None = None
         self.folder_scan_depth: int = 0
         self.folder_scan_levelup: int = 0
+        self.dest_scan_cache: bool | None = None
+        self.metrics_file: str | None = None
+        self.metrics_port: int = 0
         self.download_mode: str | None = None
         self.continue_mode: bool | None = None
         self.keep_unfinished: bool | None = None
@@ -80,8 +94,12 @@ class BaseConfig:
         self.merge_lists: bool | None = None
         self.skip_empty_lists: bool | None = None
         self.save_screenshots: bool | None = None
+        self.download_segments: int = DOWNLOAD_SEGMENTS_DEFAULT
+        self.write_buffer_size: int = WRITE_BUFFER_SIZE_DEFAULT
+        self.scan_cache: bool | None = None
+        self.scan_cache_ttl: int = SCAN_CACHE_TTL_DEFAULT
         self.extra_tags: list[str] | None = None
-        self.id_sequence: list[int] | None = None
+        self.id_sequence: IdPlan | None = None
         self.scenario: DownloadScenario | None = None
         self.naming_flags: int = 0
         self.logging_flags: int = 0
@@ -92,9 +110,18 @@ class BaseConfig:
         self.end_id: int = 0
         self.timeout: ClientTimeout | None = None
         self.retries: int = 0
+        self.scan_tasks: int = MAX_SCAN_QUEUE_SIZE
+        self.parse_processes: int = 0
+        self.html_connections: int = 0
+        self.media_connections: int = 0
+        self.connections_per_host: int = 0
+        self.keepalive_timeout: int = CONNECT_KEEPALIVE_TIMEOUT_DEFAULT
+        self.request_rate: float = 0.0
+        self.request_burst: int = CONNECT_REQUEST_BURST_DEFAULT
         self.throttle: int | None = None
         self.throttle_auto: bool | None = None
         self.store_continue_cmdfile: bool | None = None
+        self.journal_file: str | None = None
         self.solve_tag_conflicts: bool | None = None
         self.report_duplicates: bool | None = None
         self.check_uploader: bool | None = None
@@ -107,6 +134,8 @@ class BaseConfig:
         self.extra_cookies: list[tuple[str, str]] | None = None
         # module-specific params (pages only or ids only)
         self.scan_all_pages: bool | None = None
+        self.page_prefetch: int = PAGE_PREFETCH_DEFAULT
+        self.stream_pages: bool | None = None
         self.use_id_sequence: bool | None = None
         self.use_link_sequence: bool | None = None
         self.lookahead: int | None = None
@@ -131,6 +160,8 @@ class BaseConfig:
         # extras (can't be set through cmdline arguments)
         self.nodelay: bool = False
         self.detect_id_gaps: bool = False
+        self.site_base_url: str = SITE
+        '''requests to site are sent here instead (local stub site, see bench)'''
 
     def make_continue_arguments(self) -> list[str | int | None]:
         arglist = [
@@ -153,6 +184,8 @@ class BaseConfig:
             *(('-dmode', self.download_mode) if self.download_mode != DOWNLOAD_MODE_DEFAULT else ()),
             *(('-fsdepth', self.folder_scan_depth) if self.folder_scan_depth != MAX_DEST_SCAN_SUB_DEPTH_DEFAULT else ()),
             *(('-fslevel', self.folder_scan_levelup) if self.folder_scan_levelup != MAX_DEST_SCAN_UPLEVELS_DEFAULT else ()),
+            *(('--dest-scan-cache',) if self.dest_scan_cache else ()),
+            *(('-journal', self.journal_file) if self.journal_file else ()),
             *(('-proxy', self.proxy) if self.proxy else ()),
             *(('--download-without-proxy',) if self.download_without_proxy else ()),
             *(('--html-without-proxy',) if self.html_without_proxy else ()),
@@ -160,6 +193,14 @@ class BaseConfig:
             *(('-athrottle',) if self.throttle_auto else ()),
             *(('-timeout', int(self.timeout.connect)) if self.timeout and self.timeout.connect else ()),
             *(('-retries', self.retries) if self.retries != CONNECT_RETRIES_BASE else ()),
+            *(('-scantasks', self.scan_tasks) if self.scan_tasks != MAX_SCAN_QUEUE_SIZE else ()),
+            *(('-parseproc', self.parse_processes) if self.parse_processes else ()),
+            *(('-htmlconns', self.html_connections) if self.html_connections else ()),
+            *(('-mediaconns', self.media_connections) if self.media_connections else ()),
+            *(('-hostconns', self.connections_per_host) if self.connections_per_host else ()),
+            *(('-keepalive', self.keepalive_timeout) if self.keepalive_timeout != CONNECT_KEEPALIVE_TIMEOUT_DEFAULT else ()),
+            *(('-reqrate', self.request_rate) if self.request_rate else ()),
+            *(('-reqburst', self.request_burst) if self.request_burst != CONNECT_REQUEST_BURST_DEFAULT else ()),
             *(('-unfinish',) if self.keep_unfinished else ()),
             *(('-tdump',) if self.save_tags else ()),
             *(('-ddump',) if self.save_descriptions else ()),
@@ -169,6 +210,10 @@ class BaseConfig:
             *(('-sdump',) if self.save_screenshots else ()),
             # *(('-previews',) if self.include_previews else ()),
             *(('-nomove',) if self.no_rename_move else ()),
+            *(('-segments', self.download_segments) if self.download_segments != DOWNLOAD_SEGMENTS_DEFAULT else ()),
+            *(('-wbuf', self.write_buffer_size) if self.write_buffer_size != WRITE_BUFFER_SIZE_DEFAULT else ()),
+            *(('--scan-cache',) if self.scan_cache else ()),
+            *(('--scan-cache-ttl', self.scan_cache_ttl) if self.scan_cache_ttl != SCAN_CACHE_TTL_DEFAULT else ()),
             *(('-session_id', self.session_id) if self.session_id else ()),
             *self.extra_tags,
             *(('-script', self.scenario.fmt_str) if self.scenario else ()),
@@ -19,13 +19,37 @@ CONNECT_RETRIES_BASE = 50
 CONNECT_TIMEOUT_BASE = 10
 CONNECT_TIMEOUT_SOCKET_READ = 30
 CONNECT_REQUEST_DELAY = 0.7
+CONNECT_REQUEST_DELAY_SPREAD = 0.75
+CONNECT_REQUEST_BURST_DEFAULT = 1
+CONNECT_REQUEST_BURST_MAX = 20
+CONNECT_REQUEST_RATE_MAX = 50.0
 CONNECT_RETRY_DELAY = (4.0, 8.0)
+CONNECT_POOL_SIZE_MAX = 64
+CONNECT_KEEPALIVE_TIMEOUT_DEFAULT = 15  # seconds
+CONNECT_KEEPALIVE_TIMEOUT_MAX = 300  # seconds
+CONNECT_DNS_CACHE_TTL = 300  # seconds
 
 MAX_DEST_SCAN_SUB_DEPTH_DEFAULT = 1
 MAX_DEST_SCAN_UPLEVELS_DEFAULT = 0
+MAX_DEST_SCAN_THREADS = 8
+FS_THREADS_MAX = 4
+DEST_SCAN_CACHE_RACY_TIME = 2  # seconds
 MAX_VIDEOS_QUEUE_SIZE = 8
 MAX_SCAN_QUEUE_SIZE = 1
-DOWNLOAD_STATUS_CHECK_TIMER = 60
+MAX_SCAN_QUEUE_SIZE_LIMIT = 10
+PAGE_PREFETCH_DEFAULT = 0
+PAGE_PREFETCH_MAX = 8
+PARSE_PROCESSES_MAX = 8
+THROTTLE_CHECK_INTERVAL = 5  # seconds
+THROTTLE_CHECK_WINDOW = 30  # seconds
+DOWNLOAD_SEGMENTS_DEFAULT = 1
+DOWNLOAD_SEGMENTS_MAX = 8
+DOWNLOAD_SEGMENT_SIZE_MIN = 4  # MB
+DOWNLOAD_SEGMENT_SAVE_STEP = 8  # MB
+WRITE_BUFFER_SIZE_DEFAULT = 1024  # KB
+WRITE_BUFFER_SIZE_MIN = 64  # KB
+WRITE_BUFFER_SIZE_MAX = 65536  # KB
+WRITE_ALIGNMENT = 4096
 DOWNLOAD_QUEUE_STALL_CHECK_TIMER = 30
 DOWNLOAD_CONTINUE_FILE_CHECK_TIMER = 30
 SCAN_CANCEL_KEYSTROKE = 'q'
@@ -33,11 +57,19 @@ SCAN_CANCEL_KEYCOUNT = 2
 LOOKAHEAD_WATCH_RESCAN_DELAY_MIN = 300
 LOOKAHEAD_WATCH_RESCAN_DELAY_MAX = 1800
 RESCAN_DELAY_EMPTY = 1
+SCAN_CACHE_TTL_DEFAULT = 1440  # 1 day (in minutes)
+SCAN_CACHE_COMMIT_INTERVAL = 50
+JOURNAL_SYNC_INTERVAL = 50
+METRICS_DUMP_INTERVAL = 60
+METRICS_LOOP_LAG_INTERVAL = 0.25
+METRICS_TIME_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+METRICS_SPEED_BUCKETS = tuple(float(kb * 1024) for kb in (16, 64, 128, 256, 512, 1024, 2048, 4096, 8192, 16384))
 PREDICTION_REENABLE_THRESHOLD = 3
 VOTE_TO_REMOVAL_THRESHOLD = -9
 
 DURATION_MAX = 36000  # 10 hours (in seconds)
 SCREENSHOTS_COUNT = 10
+SCREENSHOTS_TASKS_MAX = 4
 FULLPATH_MAX_BASE_LEN = 240
 
 PREFIX = 'rv_'
@@ -251,10 +283,11 @@ HELP_ARG_PREDICT_ID_GAPS = (
 )
 HELP_ARG_IDSEQUENCE = (
     'Use video id sequence instead of id range. This disables start / count / end id parametes and expects an id sequence among extra tags.'
-    ' Sequence structure: (id=<id1>~id=<id2>~id=<id3>~...~id=<idN>)'
+    ' Sequence structure: (id=<id1>~id=<id2>~id=<id3>~...~id=<idN>). Ids are processed in ascending order, duplicates are ignored'
 )
 HELP_ARG_LINKSEQUENCE = (
-    'Use links instead of id range. This disables start / count / end id parametes and expects at least one link among extra tags'
+    'Use links instead of id range. This disables start / count / end id parametes and expects at least one link among extra tags.'
+    ' Linked videos are processed in ascending id order, duplicates are ignored'
 )
 HELP_ARG_PATH = 'Download destination. Default is current folder'
 HELP_ARG_FSDEPTH = (
@@ -264,6 +297,10 @@ HELP_ARG_FSDEPTH = (
 HELP_ARG_FSLEVELUP = (
     'Folder levels to go up before scanning for existing files, increases scan depth. Destination folder is always checked'
 )
+HELP_ARG_DEST_SCAN_CACHE = (
+    'Store destination folders listing in a manifest file inside base destination folder.'
+    ' Subfolders not modified since previous run are not listed again'
+)
 HELP_ARG_SESSION_ID = (
     '\'PHPSESSID\' cookie. Some tags are hidden and cannot be searched for without logging in.'
     ' Using this cookie from logged in account resolves that problem (tag/artist/category blacklists still apply)'
@@ -304,6 +341,14 @@ HELP_ARG_UTPOLICY = (
 )
 HELP_ARG_DMMODE = '[Debug] Download (file creation) mode'
 HELP_ARG_ALL_PAGES = 'Do not interrupt pages scan if encountered a page having all post ids filtered out'
+HELP_ARG_STREAM_PAGES = (
+    'Start scanning / downloading videos as soon as the first page is parsed instead of waiting for all pages to be read.'
+    ' Pages newest to oldest, videos within each page oldest to newest'
+)
+HELP_ARG_PAGE_PREFETCH = (
+    f'Once pages count is known, fetch up to this many next pages (0-{PAGE_PREFETCH_MAX:d}) in advance while current page is being processed.'
+    f' Pages are still processed in order. Default is \'{PAGE_PREFETCH_DEFAULT:d}\' (disabled)'
+)
 HELP_ARG_EXTRA_TAGS = (
     'All remaining \'args\' and \'-args\' count as tags to require or exclude. All spaces must be replaced with \'_\'.'
     ' Videos containing any of \'-tags\', or not containing all \'tags\' will be skipped.'
@@ -320,6 +365,11 @@ HELP_ARG_DWN_SCENARIO = (
     ' \'python ids.py -path ... -start ... -end ... --download-scenario'
     ' "1g: 1girl -quality 480p; 2g: 2girls -quality 720p -minscore 150 -utp always"\''
 )
+HELP_ARG_JOURNAL_FILE = (
+    'Append items state transitions (scanned link, quality, file name, subfolder, scan / download results) to this JSON-lines journal.'
+    ' If the file already exists it is replayed first: finished items are skipped and already scanned items are downloaded'
+    ' without scanning them again. Stored continue file always uses a journal. Journal is deleted once the run completes'
+)
 HELP_ARG_STORE_CONTINUE_CMDFILE = (
     'Store and automatically update cmd file which allows to later continue with unfinished download queue'
     ' (using ids module, file mode, check README for more info)'
@@ -369,7 +419,7 @@ HELP_ARG_LOGGING = (
 HELP_ARG_NOCOLORS = 'Disable logging level dependent colors in log'
 HELP_ARG_HEADER = 'Append additional header. Example: \'-header user_agent=googlebot/1.1\'. Can be used multiple times'
 HELP_ARG_COOKIE = 'Append additional cookie. Example: \'-cookie shm_user=user1\'. Can be used multiple times'
-HELP_ARG_DUMP_SCREENSHOTS = 'Save timeline screenshots (webp, very slow, ignores download mode)'
+HELP_ARG_DUMP_SCREENSHOTS = f'Save timeline screenshots (webp, {SCREENSHOTS_TASKS_MAX:d} at a time alongside videos, ignores download mode)'
 HELP_ARG_DUMP_INFO = 'Save tags / descriptions / comments to text file (separately)'
 HELP_ARG_SKIP_EMPTY_LISTS = 'Do not store tags / descriptions / comments list if it contains no useful data'
 HELP_ARG_MERGE_LISTS = 'Merge exising tags / descriptions / comments list(s) with saved info (only if saving is enabled)'
@@ -378,8 +428,61 @@ HELP_ARG_UNFINISH = 'Do not clean up unfinished files on interrupt'
 HELP_ARG_NOMOVE = 'In continue mode instead of moving already existing file to destination folder download to its original location'
 HELP_ARG_TIMEOUT = f'Connection timeout (in seconds). Default is \'{CONNECT_TIMEOUT_BASE:d}\''
 HELP_ARG_RETRIES = f'Connection retries count. Default is \'{CONNECT_RETRIES_BASE:d}\''
-HELP_ARG_THROTTLE = 'Download speed threshold (in KB/s) to assume throttling, drop connection and retry'
+HELP_ARG_THROTTLE = (
+    'Download speed threshold (in KB/s) to assume throttling, drop connection and retry.'
+    f' Speed is averaged over last {THROTTLE_CHECK_WINDOW:d} seconds of download'
+)
 HELP_ARG_THROTTLE_AUTO = 'Enable automatic throttle threshold adjustment when crossed too many times in a row'
+HELP_ARG_REQUEST_RATE = (
+    f'Maximum requests per second for each host, up to {CONNECT_REQUEST_RATE_MAX:.0f}.'
+    f' Default is one request every {CONNECT_REQUEST_DELAY:.2f}-{CONNECT_REQUEST_DELAY + CONNECT_REQUEST_DELAY_SPREAD:.2f} seconds'
+)
+HELP_ARG_REQUEST_BURST = (
+    f'Number of requests to each host allowed to be sent at once before rate limit kicks in, 1-{CONNECT_REQUEST_BURST_MAX:d}.'
+    f' Default is \'{CONNECT_REQUEST_BURST_DEFAULT:d}\''
+)
+HELP_ARG_HTML_CONNECTIONS = (
+    f'Maximum number of simultaneous connections for html pages and other small requests, 0-{CONNECT_POOL_SIZE_MAX:d}.'
+    ' Default is \'0\' (enough for scan tasks and page prefetch)'
+)
+HELP_ARG_MEDIA_CONNECTIONS = (
+    f'Maximum number of simultaneous connections for video downloads, 0-{CONNECT_POOL_SIZE_MAX:d}.'
+    ' Default is \'0\' (enough for all active downloads and their segments)'
+)
+HELP_ARG_CONNECTIONS_PER_HOST = (
+    f'Maximum number of simultaneous connections to a single host within each connection pool, 0-{CONNECT_POOL_SIZE_MAX:d}.'
+    ' Default is \'0\' (no limit)'
+)
+HELP_ARG_KEEPALIVE_TIMEOUT = (
+    f'Time (in seconds) to keep idle connections open for reuse, 0-{CONNECT_KEEPALIVE_TIMEOUT_MAX:d}.'
+    f' Default is \'{CONNECT_KEEPALIVE_TIMEOUT_DEFAULT:d}\''
+)
+HELP_ARG_SCAN_TASKS = (
+    f'Number of videos to scan concurrently, 1-{MAX_SCAN_QUEUE_SIZE_LIMIT:d}. Scan results are still processed in queue order.'
+    f' Default is \'{MAX_SCAN_QUEUE_SIZE:d}\''
+)
+HELP_ARG_PARSE_PROCESSES = (
+    f'Number of worker processes to parse html pages in, 0-{PARSE_PROCESSES_MAX:d}. Keeps the app responsive when'
+    f' scanning many pages concurrently at the cost of extra memory and process startup time. Default is \'0\' (parse in main thread)'
+)
+HELP_ARG_DOWNLOAD_SEGMENTS = (
+    f'Split each video file into up to this many parts (1-{DOWNLOAD_SEGMENTS_MAX:d}) and download them simultaneously.'
+    f' Only files larger than {DOWNLOAD_SEGMENT_SIZE_MIN:d} MB are split. Default is \'{DOWNLOAD_SEGMENTS_DEFAULT:d}\' (disabled)'
+)
+HELP_ARG_WRITE_BUFFER_SIZE = (
+    f'Size of each of two write buffers per downloaded file, in kilobytes ({WRITE_BUFFER_SIZE_MIN:d}-{WRITE_BUFFER_SIZE_MAX:d}).'
+    f' Downloaded data is collected and written to disk in blocks of this size. Default is \'{WRITE_BUFFER_SIZE_DEFAULT:d}\''
+)
+HELP_ARG_METRICS_FILE = (
+    f'Record pipeline metrics (request rate limiter wait, html fetch / parse, filtering, time to first byte, download speed, retries)'
+    f' and append them to this JSON-lines file every {METRICS_DUMP_INTERVAL:d} seconds and at exit'
+)
+HELP_ARG_METRICS_PORT = 'Record pipeline metrics and serve them in Prometheus text format at http://127.0.0.1:<PORT>/metrics'
+HELP_ARG_SCAN_CACHE = (
+    f'Store scanned video info in \'{PREFIX}!scancache.db\' file inside base download destination folder and reuse it instead'
+    f' of fetching video pages again while it is fresh enough (see \'--scan-cache-ttl\')'
+)
+HELP_ARG_SCAN_CACHE_TTL = f'Scan cache entry lifetime (in minutes). Default is \'{SCAN_CACHE_TTL_DEFAULT:d}\''
 HELP_ARG_FAVORITES = 'User id (integer, filters still apply)'
 HELP_ARG_UPLOADER = 'Uploader user id (integer, filters still apply)'
 HELP_ARG_MODEL = 'Artist name (scan artist\'s page(s) instead of using search, filters still apply)'
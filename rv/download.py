@@ -11,22 +11,24 @@ import pathlib
 import random
 import sys
 import urllib.parse
-from asyncio import Task, as_completed, get_running_loop, sleep
+from asyncio import as_completed, sleep
+from collections.abc import AsyncIterator
+from contextlib import nullcontext
 
-from aiofile import async_open
-from aiohttp import ClientConnectorError, ClientPayloadError
+from aiohttp import ClientConnectorError, ClientPayloadError, ClientResponse
 
+from . import afs
 from .config import Config
 from .defs import (
     CONNECT_RETRY_DELAY,
+    DEFAULT_EXT,
     DOWNLOAD_MODE_SKIP,
     DOWNLOAD_MODE_TOUCH,
     DOWNLOAD_POLICY_ALWAYS,
+    DOWNLOAD_SEGMENT_SIZE_MIN,
     FULLPATH_MAX_BASE_LEN,
     PREFIX,
     SCAN_CANCEL_KEYSTROKE,
-    SCREENSHOTS_COUNT,
-    SITE,
     SITE_AJAX_REQUEST_VIDEO,
     TAGS_CONCAT_CHAR,
     DownloadResult,
@@ -36,13 +38,22 @@ from .defs import (
 )
 from .downloader import VideoDownloadWorker
 from .dscanner import VideoScanWorker
+from .dsegments import DownloadSegments, download_segments
 from .dthrottler import ThrottleChecker
-from .fetch_html import ensure_conn_closed, fetch_html, wrap_request
+from .extract import extract_video_page
+from .fetch_html import ClientSessionWrapper, ensure_conn_closed, fetch_page, wrap_request
+from .fwriter import FileWriter
 from .idgaps import IdGapsPredictor
-from .iinfo import VideoInfo, export_video_info, get_min_max_ids
+from .idplan import IdPlan
+from .iinfo import VideoInfo, get_min_max_ids
+from .infolist import InfoListWriter, export_video_info
+from .journal import JobJournal
 from .logger import Log
+from .metrics import Metrics
 from .path_util import file_already_exists, is_file_being_used, register_new_file, try_rename, unregister_unfinished_file
-from .rex import re_media_filename, re_time
+from .rex import re_media_filename
+from .scan_cache import ScanCache
+from .screenshots import ScreenshotWorker
 from .tagger import filtered_tags, is_filtered_out_by_extra_tags, solve_tag_conflicts
 from .util import calculate_eta, extract_ext, format_time, get_elapsed_time_i, get_time_seconds, has_naming_flag, normalize_path
 from .voting import filter_act_by_votes_count
@@ -50,22 +61,73 @@ from .voting import filter_act_by_votes_count
 __all__ = ('at_interrupt', 'download')
 
 
-async def download(sequence: list[VideoInfo], by_id: bool, filtered_count: int) -> None:
-    minid, maxid = get_min_max_ids(sequence)
-    eta_min = calculate_eta(sequence)
+async def feed_workers(feed: AsyncIterator[tuple[list[VideoInfo], int]], scn: VideoScanWorker | None, dwn: VideoDownloadWorker,
+                       sequence: list[VideoInfo]) -> None:
+    try:
+        async for entries, filtered_count in feed:
+            if Config.aborted:
+                break
+            Log.debug(f'[queue] adding {len(entries):d} ids (+{filtered_count:d} filtered out)')
+            if scn:
+                scn.extend(entries)
+            else:
+                sequence.extend(entries)
+            dwn.extend(entries, filtered_count)
+    finally:
+        if scn:
+            scn.close_input()
+        dwn.close_input()
+
+
+async def download(sequence: list[VideoInfo], by_id: bool, filtered_count: int,
+                   feed: AsyncIterator[tuple[list[VideoInfo], int]] | None = None, plan: IdPlan | None = None) -> None:
+    """
+    Scans and downloads **sequence**. If **feed** is provided more items are taken from it
+    while already working (entries list + prefiltered count at a time), until it is exhausted.
+    If **plan** is provided, scanner takes items from planned ids lazily, existing items are filtered out along the way
+    """
     interrupt_msg = f'\nPress \'{SCAN_CANCEL_KEYSTROKE}\' twice to stop' if by_id else ''
-    Log.info(f'\nOk! {len(sequence):d} ids (+{filtered_count:d} filtered out), bound {minid:d} to {maxid:d}.'
-             f' Working...{interrupt_msg}\n'
-             f'\nThis will take at least {eta_min:d} seconds{f" ({format_time(eta_min)})" if eta_min >= 60 else ""}!\n')
-    with (VideoScanWorker(sequence, scan_video) as scn, VideoDownloadWorker(sequence, process_video, filtered_count) as dwn):
-        for cv in as_completed([scn.run(), dwn.run()] if by_id else [dwn.run()]):
+    if feed is None:
+        queued = sequence if plan is None else plan
+        minid, maxid = get_min_max_ids(sequence) if plan is None else (plan.min_id, plan.max_id)
+        eta_min = calculate_eta(queued)
+        Log.info(f'\nOk! {len(queued):d} ids{f" (+{filtered_count:d} filtered out)" if plan is None else ""}, bound {minid:d} to {maxid:d}.'
+                 f' Working...{interrupt_msg}\n'
+                 f'\nThis will take at least {eta_min:d} seconds{f" ({format_time(eta_min)})" if eta_min >= 60 else ""}!\n')
+    else:
+        Log.info(f'\nOk! Ids will be queued as they are found. Working...{interrupt_msg}\n')
+    # downloader only takes items from scanner if it exists so only create one if it's going to run
+    with (VideoScanWorker(sequence, scan_video, plan, skip_predicted_gap) if by_id else nullcontext() as scn,
+          ScreenshotWorker() if Config.save_screenshots else nullcontext() as scr,
+          VideoDownloadWorker(sequence, process_video, filtered_count) as dwn,
+          ScanCache(ScanCache.file_path(), Config.scan_cache_ttl) if Config.scan_cache and by_id else nullcontext(),
+          JobJournal(JobJournal.file_path()) if by_id and (Config.journal_file or Config.store_continue_cmdfile) else nullcontext(),
+          InfoListWriter() if Config.save_tags or Config.save_descriptions or Config.save_comments else nullcontext()):
+        if feed is not None:
+            if scn:
+                scn.open_input()
+            dwn.open_input()
+        for cv in as_completed([*((scn.run(), dwn.run()) if scn else (dwn.run(),)), *((scr.run(),) if scr else ()),
+                                *((feed_workers(feed, scn, dwn, sequence),) if feed is not None else ())]):
             await cv
-    export_video_info(sequence)
+        await export_video_info(scn.get_active_items() if scn else sequence)
+
+
+def skip_predicted_gap(id_: int) -> bool:
+    """Checks whether id gap predictor forces error 404 for **id_**, before or without making it a VideoInfo"""
+    gpred = IdGapsPredictor.get()
+    if predicted_prefix := gpred.need_skip(id_):
+        Log.warn(f'Id gap prediction {predicted_prefix} forces error 404 for {PREFIX}{id_:d}.{DEFAULT_EXT}, skipping...')
+        gpred.count_nonexisting()
+        return True
+    return False
 
 
-async def scan_video(vi: VideoInfo) -> DownloadResult:
+async def scan_video(vi: VideoInfo, *, rescan=False) -> DownloadResult:
+    """Scans video page and prepares item for download. **rescan** is for items which were already accounted for (see download_video())"""
     scn = VideoScanWorker.get()
     gpred = IdGapsPredictor.get()
+    scache = ScanCache.get()
     scenario = Config.scenario
     sname = vi.sname
     extra_ids: list[int] = scn.get_extra_ids() if scn else []
@@ -73,39 +135,43 @@ async def scan_video(vi: VideoInfo) -> DownloadResult:
     rating = vi.rating
     score = ''
 
-    if predicted_prefix := gpred.need_skip(vi):
-        Log.warn(f'Id gap prediction {predicted_prefix} forces error 404 for {sname}, skipping...')
-        gpred.count_nonexisting()
+    if not rescan and skip_predicted_gap(vi.id):
         return DownloadResult.FAIL_NOT_FOUND
 
     vi.set_state(VideoInfo.State.SCANNING)
-    a_html = await fetch_html(f'{SITE_AJAX_REQUEST_VIDEO % vi.id}?popup_id={2 + vi.id % 10:d}')
-    if a_html is None:
-        Log.error(f'Error: unable to retreive html for {sname}! Aborted!')
-        gpred.count_nonexisting()
-        return DownloadResult.FAIL_SKIPPED if Config.aborted else DownloadResult.FAIL_RETRIES
+    with_comments = Config.save_descriptions or Config.save_comments or Config.check_description_pos or Config.check_description_neg
+    page = await afs.call(scache.load, vi.id, with_comments, op='scan_cache') if scache and not rescan else None
+    if page is not None:
+        Log.trace(f'{sname}: using cached scan info')
+        vi.set_flag(VideoInfo.Flags.CACHED)
+    else:
+        page = await fetch_page(f'{SITE_AJAX_REQUEST_VIDEO % vi.id}?popup_id={2 + vi.id % 10:d}', extract_video_page,
+                                with_comments=with_comments)
+        if page is None:
+            Log.error(f'Got empty HTML page for {sname}! Rescanning...')
+            return DownloadResult.FAIL_EMPTY_HTML
 
-    if not len(a_html):
-        Log.error(f'Got empty HTML page for {sname}! Rescanning...')
-        return DownloadResult.FAIL_EMPTY_HTML
+        if scache and page.links is not None:
+            await afs.call(scache.store, vi.id, page, with_comments, op='scan_cache')
 
-    if a_html.find('title', string=lambda x: 'Maintenance' in x):
+    if page.is_maintenance:
         Log.error(f'Got maintenance page for {sname}! Rescanning...')
         return DownloadResult.FAIL_EMPTY_HTML
 
-    if a_html.find('title', string='404 Not Found'):
+    if page.is_404:
         Log.error(f'Got error 404 for {sname}, skipping...')
-        gpred.count_nonexisting()
+        if not rescan:
+            gpred.count_nonexisting()
         return DownloadResult.FAIL_NOT_FOUND
 
-    gpred.count_existing(vi)
+    if not rescan:
+        gpred.count_existing(vi)
 
     if not vi.title:
-        titleh1 = a_html.find('h1', class_='title_video')
-        vi.title = titleh1.text if titleh1 else ''
+        vi.title = page.title
     if not vi.duration:
         try:
-            vi.duration = get_time_seconds(str(a_html.find('div', class_='info row').find('span', string=re_time).text))
+            vi.duration = get_time_seconds(page.duration)
         except Exception:
             Log.error(f'Unable to extract duration for {sname}!')
             vi.duration = 0
@@ -113,7 +179,7 @@ async def scan_video(vi: VideoInfo) -> DownloadResult:
     Log.info(f'Scanning {sname}: {vi.fduration} \'{vi.title}\'')
 
     try:
-        rating, votes = tuple(a_html.find('span', class_='voters count').text.split(' ', 1))
+        rating, votes = tuple(page.voters.split(' ', 1))
         votes = votes[1:-1].replace(',', '')
         rating = rating.replace('%', '')
         dislikes_int = int(votes) * (100 - (int(rating) or 100)) // 100
@@ -121,24 +187,21 @@ async def scan_video(vi: VideoInfo) -> DownloadResult:
         score = f'{likes_int - dislikes_int:d}'
     except Exception:
         Log.warn(f'Warning: cannot extract score for {sname}.')
-    try:
-        arts = [str(a.string).lower() for a in a_html.find('div', string='Artist').parent.find_all('span', class_='name')]
-    except Exception:
+    arts = page.arts
+    if arts is None:
         Log.warn(f'Warning: cannot extract authors for {sname}.')
         arts: list[str] = []
-    try:
-        cats = [str(c.string).lower() for c in a_html.find('div', string='Categories').parent.find_all('span', class_=False)]
-    except Exception:
+    cats = page.cats
+    if cats is None:
         Log.warn(f'Warning: cannot extract categories for {sname}.')
         cats: list[str] = []
-    try:
-        vi.uploader = str(a_html.find('div', string='Uploaded by').parent.find('a').get_text(strip=True)).lower()
-    except Exception:
+    if page.uploader is not None:
+        vi.uploader = page.uploader
+    else:
         Log.warn(f'Warning: cannot extract uploader for {sname}.')
-    tdiv = a_html.find('div', string='Tags')
-    if tdiv is None:
+    if page.tags is None:
         Log.info(f'Warning: video {sname} has no tags!')
-    tags: list[str] = [str(elem.string) for elem in tdiv.parent.find_all('a', class_='tag_item')] if tdiv else []
+    tags: list[str] = page.tags or []
     arts_raw, cats_raw, tags_raw = tuple([_.replace(' ', '_').lower() for _ in actlist] for actlist in (arts, cats, tags))
     if Config.check_votes:
         await filter_act_by_votes_count(vi, sname, arts_raw, cats_raw, tags_raw)
@@ -148,21 +211,16 @@ async def scan_video(vi: VideoInfo) -> DownloadResult:
                 tags_raw.append(add_tag)
     if Config.save_tags:
         vi.tags = ' '.join(sorted(tags_raw))
-    if Config.save_descriptions or Config.save_comments or Config.check_description_pos or Config.check_description_neg:
-        cidivs = a_html.find_all('div', class_='comment-info')
-        cudivs = [cidiv.find('a') for cidiv in cidivs]
-        ctdivs = [cidiv.find('div', class_='coment-text') for cidiv in cidivs]
-        desc_em = a_html.find('em')  # exactly one
+    if with_comments:
+        comments = page.comments
         my_uploader = vi.uploader or 'unknown'
-        has_description = (cudivs[-1].text.lower() == my_uploader) if (cudivs and ctdivs) else False  # first comment by uploader
-        if cudivs and ctdivs:
-            assert len(ctdivs) == len(cudivs)
+        has_description = (comments[-1].first.lower() == my_uploader) if comments else False  # first comment by uploader
         if Config.save_descriptions or Config.check_description_pos or Config.check_description_neg:
-            desc_comment = (f'{cudivs[-1].text}:\n' + ctdivs[-1].get_text('\n').strip()) if has_description else ''
-            desc_base = (f'\n{my_uploader}:\n' + desc_em.get_text('\n') + '\n') if desc_em else ''
+            desc_comment = (f'{comments[-1].first}:\n' + comments[-1].second.strip()) if has_description else ''
+            desc_base = (f'\n{my_uploader}:\n' + page.description + '\n') if page.description is not None else ''
             vi.description = desc_base or (f'\n{desc_comment}\n' if desc_comment else '')
         if Config.save_comments:
-            comments_list = [f'{cudivs[i].text}:\n' + ctdivs[i].get_text('\n').strip() for i in range(len(ctdivs) - int(has_description))]
+            comments_list = [f'{cu}:\n' + ct.strip() for cu, ct in comments[:len(comments) - int(has_description)]]
             vi.comments = ('\n' + '\n\n'.join(comments_list) + '\n') if comments_list else ''
     if Config.check_uploader and vi.uploader and vi.uploader not in tags_raw:
         tags_raw.append(vi.uploader)
@@ -174,7 +232,9 @@ async def scan_video(vi: VideoInfo) -> DownloadResult:
     if Config.solve_tag_conflicts:
         solve_tag_conflicts(vi, tags_raw)
     Log.debug(f'{sname} tags: \'{",".join(tags_raw)}\'')
-    if is_filtered_out_by_extra_tags(vi, tags_raw, Config.extra_tags, Config.id_sequence, vi.subfolder, extra_ids):
+    with Metrics.timer('filter_seconds', kind='extra_tags'):
+        filtered_out = is_filtered_out_by_extra_tags(vi, tags_raw, Config.extra_tags, Config.id_sequence, vi.subfolder, extra_ids)
+    if filtered_out:
         Log.info(f'Info: video {sname} is filtered out by{" outer" if scenario else ""} extra tags, skipping...')
         return DownloadResult.FAIL_FILTERED_OUTER if scenario else DownloadResult.FAIL_SKIPPED
     for vsrs, csri, srn, pc in zip((score, rating), (Config.min_score, Config.min_rating), ('score', 'rating'), ('', '%'), strict=True):
@@ -186,42 +246,47 @@ async def scan_video(vi: VideoInfo) -> DownloadResult:
             except Exception:
                 pass
     if scenario:
-        if matching_sq := scenario.get_matching_subquery(vi, tags_raw, score, rating):
+        with Metrics.timer('filter_seconds', kind='scenario'):
+            matching_sq = scenario.get_matching_subquery(vi, tags_raw, score, rating)
+        if matching_sq:
             vi.subfolder = matching_sq.subfolder
             vi.quality = matching_sq.quality or vi.quality
-        elif utpalways_sq := scenario.get_utp_always_subquery() if tdiv is None else None:
+        elif utpalways_sq := scenario.get_utp_always_subquery() if page.tags is None else None:
             vi.subfolder = utpalways_sq.subfolder
             vi.quality = utpalways_sq.quality or vi.quality
         else:
             Log.info(f'Info: unable to find matching or utp scenario subquery for {sname}, skipping...')
             return DownloadResult.FAIL_SKIPPED
-    elif tdiv is None and len(Config.extra_tags) > 0 and Config.utp != DOWNLOAD_POLICY_ALWAYS:
+    elif page.tags is None and len(Config.extra_tags) > 0 and Config.utp != DOWNLOAD_POLICY_ALWAYS:
         Log.warn(f'Warning: could not extract tags from {sname}, skipping due to untagged videos download policy...')
         return DownloadResult.FAIL_SKIPPED
     if Config.duration and vi.duration and not (Config.duration.min <= vi.duration <= Config.duration.max):
         Log.info(f'Info: video {sname} duration \'{vi.duration:d}\' is out of bounds ({Config.duration!s}), skipping...')
         return DownloadResult.FAIL_SKIPPED
-    if scn.find_vinfo_pred(lambda _: _.id == vi.id and VideoInfo.State.DOWNLOAD_PENDING <= _.state <= VideoInfo.State.DONE):
+    if scn.has_id_in_states(vi.id, VideoInfo.State.DOWNLOAD_PENDING, VideoInfo.State.DOWNLOADING, VideoInfo.State.WRITING,
+                            VideoInfo.State.DONE):
         Log.info(f'{sname} was already processed, skipping...')
         return DownloadResult.FAIL_ALREADY_EXISTS
     my_tags = filtered_tags(sorted(tags_raw)) or my_tags
 
     tries = 0
     while True:
-        ddiv = a_html.find('div', string='Download')
-        if ddiv is not None and ddiv.parent is not None:
+        if page.links is not None:
             break
-        if message_span := a_html.find('span', class_='message'):
-            Log.warn(f'Cannot find download section for {sname}, reason: \'{message_span.text}\', skipping...')
+        if page.message is not None:
+            Log.warn(f'Cannot find download section for {sname}, reason: \'{page.message}\', skipping...')
             return DownloadResult.FAIL_DELETED
         elif tries >= 5:
             Log.error(f'Cannot find download section for {sname} after {tries:d} tries, failed!')
             return DownloadResult.FAIL_RETRIES
         tries += 1
         Log.debug(f'No download section for {sname}, retry #{tries:d}...')
-        a_html = await fetch_html(f'{SITE_AJAX_REQUEST_VIDEO % vi.id}?popup_id={2 + tries + vi.id % 10:d}')
-    links = ddiv.parent.find_all('a', class_='tag_item')
-    qualities = tuple(lin.text.replace('MP4 ', '').strip() for lin in links if lin.text)
+        page = await fetch_page(f'{SITE_AJAX_REQUEST_VIDEO % vi.id}?popup_id={2 + tries + vi.id % 10:d}', extract_video_page,
+                                with_comments=with_comments) or page
+        if scache and page.links is not None:
+            await afs.call(scache.store, vi.id, page, with_comments, op='scan_cache')
+    links = page.links
+    qualities = tuple(lin_text.replace('MP4 ', '').strip() for lin_text, _ in links if lin_text)
     if vi.quality not in qualities:
         q_idx = 0
         Log.warn(f'Warning: cannot find quality \'{vi.quality}\' for {sname}, selecting \'{qualities[q_idx]}\'')
@@ -229,7 +294,7 @@ async def scan_video(vi: VideoInfo) -> DownloadResult:
         link_idx = q_idx
     else:
         link_idx = qualities.index(vi.quality)
-    vi.link = links[link_idx].get('href')
+    vi.link = links[link_idx].second
 
     prefix = PREFIX if has_naming_flag(NamingFlags.PREFIX) else ''
     fname_part2 = extract_ext(vi.link)
@@ -267,53 +332,18 @@ async def process_video(vi: VideoInfo) -> DownloadResult:
     return res
 
 
-async def download_sceenshot(vi: VideoInfo, scr_num: int) -> DownloadResult:
-    sname = f'{PREFIX}{vi.id:d}_{scr_num:02d}.webp'
-    sfilename = f'{f"{vi.subfolder}/" if len(vi.subfolder) > 0 else ""}{PREFIX}{vi.id:d}/{scr_num:02d}.webp'
-    my_folder = f'{vi.my_folder}{PREFIX}{vi.id:d}/'
-    fullpath = f'{my_folder}{scr_num:02d}.webp'
-    my_link = f'{SITE}/contents/videos_screenshots/{vi.id - vi.id % 1000:d}/{vi.id:d}/336x189/{scr_num:d}.jpg'
-    ret = DownloadResult.SUCCESS
-
-    if not os.path.isdir(my_folder):
-        try:
-            os.makedirs(my_folder)
-        except Exception:
-            Log.fatal(f'ERROR: Unable to create subfolder \'{my_folder}\'!')
-            raise
-
-    try:
-        async with await wrap_request('GET', my_link) as r:
-            if r.status == 404:
-                Log.error(f'Got 404 for {sname}...!')
-                ret = DownloadResult.FAIL_NOT_FOUND
-            elif r.content_type and 'text' in r.content_type:
-                Log.error(f'File not found at {my_link}!')
-                ret = DownloadResult.FAIL_NOT_FOUND
-
-            expected_size = r.content_length
-            async with async_open(fullpath, 'wb') as outf:
-                async for chunk in r.content.iter_chunked(256 * Mem.KB):
-                    await outf.write(chunk)
-
-            file_size = os.stat(fullpath).st_size
-            if expected_size and file_size != expected_size:
-                Log.error(f'Error: file size mismatch for {sfilename}: {file_size:d} / {expected_size:d}')
-                ret = DownloadResult.FAIL_RETRIES
-    except Exception:
-        ret = DownloadResult.FAIL_NOT_FOUND
-
-    return ret
-
-
-async def download_sceenshots(vi: VideoInfo) -> DownloadResult:
-    ret = DownloadResult.SUCCESS
-    t: Task[DownloadResult]
-    for t in (get_running_loop().create_task(download_sceenshot(vi, scr_idx + 1)) for scr_idx in range(SCREENSHOTS_COUNT)):
-        res = await t
-        if res not in (DownloadResult.SUCCESS, ret):
-            ret = res
-    return ret
+async def request_media(vi: VideoInfo, headers: dict[str, str]) -> ClientResponse:
+    ckwargs = {'allow_redirects': not (Config.proxy and (Config.download_without_proxy or Config.html_without_proxy)),
+               'pool': ClientSessionWrapper.POOL_MEDIA}
+    ckwargs.update({'noproxy': bool(Config.proxy and Config.html_without_proxy)})
+    # headers.update({'Referer': SITE_AJAX_REQUEST_VIDEO % vi.id})
+    r = await wrap_request('GET', vi.link, **ckwargs, headers=headers)
+    while r.status in (301, 302):
+        if urllib.parse.urlparse(r.headers['Location']).hostname != urllib.parse.urlparse(vi.link).hostname:
+            ckwargs.update({'noproxy': Config.download_without_proxy, 'allow_redirects': True})
+        ensure_conn_closed(r)
+        r = await wrap_request('GET', r.headers['Location'], **ckwargs, headers=headers)
+    return r
 
 
 async def download_video(vi: VideoInfo) -> DownloadResult:
@@ -328,7 +358,7 @@ async def download_video(vi: VideoInfo) -> DownloadResult:
         vi.set_state(VideoInfo.State.DOWNLOADING)
         curfile_match = re_media_filename.match(vi.filename)
         curfile_quality = Quality(curfile_match.group(2) or vi.quality)
-        curfile = file_already_exists(vi.id, curfile_quality)
+        curfile = await afs.call(file_already_exists, vi.id, curfile_quality)
         if curfile:
             curfile_folder, curfile_name = os.path.split(curfile)
             curfile_omatch = re_media_filename.match(curfile_name)
@@ -337,15 +367,15 @@ async def download_video(vi: VideoInfo) -> DownloadResult:
             exact_quality = curfile_oquality and curfile_quality == curfile_oquality
             vi.set_flag(VideoInfo.Flags.ALREADY_EXISTED_EXACT if exact_name else VideoInfo.Flags.ALREADY_EXISTED_SIMILAR)
             if Config.continue_mode and exact_quality:
-                if proc_str := is_file_being_used(curfile):
+                if proc_str := await afs.call(is_file_being_used, curfile):
                     Log.error(f'Error: file {vi.sffilename} already exists and is locked by \'{proc_str}\'!! Parallel download? Aborted!')
                     return DownloadResult.FAIL_ALREADY_EXISTS
                 if not exact_name:
-                    same_loc = os.path.isdir(vi.my_folder) and os.path.samefile(curfile_folder, vi.my_folder)
+                    same_loc = await afs.isdir(vi.my_folder) and await afs.samefile(curfile_folder, vi.my_folder)
                     loc_str = f' ({"same" if same_loc else "different"} location)'
                     if Config.no_rename_move is False or same_loc:
                         Log.info(f'{vi.sffilename} {vi.quality} found{loc_str}. Enforcing new name (was \'{curfile}\').')
-                        if not try_rename(curfile, vi.my_fullpath):
+                        if not await afs.call(try_rename, curfile, vi.my_fullpath):
                             Log.warn(f'Warning: unable to rename file to {vi.sffilename} (already exists?). Old name will be preserved!')
                             vi.filename = pathlib.Path(curfile).name
                     else:
@@ -353,7 +383,7 @@ async def download_video(vi: VideoInfo) -> DownloadResult:
                         Log.info(f'{vi.sffilename} {vi.quality} found{loc_str}. Enforcing old path + new name '
                                  f'\'{curfile_folder}/{vi.filename}\' due to \'--no-rename-move\' flag (was \'{curfile_name}\').')
                         vi.subfolder = new_subfolder
-                        if not try_rename(curfile, normalize_path(os.path.abspath(vi.my_fullpath), False)):
+                        if not await afs.call(try_rename, curfile, normalize_path(os.path.abspath(vi.my_fullpath), False)):
                             Log.warn(f'Warning: unable to rename file to {vi.sffilename} (already exists?). Old name will be preserved!')
                             vi.filename = pathlib.Path(curfile).name
             else:
@@ -362,9 +392,9 @@ async def download_video(vi: VideoInfo) -> DownloadResult:
                 vi.subfolder = normalize_path(os.path.relpath(curfile_folder, Config.dest_base))
                 vi.set_state(VideoInfo.State.DONE)
                 return DownloadResult.FAIL_ALREADY_EXISTS
-        if not os.path.isdir(vi.my_folder):
+        if not await afs.isdir(vi.my_folder):
             try:
-                os.makedirs(vi.my_folder)
+                await afs.makedirs(vi.my_folder)
             except Exception:
                 Log.fatal(f'ERROR: Unable to create subfolder \'{vi.my_folder}\'!')
                 raise
@@ -374,11 +404,13 @@ async def download_video(vi: VideoInfo) -> DownloadResult:
     try_num = 0
     while (not skip) and try_num <= Config.retries:
         r = None
+        bytes_written_before_try = vi.bytes_written
         try:
-            file_exists = os.path.isfile(vi.my_fullpath)
+            segs = await afs.call(DownloadSegments.load, vi.my_fullpath, op='segments')
+            file_exists = await afs.isfile(vi.my_fullpath)
             if file_exists and try_num == 0:
                 vi.set_flag(VideoInfo.Flags.ALREADY_EXISTED_EXACT)
-            file_size = os.stat(vi.my_fullpath).st_size if file_exists else 0
+            file_size = await afs.getsize(vi.my_fullpath) if file_exists else 0
 
             if Config.download_mode == DOWNLOAD_MODE_TOUCH:
                 if file_exists:
@@ -387,25 +419,40 @@ async def download_video(vi: VideoInfo) -> DownloadResult:
                     return DownloadResult.FAIL_ALREADY_EXISTS
                 else:
                     Log.info(f'Saving<touch> {vi.sdname} {0.0:.2f} Mb to {vi.sffilename}')
-                    with open(vi.my_fullpath, 'wb'):
-                        vi.set_flag(VideoInfo.Flags.FILE_WAS_CREATED)
-                        vi.set_state(VideoInfo.State.DONE)
+                    await afs.call(pathlib.Path(vi.my_fullpath).write_bytes, b'', op='create')
+                    vi.set_flag(VideoInfo.Flags.FILE_WAS_CREATED)
+                    vi.set_state(VideoInfo.State.DONE)
+                break
+
+            if segs is not None and segs.is_complete():
+                await afs.call(DownloadSegments.remove_for, vi.my_fullpath, op='segments')
+                Log.warn(f'{vi.sfsname} ({vi.quality}) is already completed, size: {file_size:d} ({file_size / Mem.MB:.2f} Mb)')
+                vi.set_state(VideoInfo.State.DONE)
+                ret = DownloadResult.FAIL_ALREADY_EXISTS
                 break
 
-            hkwargs: dict[str, dict[str, str]] = {'headers': {'Range': f'bytes={file_size:d}-'} if file_size > 0 else {}}
-            ckwargs = {'allow_redirects': not (Config.proxy and (Config.download_without_proxy or Config.html_without_proxy))}
-            ckwargs.update({'noproxy': bool(Config.proxy and Config.html_without_proxy)})
-            # hkwargs['headers'].update({'Referer': SITE_AJAX_REQUEST_VIDEO % vi.id})
-            r = await wrap_request('GET', vi.link, **ckwargs, **hkwargs)
-            while r.status in (301, 302):
-                if urllib.parse.urlparse(r.headers['Location']).hostname != urllib.parse.urlparse(vi.link).hostname:
-                    ckwargs.update({'noproxy': Config.download_without_proxy, 'allow_redirects': True})
+            if segs is not None:
+                range_start, range_end = segs.first_missing_range()
+                headers = {'Range': f'bytes={range_start:d}-{range_end:d}'}
+            else:
+                headers = {'Range': f'bytes={file_size:d}-'} if file_size > 0 else {}
+            with Metrics.timer('download_ttfb_seconds'):
+                r = await request_media(vi, headers)
+            if r.status in (403, 404) and vi.has_flag(VideoInfo.Flags.RESTORED | VideoInfo.Flags.CACHED):
+                # link resolved earlier (see -journal, --scan-cache) has expired, resolve it again
+                Log.warn(f'Got {r.status:d} for {vi.sfsname} using link from {"journal" if vi.has_flag(VideoInfo.Flags.RESTORED) else "scan cache"}, rescanning...')
                 ensure_conn_closed(r)
-                r = await wrap_request('GET', r.headers['Location'], **ckwargs, **hkwargs)
+                vi.reset_flag(VideoInfo.Flags.RESTORED | VideoInfo.Flags.CACHED)
+                if (rescan_result := await scan_video(vi, rescan=True)) != DownloadResult.SUCCESS:
+                    return rescan_result
+                if journal := JobJournal.get():
+                    await journal.record_scanned(vi)
+                vi.set_state(VideoInfo.State.DOWNLOADING)
+                continue
             content_len: int = r.content_length or 0
             content_range_s = str(r.headers.get('Content-Range', '/')).split('/', 1)
             content_range = int(content_range_s[1]) if len(content_range_s) > 1 and content_range_s[1].isnumeric() else 1
-            if (content_len == 0 or r.status == 416) and file_size >= content_range:
+            if segs is None and (content_len == 0 or r.status == 416) and file_size >= content_range:
                 Log.warn(f'{vi.sfsname} ({vi.quality}) is already completed, size: {file_size:d} ({file_size / Mem.MB:.2f} Mb)')
                 vi.set_state(VideoInfo.State.DONE)
                 ret = DownloadResult.FAIL_ALREADY_EXISTS
@@ -417,43 +464,69 @@ async def download_video(vi: VideoInfo) -> DownloadResult:
             r.raise_for_status()
             if r.content_type and 'text' in r.content_type:
                 raise FileNotFoundError(vi.link)
-
+            if segs is not None and r.status != 206:
+                raise OSError(f'{vi.sfsname}: server ignored range request ({r.status:d}), unable to continue segmented download!')
+
+            use_segments = (segs is not None or (
+                Config.download_segments > 1 and file_size == 0 and r.status == 200 and r.headers.get('Accept-Ranges') == 'bytes'
+                and content_len >= DOWNLOAD_SEGMENT_SIZE_MIN * Mem.MB))
+            if segs is not None:
+                file_size, content_len = segs.done_size(), segs.total - segs.done_size()
             status_checker.prepare(r, file_size)
             vi.expected_size = file_size + content_len
             vi.last_check_size = vi.start_size = file_size
             vi.last_check_time = vi.start_time = get_elapsed_time_i()
             starting_str = f' <continuing at {file_size:d}>' if file_size else ''
             total_str = f' / {vi.expected_size / Mem.MB:.2f}' if file_size else ''
-            Log.info(f'Saving{starting_str} {vi.sdname} {content_len / Mem.MB:.2f}{total_str} Mb to {vi.sffilename}')
+            segments_str = f' ({len(segs.missing()) if segs else Config.download_segments:d} segments)' if use_segments else ''
+            Log.info(f'Saving{starting_str} {vi.sdname} {content_len / Mem.MB:.2f}{total_str} Mb{segments_str} to {vi.sffilename}')
 
             if Config.continue_mode and exact_quality:
-                if proc_str := is_file_being_used(vi.my_fullpath):
+                if proc_str := await afs.call(is_file_being_used, vi.my_fullpath):
                     Log.error(f'Error: file {vi.sffilename} already exists and is locked by \'{proc_str}\'!! Parallel download? Aborted!')
                     return DownloadResult.FAIL_ALREADY_EXISTS
 
             await dwn.add_to_writes(vi)
             vi.set_state(VideoInfo.State.WRITING)
             status_checker.run()
-            async with async_open(vi.my_fullpath, 'ab') as outf:
+            if use_segments:
+                if segs is None:
+                    segs = await afs.call(DownloadSegments.create, vi.my_fullpath, content_len, Config.download_segments, op='segments')
                 register_new_file(vi)
                 vi.set_flag(VideoInfo.Flags.FILE_WAS_CREATED)
                 vi.dstart_time = vi.dstart_time or get_elapsed_time_i()
-                bytes_written_this_try = 0
-                async for chunk in r.content.iter_chunked(128 * Mem.KB):
-                    await outf.write(chunk)
-                    vi.bytes_written += len(chunk)
-                    bytes_written_this_try += len(chunk)
-                    if try_num > 0 and bytes_written_this_try >= 256 * Mem.KB:
+                bytes_written_before = vi.bytes_written
+                try:
+                    await download_segments(vi, r, segs, status_checker, lambda h: request_media(vi, h))
+                finally:
+                    if try_num > 0 and vi.bytes_written - bytes_written_before >= 256 * Mem.KB:
                         try_num = 0
+            else:
+                async with FileWriter(vi.my_fullpath, file_size, vi.expected_size if content_len else 0) as outf:
+                    register_new_file(vi)
+                    vi.set_flag(VideoInfo.Flags.FILE_WAS_CREATED)
+                    vi.dstart_time = vi.dstart_time or get_elapsed_time_i()
+                    if outf.preallocated:
+                        vi.set_flag(VideoInfo.Flags.PREALLOCATED)
+                    vi.segmented_size = file_size
+                    bytes_written_this_try = 0
+                    async for chunk in r.content.iter_any():
+                        await outf.write(chunk)
+                        vi.segmented_size += len(chunk)
+                        vi.bytes_written += len(chunk)
+                        bytes_written_this_try += len(chunk)
+                        if try_num > 0 and bytes_written_this_try >= 256 * Mem.KB:
+                            try_num = 0
             status_checker.reset()
             await dwn.remove_from_writes(vi)
 
-            file_size = os.stat(vi.my_fullpath).st_size
+            file_size = await afs.getsize(vi.my_fullpath)
             if vi.expected_size and file_size != vi.expected_size:
                 Log.error(f'Error: file size mismatch for {vi.sfsname}: {file_size:d} / {vi.expected_size:d}')
                 raise OSError(vi.link)
 
             total_time = (get_elapsed_time_i() - vi.dstart_time) or 1
+            Metrics.observe('download_speed_bytes_per_second', vi.bytes_written / total_time)
             Log.info(f'[download] {vi.sfsname} ({vi.quality}) completed in {format_time(total_time)} '
                      f'({(vi.bytes_written / total_time) / Mem.KB:.1f} Kb/s)')
 
@@ -461,6 +534,7 @@ async def download_video(vi: VideoInfo) -> DownloadResult:
             break
         except Exception as e:
             Log.error(f'{vi.sname}: {sys.exc_info()[0]}: {sys.exc_info()[1]}')
+            Metrics.inc('download_retries_total', status=f'{r.status:d}' if r is not None else e.__class__.__name__)
             if (r is None or r.status != 403) and not isinstance(e, (ClientPayloadError, ClientConnectorError)):
                 try_num += 1
                 Log.error(f'{vi.sffilename}: error #{try_num:d}...')
@@ -472,29 +546,29 @@ async def download_video(vi: VideoInfo) -> DownloadResult:
             if try_num <= Config.retries:
                 vi.set_state(VideoInfo.State.DOWNLOADING)
                 await sleep(random.uniform(*CONNECT_RETRY_DELAY))
-            elif Config.keep_unfinished is False and os.path.isfile(vi.my_fullpath) and vi.has_flag(VideoInfo.Flags.FILE_WAS_CREATED):
+            elif Config.keep_unfinished is False and await afs.isfile(vi.my_fullpath) and vi.has_flag(VideoInfo.Flags.FILE_WAS_CREATED):
                 Log.error(f'Failed to download {vi.sffilename}. Removing unfinished file...')
                 unregister_unfinished_file(vi)
-                os.remove(vi.my_fullpath)
+                await afs.remove(vi.my_fullpath)
+                await afs.call(DownloadSegments.remove_for, vi.my_fullpath, op='segments')
         finally:
             ensure_conn_closed(r)
+            Metrics.inc('download_bytes_total', vi.bytes_written - bytes_written_before_try)
 
     ret = (ret if ret in (DownloadResult.FAIL_NOT_FOUND, DownloadResult.FAIL_SKIPPED, DownloadResult.FAIL_ALREADY_EXISTS) else
            DownloadResult.SUCCESS if try_num <= Config.retries else
            DownloadResult.FAIL_RETRIES)
 
-    if Config.save_screenshots:
-        sret = await download_sceenshots(vi)
-        if sret != DownloadResult.SUCCESS:
-            Log.warn(f'{vi.sffilename}: `download_sceenshots()` has failed items (ret = {sret!s})')
+    if scr := ScreenshotWorker.get():
+        scr.queue(vi)
 
     return ret
 
 
-def at_interrupt() -> None:
+async def at_interrupt() -> None:
     dwn = VideoDownloadWorker.get()
     if dwn is not None:
-        return dwn.at_interrupt()
+        return await dwn.at_interrupt()
 
 #
 #
@@ -9,14 +9,14 @@ Author: trickerer (https://github.com/trickerer, https://github.com/trickerer01)
 from __future__ import annotations
 
 import itertools
-import os
 from asyncio import Lock as AsyncLock
 from asyncio.queues import Queue as AsyncQueue
-from asyncio.tasks import as_completed, sleep
+from asyncio.tasks import as_completed
 from collections import deque
-from collections.abc import Callable, Coroutine
+from collections.abc import Callable, Coroutine, Iterable, Iterator
 from typing import Any, TypeAlias
 
+from . import afs
 from .config import Config
 from .defs import (
     DOWNLOAD_CONTINUE_FILE_CHECK_TIMER,
@@ -29,9 +29,14 @@ from .defs import (
     Mem,
 )
 from .dscanner import VideoScanWorker
+from .dsegments import DownloadSegments
 from .iinfo import VideoInfo, get_min_max_ids
+from .infolist import InfoListWriter
+from .journal import JobJournal
 from .logger import Log
-from .util import calc_sleep_time, format_time, get_elapsed_time_i, get_elapsed_time_s
+from .metrics import Metrics
+from .screenshots import ScreenshotWorker
+from .util import StateSignal, calc_sleep_time, format_time, get_elapsed_time_i, get_elapsed_time_s
 
 __all__ = ('VideoDownloadWorker',)
 
@@ -60,6 +65,7 @@ class VideoDownloadWorker:
         VideoDownloadWorker._instance = self
 
         self._scn: VideoScanWorker | None = VideoScanWorker.get()
+        self._scr: ScreenshotWorker | None = ScreenshotWorker.get()
 
         self._func: Func_T = func
         self._seq: deque[VideoInfo] = deque()
@@ -70,10 +76,13 @@ class VideoDownloadWorker:
         self._skipped_count: int = 0
         self._404_count: int = 0
         self._minmax_id: tuple[int, int] = get_min_max_ids(sequence)
+        self._input_open: bool = False
+        self._state_signal: StateSignal = StateSignal()
+        '''notified whenever queue, active downloads or input state change'''
 
         self._completed_items: list[VideoInfo] = []
-        self._downloads_active: list[VideoInfo] = []
-        self._writes_active: list[VideoInfo] = []
+        self._downloads_active: dict[int, VideoInfo] = {}
+        self._writes_active: dict[int, VideoInfo] = {}
         self._failed_items: list[VideoInfo] = []
 
         self._total_queue_size_last: int = 0
@@ -81,25 +90,30 @@ class VideoDownloadWorker:
         self._write_queue_size_last: int = 0
 
         self._sequence_lock: AsyncLock = AsyncLock()
-        self._active_downloads_lock: AsyncLock = AsyncLock()
-        self._active_writes_lock: AsyncLock = AsyncLock()
 
         if self._scn:
             self._scn.register_task_finish_callback(self._at_task_finish)
+            self._scn.register_items_taken_callback(self.extend)
+            planned_minmax = self._scn.get_planned_min_max_ids()
+            self._minmax_id = min(self._minmax_id[0], planned_minmax[0]), max(self._minmax_id[1], planned_minmax[1])
         else:
             self._seq.extend(sequence)  # form our own container to erase from
 
     async def _at_task_start(self, vi: VideoInfo) -> None:
-        async with self._active_downloads_lock:
-            self._downloads_active.append(vi)
+        self._downloads_active[vi.id] = vi
         vi.set_state(VideoInfo.State.ACTIVE)
         Log.trace(f'[queue] {vi.sname} added to active')
 
     async def _at_task_finish(self, vi: VideoInfo, result: DownloadResult) -> None:
-        if vi in self._downloads_active and not (Config.watcher_mode and vi in self._writes_active):
-            async with self._active_downloads_lock:
-                self._downloads_active.remove(vi)
+        Metrics.inc('download_results_total', result=result.name)
+        if journal := JobJournal.get():
+            await journal.record_result(vi, result)
+        if info_writer := InfoListWriter.get():
+            await info_writer.store(vi)
+        if vi.id in self._downloads_active and not (Config.watcher_mode and vi.id in self._writes_active):
+            del self._downloads_active[vi.id]
             Log.trace(f'[queue] {vi.sname} removed from active')
+            self._state_signal.notify()
         if result == DownloadResult.FAIL_ALREADY_EXISTS:
             self._already_exist_count += 1
         elif result in (DownloadResult.FAIL_SKIPPED, DownloadResult.FAIL_FILTERED_OUTER):
@@ -110,6 +124,8 @@ class VideoDownloadWorker:
             self._failed_items.append(vi)
         elif result == DownloadResult.SUCCESS:
             self._completed_items.append(vi)
+        if self._scn:
+            self._scn.release(vi)
 
     async def _prod(self) -> None:
         while True:
@@ -122,8 +138,17 @@ class VideoDownloadWorker:
                 if vi:
                     vi.set_state(VideoInfo.State.QUEUED)
                     await self._queue.put(vi)
+                    self._state_signal.notify()
+                else:
+                    # streaming input without scanner, wait for more items
+                    await self._state_signal.wait_for(lambda: bool(self._seq) or not self.can_fetch_next())
             else:
-                await sleep(0.2)
+                await self._state_signal.wait_for(lambda: not self._queue.full())
+        self._state_signal.notify()
+
+    def _can_consume(self) -> bool:
+        qsize = self._queue.qsize()
+        return (qsize > 0 and len(self._downloads_active) < MAX_VIDEOS_QUEUE_SIZE) or (qsize == 0 and not self.can_fetch_next())
 
     async def _cons(self) -> None:
         while True:
@@ -132,26 +157,29 @@ class VideoDownloadWorker:
                 qsize = self._queue.qsize()
             if can_fetch is False and qsize == 0:
                 break
-            async with self._active_downloads_lock:
-                dsize = len(self._downloads_active)
+            dsize = len(self._downloads_active)
             if qsize > 0 and dsize < MAX_VIDEOS_QUEUE_SIZE:
                 vi = await self._queue.get()
+                self._state_signal.notify()
                 await self._at_task_start(vi)
                 result = await self._func(vi)
                 await self._at_task_finish(vi, result)
                 self._queue.task_done()
             else:
-                await sleep(0.35)
+                await self._state_signal.wait_for(self._can_consume)
 
     async def _state_reporter(self) -> None:
         force_check_secs = DOWNLOAD_QUEUE_STALL_CHECK_TIMER
         last_check_secs = 0
-        while self.get_workload_size() > 0 or self.waiting_for_scanner():
-            await sleep(calc_sleep_time(3.0) if len(self._seq) + self._queue.qsize() > 0 or self.waiting_for_scanner() else 1.0)
+        while self.has_work():
+            await self._state_signal.wait_for(
+                lambda: not self.has_work(),
+                calc_sleep_time(3.0) if len(self._seq) + self._queue.qsize() > 0 or self.waiting_for_scanner() else 1.0)
             queue_size = len(self._seq) + self.get_scanner_workload_size()
             ready_size = self._queue.qsize()
             scan_count = self.get_scanned_count()
-            extra_count = max(0, scan_count - self._orig_count)
+            orig_count = self.get_orig_count()
+            extra_count = max(0, scan_count - orig_count)
             download_count = len(self._downloads_active)
             write_count = len(self._writes_active)
             queue_last = self._total_queue_size_last
@@ -160,7 +188,7 @@ class VideoDownloadWorker:
             elapsed_seconds = get_elapsed_time_i()
             force_check = elapsed_seconds - last_check_secs >= force_check_secs and bool(write_count or not self.waiting_for_watcher())
             if queue_last != queue_size or downloading_last != download_count or write_last != write_count or force_check:
-                scan_msg = f'scanned: {f"{min(scan_count, self._orig_count)}+{extra_count:d}" if Config.lookahead else str(scan_count)}'
+                scan_msg = f'scanned: {f"{min(scan_count, orig_count)}+{extra_count:d}" if Config.lookahead else str(scan_count)}'
                 prescan_msg = f' (prescanned: {self._scn.get_prescanned_count():d})' if self._scn else ''
                 Log.info(f'[{get_elapsed_time_s()}] {scan_msg}, queue: {queue_size:d}{prescan_msg}, ready: {ready_size:d}, '
                          f'active: {download_count:d} (writing: {write_count:d})')
@@ -171,8 +199,8 @@ class VideoDownloadWorker:
                 wc_threshold = MAX_VIDEOS_QUEUE_SIZE // (2 - int(force_check))
                 if force_check or (queue_size == 0 and download_count == write_count <= wc_threshold):
                     item_states: list[str] = []
-                    for vi in self._downloads_active:
-                        cursize = os.stat(vi.my_fullpath).st_size if os.path.isfile(vi.my_fullpath) else 0
+                    for vi in list(self._downloads_active.values()):
+                        cursize = await afs.call(vi.get_downloaded_size, op='stat')
                         remsize = vi.expected_size - cursize if cursize else 0
                         cursize_str = f'{cursize / Mem.MB:.2f}' if cursize else '???'
                         totalsize_str = f'{vi.expected_size / Mem.MB:.2f}' if vi.expected_size else '???'
@@ -197,44 +225,71 @@ class VideoDownloadWorker:
                     if item_states:
                         Log.debug('\n'.join(item_states))
 
+    def _make_continue_ids_arguments(self) -> list[str]:
+        """
+        Ids left to process as cmdline arguments. Remainder of a planned id range is stored as its bounds rather than listing
+        every id, ids within bounds which are already finished are skipped by journal replay
+        """
+        active_ids = [vi.id for vi in itertools.chain(
+            self._seq, getattr(self._queue, '_queue'), self._downloads_active.values(), self.get_scanner_workload())]
+        planned_bounds = self.get_scanner_planned_bounds()
+        if planned_bounds and not (Config.use_id_sequence or Config.use_link_sequence):
+            return ['-start', str(min((planned_bounds[0], *active_ids))), '-end', str(max((planned_bounds[1], *active_ids)))]
+        v_ids = sorted(itertools.chain(active_ids, self.get_scanner_planned_ids()))
+        if not v_ids:
+            return []
+        return ['-seq', f'({"~".join(f"id={idi:d}" for idi in v_ids)})'] if len(v_ids) > 1 else ['-start', str(v_ids[0])]
+
+    @staticmethod
+    def _store_continue_file(fullpath: str, arglist: list[str]) -> None:
+        with open(fullpath, 'wt', encoding=UTF8, buffering=1) as cfile:
+            cfile.write('\n'.join(str(e) for e in arglist))
+
     async def _continue_file_checker(self) -> None:
         if not Config.store_continue_cmdfile:
             return
-        minmax_id = self._minmax_id
-        continue_file_name = f'{PREFIX}{START_TIME.strftime("%Y-%m-%d_%H_%M_%S")}_{minmax_id[0]:d}-{minmax_id[1]:d}.continue.conf'
-        continue_file_fullpath = f'{Config.dest_base}{continue_file_name}'
+        continue_file_name = continue_file_fullpath = ''
+        last_arglist: list[str] = []
         arglist_base = Config.make_continue_arguments()
         write_delay = DOWNLOAD_CONTINUE_FILE_CHECK_TIMER
         last_check_seconds = 0
-        while self.get_workload_size() + self.get_scanner_workload_size() > 0:
+        while self.has_work():
             elapsed_seconds = get_elapsed_time_i()
             if elapsed_seconds >= write_delay and elapsed_seconds - last_check_seconds >= write_delay:
                 last_check_seconds = elapsed_seconds
-                v_ids: list[int] = sorted(
-                    vi.id for vi in itertools.chain(
-                        self._seq, getattr(self._queue, '_queue'), self._downloads_active, self.get_scanner_workload()))
-                arglist = ['-seq', f'({"~".join(f"id={idi:d}" for idi in v_ids)})'] if len(v_ids) > 1 else ['-start', str(v_ids[0])]
+                arglist = self._make_continue_ids_arguments()
+                if not arglist:
+                    await self._state_signal.wait_for(lambda: not self.has_work(), calc_sleep_time(3.0))
+                    continue
+                if not continue_file_name:
+                    # when streaming, min / max ids are only known as the items arrive so the name is formed at first write
+                    minmax_id = self._minmax_id
+                    continue_file_name = f'{PREFIX}{START_TIME.strftime("%Y-%m-%d_%H_%M_%S")}_{minmax_id[0]:d}-{minmax_id[1]:d}.continue.conf'
+                    continue_file_fullpath = f'{Config.dest_base}{continue_file_name}'
                 arglist.extend(arglist_base)
+                if arglist == last_arglist:
+                    # finished items are tracked by journal, only rewrite when remaining bounds change
+                    await self._state_signal.wait_for(lambda: not self.has_work(), calc_sleep_time(3.0))
+                    continue
+                last_arglist = arglist
                 try:
                     Log.trace(f'Storing continue file to \'{continue_file_name}\'...')
-                    if not os.path.isdir(Config.dest_base):
-                        os.makedirs(Config.dest_base)
-                    with open(continue_file_fullpath, 'wt', encoding=UTF8, buffering=1) as cfile:
-                        cfile.write('\n'.join(str(e) for e in arglist))
+                    await afs.makedirs(Config.dest_base, exist_ok=True)
+                    await afs.call(self._store_continue_file, continue_file_fullpath, arglist, op='continue')
                 except OSError:
                     Log.error(f'Unable to save continue file to \'{continue_file_name}\'!')
-            await sleep(calc_sleep_time(3.0))
-        if not Config.aborted and os.path.isfile(continue_file_fullpath):
+            await self._state_signal.wait_for(lambda: not self.has_work(), calc_sleep_time(3.0))
+        if continue_file_name and not Config.aborted and await afs.isfile(continue_file_fullpath):
             Log.trace(f'All files downloaded. Removing continue file \'{continue_file_name}\'...')
-            os.remove(continue_file_fullpath)
+            await afs.remove(continue_file_fullpath)
 
     async def _after_download(self) -> None:
         for smsg in ('', *(vi.sffilename for vi in sorted(self._completed_items, key=lambda v: v.sffilename))):
             Log.info(smsg)
-        Log.info(f'\nDone. {len(self._completed_items):d} / {self._orig_count:d}+{self._prefiltered_count:d}'
+        Log.info(f'\nDone. {len(self._completed_items):d} / {self.get_orig_count():d}+{self._prefiltered_count:d}'
                  f'{f"+{self._scn.get_extra_count():d}" if Config.lookahead else ""} file(s) downloaded, '
                  f'{self._already_exist_count:d}+{self._prefiltered_count:d} already existed, '
-                 f'{self._skipped_count:d} skipped, {self._404_count:d} not found')
+                 f'{self._skipped_count:d} skipped, {self._404_count + self.get_predicted_count():d} not found')
         workload_size = len(self._seq) + self.get_scanner_workload_size()
         if workload_size > 0:
             Log.fatal(f'total queue is still at {workload_size:d} != 0!')
@@ -250,31 +305,31 @@ class VideoDownloadWorker:
             await cv
         await self._after_download()
         await self._queue.join()
+        if self._scr:
+            self._scr.close_input()
 
-    def at_interrupt(self) -> None:
+    async def at_interrupt(self) -> None:
         if len(self._downloads_active) > 0:
-            active_items = sorted([vi for vi in self._downloads_active if os.path.isfile(vi.my_fullpath)
-                                   and vi.has_flag(VideoInfo.Flags.FILE_WAS_CREATED)], key=lambda vi: vi.id)
+            active_items = sorted([vi for vi in self._downloads_active.values() if vi.has_flag(VideoInfo.Flags.FILE_WAS_CREATED)
+                                   and await afs.isfile(vi.my_fullpath)], key=lambda vi: vi.id)
             if Config.keep_unfinished:
                 unfinished_str = '\n '.join(f'{i + 1:d}) {vi.my_fullpath}' for i, vi in enumerate(active_items))
                 Log.debug(f'at_interrupt: keeping {len(active_items):d} unfinished file(s):\n {unfinished_str}')
                 return
             for vi in active_items:
                 Log.debug(f'at_interrupt: trying to remove \'{vi.my_fullpath}\'...')
-                os.remove(vi.my_fullpath)
+                await afs.remove(vi.my_fullpath)
+                await afs.call(DownloadSegments.remove_for, vi.my_fullpath, op='segments')
 
     async def is_writing(self, vi: VideoInfo) -> bool:
-        async with self._active_writes_lock:
-            return vi in self._writes_active
+        return vi.id in self._writes_active
 
     async def add_to_writes(self, vi: VideoInfo) -> None:
-        async with self._active_writes_lock:
-            self._writes_active.append(vi)
+        self._writes_active[vi.id] = vi
 
     async def remove_from_writes(self, vi: VideoInfo, safe=False) -> None:
-        async with self._active_writes_lock:
-            if safe is False or vi in self._writes_active:
-                self._writes_active.remove(vi)
+        if safe is False or vi.id in self._writes_active:
+            del self._writes_active[vi.id]
 
     def waiting_for_scanner(self) -> bool:
         return self._scn and not self._scn.done()
@@ -288,22 +343,63 @@ class VideoDownloadWorker:
     def get_scanner_workload(self) -> list[VideoInfo]:
         return self._scn.get_workload() if self.waiting_for_scanner() else []
 
+    def get_scanner_planned_ids(self) -> Iterator[int]:
+        return self._scn.get_planned_ids() if self.waiting_for_scanner() else iter(())
+
+    def get_scanner_planned_bounds(self) -> tuple[int, int] | None:
+        return self._scn.get_planned_bounds() if self.waiting_for_scanner() else None
+
+    def get_predicted_count(self) -> int:
+        """Planned ids predicted to be gaps never become items, those only count as scanned (not found)"""
+        return self._scn.get_predicted_count() if self._scn else 0
+
+    def get_orig_count(self) -> int:
+        return self._orig_count + self.get_predicted_count()
+
     def can_fetch_next(self) -> bool:
-        return self.waiting_for_scanner() or bool(self._seq)
+        return self.waiting_for_scanner() or bool(self._seq) or self._input_open
+
+    def open_input(self) -> None:
+        """Keeps downloader running while the queue is empty until close_input() is called, see extend()"""
+        self._input_open = True
+
+    def close_input(self) -> None:
+        self._input_open = False
+        self._state_signal.notify()
+
+    def extend(self, items: Iterable[VideoInfo], filtered_count: int) -> None:
+        """Accounts for items fed while already running. Without a scanner, items are also queued directly"""
+        if Config.aborted:
+            return
+        items = list(items)
+        minid, maxid = get_min_max_ids(items)
+        self._minmax_id = min(self._minmax_id[0], minid), max(self._minmax_id[1], maxid)
+        self._orig_count += len(items)
+        self._prefiltered_count += filtered_count
+        if not self._scn:
+            self._seq.extend(items)
+        self._state_signal.notify()
 
     def get_workload_size(self) -> int:
         return len(self._seq) + self._queue.qsize() + len(self._downloads_active)
 
+    def has_work(self) -> bool:
+        return self.get_workload_size() > 0 or self.waiting_for_scanner() or self._input_open
+
     def waiting_for_watcher(self) -> bool:
         return self._scn and self._scn.watcher_wait_active()
 
     async def _try_fetch_next(self) -> VideoInfo | None:
+        if self._scn and not self._seq:
+            # wait without holding the lock so consumers are not blocked
+            await self._scn.wait_for_scanned()
         async with self._sequence_lock:
             if self._seq:
                 vi = self._seq.popleft()
-            else:
-                assert self._scn
+            elif self._scn:
                 vi = await self._scn.try_fetch_next()
+            else:
+                vi = None
             return vi
 
 #
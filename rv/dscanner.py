@@ -8,12 +8,13 @@ Author: trickerer (https://github.com/trickerer, https://github.com/trickerer01)
 
 from __future__ import annotations
 
-from asyncio import CancelledError, Task, get_running_loop
+from asyncio import CancelledError, Task, gather, get_running_loop
 from asyncio.tasks import sleep
 from collections import deque
-from collections.abc import Callable, Coroutine
+from collections.abc import Callable, Coroutine, Iterable, Iterator
 from typing import Any, TypeAlias
 
+from . import afs
 from .config import Config
 from .defs import (
     LOOKAHEAD_WATCH_RESCAN_DELAY_MAX,
@@ -24,16 +25,21 @@ from .defs import (
     SCAN_CANCEL_KEYSTROKE,
     DownloadResult,
 )
+from .idplan import IdPlan
 from .iinfo import VideoInfo, get_min_max_ids
 from .input import wait_for_key
+from .journal import JobJournal
 from .logger import Log
-from .path_util import file_already_exists_arr
-from .util import get_local_time_s
+from .metrics import Metrics
+from .path_util import file_already_exists_arr, filter_existing_id
+from .util import StateSignal, get_local_time_s
 
 __all__ = ('VideoScanWorker',)
 
 Func_T: TypeAlias = Callable[[VideoInfo], Coroutine[Any, Any, DownloadResult]]
 Callback_T: TypeAlias = Callable[[VideoInfo, DownloadResult], Coroutine[Any, Any, None]]
+ItemsCallback_T: TypeAlias = Callable[[list[VideoInfo], int], None]
+GapCheck_T: TypeAlias = Callable[[int], bool]
 
 
 class VideoScanWorker:
@@ -54,30 +60,51 @@ class VideoScanWorker:
     def __exit__(self, exc_type, exc_val, exc_tb) -> None:
         VideoScanWorker._instance = None
 
-    def __init__(self, sequence: list[VideoInfo], func: Func_T) -> None:
+    def __init__(self, sequence: list[VideoInfo], func: Func_T, plan: IdPlan | None = None, gap_check: GapCheck_T | None = None) -> None:
         assert VideoScanWorker._instance is None
         VideoScanWorker._instance = self
 
-        self._original_sequence: list[VideoInfo] = sequence
+        self._first_id: int | None = sequence[0].id if sequence else None
+        self._id_index: dict[int, list[VideoInfo]] = {}
+        '''items not finished yet by id, in queue order'''
+        self._finished_ids: dict[VideoInfo.State, set[int]] = {state: set() for state in VideoInfo.State}
+        '''ids of finished items by state they finished in, items themselves are released, see release()'''
+        self._finished_404_ids: set[int] = set()
+        self._index_items(sequence)
         self._func: Func_T = func
         self._seq: deque[VideoInfo] = deque(sequence)
+        self._scan_tasks: deque[Task[DownloadResult]] = deque()
 
-        self._orig_count: int = len(self._original_sequence)
+        self._orig_count: int = len(sequence)
         self._scan_count: int = 0
         self._404_counter: int = 0
-        self._last_non404_id: int = self._original_sequence[0].id - 1
+        self._last_non404_id: int = self._first_id - 1 if self._first_id is not None else plan.min_id - 1 if plan else 0
         self._extra_ids: list[int] = []
         self._scanned_items: deque[VideoInfo] = deque()
         self._task_finish_callback: Callback_T | None = None
+        self._items_taken_callback: ItemsCallback_T | None = None
+        self._input_open: bool = False
+        self._state_signal: StateSignal = StateSignal()
+        '''notified whenever queue, scanned items or input state change'''
 
         self._sleep_waiter: Task | None = None
         self._abort_waiter: Task | None = None
 
         self._id_gaps: list[tuple[int, int]] = []
 
+        self._plan: IdPlan | None = plan
+        self._plan_ids: Iterator[int] = iter(plan) if plan else iter(())
+        self._plan_next: int = plan.min_id if plan else 0
+        self._plan_left: int = len(plan) if plan else 0
+        '''planned ids not yet taken into queue, see _take_planned()'''
+        self._gap_check: GapCheck_T | None = gap_check
+        self._predicted_count: int = 0
+
     def _on_abort(self) -> None:
         Log.warn('[queue] scanner thread interrupted, finishing pending tasks...')
         Config.on_scan_abort()
+        self._input_open = False
+        self._state_signal.notify()
         if self._sleep_waiter:
             self._sleep_waiter.cancel()
             self._sleep_waiter: Task | None = None
@@ -90,13 +117,85 @@ class VideoScanWorker:
         except CancelledError:
             pass
 
+    async def _sleep(self, sleep_time: int) -> None:
+        self._sleep_waiter = get_running_loop().create_task(self._sleep_task(sleep_time))
+        await self._sleep_waiter
+        self._sleep_waiter = None
+
+    def _index_items(self, items: Iterable[VideoInfo]) -> None:
+        for vi in items:
+            if vi.id in self._id_index:
+                self._id_index[vi.id].append(vi)
+            else:
+                self._id_index[vi.id] = [vi]
+
+    async def _take_planned(self) -> int:
+        """
+        Turns planned ids into queue items, only as many as scan tasks can take at once.
+        Ids of existing files and ids predicted to be gaps are accounted for but never become VideoInfo
+        """
+        items: list[VideoInfo] = []
+        filtered_count = 0
+        restored_count = 0
+        journal = JobJournal.get()
+        while self._plan_left > 0 and len(self._seq) < max(Config.scan_tasks, 1):
+            id_ = next(self._plan_ids)
+            self._plan_left -= 1
+            self._plan_next = id_ + 1
+            if journal and journal.is_finished(id_):
+                Log.trace(f'[journal] id {id_:d} was finished in previous run, skipped')
+                filtered_count += 1
+            elif journal and (vi := journal.restore_scanned(id_)):
+                Log.debug(f'[journal] {vi.sname} was scanned in previous run, queued for download')
+                self._at_restored(vi)
+                items.append(vi)
+                restored_count += 1
+            elif filter_existing_id(id_):
+                filtered_count += 1
+            elif self._gap_check and self._gap_check(id_):
+                self._at_predicted_gap()
+            else:
+                vi = VideoInfo(id_)
+                self._seq.append(vi)
+                self._index_items((vi,))
+                items.append(vi)
+        self._orig_count += len(items)
+        if self._items_taken_callback and (items or filtered_count):
+            self._items_taken_callback(items, filtered_count)
+        if restored_count:
+            self._state_signal.notify()
+        if not self._seq and self._plan_left == 0 and self._scan_count and Config.lookahead:
+            return await self._extend_with_extra()
+        return 0
+
+    def _at_restored(self, vi: VideoInfo) -> None:
+        self._index_items((vi,))
+        self._scanned_items.append(vi)
+        self._scan_count += 1
+        self._404_counter = 0
+        self._last_non404_id = vi.id
+
+    def _at_predicted_gap(self) -> None:
+        Metrics.inc('scan_results_total', result=DownloadResult.FAIL_NOT_FOUND.name)
+        self._scan_count += 1
+        self._predicted_count += 1
+        self._404_counter += 1
+
+    def _make_scan_task(self, vi: VideoInfo) -> Task[DownloadResult]:
+        return get_running_loop().create_task(self._func(vi))
+
+    def _fill_scan_tasks(self) -> None:
+        # scan tasks always map onto the head of the queue: self._scan_tasks[i] is scanning self._seq[i]
+        while len(self._scan_tasks) < min(max(Config.scan_tasks, 1), len(self._seq)):
+            self._scan_tasks.append(self._make_scan_task(self._seq[len(self._scan_tasks)]))
+
     async def _extend_with_extra(self) -> int:
         lookahead_abs = abs(Config.lookahead)
         watcher_mode = Config.lookahead < 0 and bool(self._extra_ids) and self._404_counter >= lookahead_abs
         last_id = self._last_non404_id + self._404_counter
         extra_cur = lookahead_abs - self._404_counter
         if watcher_mode:
-            back_step = min(lookahead_abs, len(self._original_sequence) - 2)
+            back_step = min(lookahead_abs, self._orig_count + len(self._extra_ids) - 2)
             last_id = self._last_non404_id - back_step
             extra_cur = lookahead_abs + back_step
         if extra_cur > 0:
@@ -104,7 +203,7 @@ class VideoScanWorker:
             extra_vis = [VideoInfo(idi) for idi in extra_idseq]
             minid, maxid = get_min_max_ids(extra_vis)
             self._seq.extend(extra_vis)
-            self._original_sequence.extend(extra_vis)
+            self._index_items(extra_vis)
             self._extra_ids.extend(extra_idseq)
             if not watcher_mode:
                 Log.warn(f'[lookahead] extending queue after {last_id:d} with {extra_cur:d} extra ids: {minid:d}-{maxid:d}')
@@ -116,6 +215,7 @@ class VideoScanWorker:
         return 0
 
     async def _at_scan_finish(self, vi: VideoInfo, result: DownloadResult) -> int:
+        Metrics.inc('scan_results_total', result=result.name)
         if result in (DownloadResult.FAIL_EMPTY_HTML,):
             return RESCAN_DELAY_EMPTY
 
@@ -123,13 +223,15 @@ class VideoScanWorker:
         self._seq.popleft()
         if result in (DownloadResult.FAIL_NOT_FOUND, DownloadResult.FAIL_RETRIES,
                       DownloadResult.FAIL_DELETED, DownloadResult.FAIL_FILTERED_OUTER, DownloadResult.FAIL_SKIPPED):
-            founditems = list(filter(None, (file_already_exists_arr(vi.id, q) for q in QUALITIES)))
+            founditems = list(filter(None, [await afs.call(file_already_exists_arr, vi.id, q) for q in QUALITIES]))
             if any(ffs for ffs in founditems):
                 newline = '\n'
                 Log.info(f'{vi.sname} scan returned {result!s} but it was already downloaded:'
                          f'\n - {f"{newline} - ".join(f"{newline} - ".join(ffs) for ffs in founditems)}')
         if result == DownloadResult.SUCCESS:
             self._scanned_items.append(vi)
+            if journal := JobJournal.get():
+                await journal.record_scanned(vi)
         else:
             if result == DownloadResult.FAIL_NOT_FOUND:
                 vi.set_flag(VideoInfo.Flags.RETURNED_404)
@@ -143,26 +245,53 @@ class VideoScanWorker:
         self._404_counter = self._404_counter + 1 if result == DownloadResult.FAIL_NOT_FOUND else 0
         if result != DownloadResult.FAIL_NOT_FOUND:
             self._last_non404_id = vi.id
-        if len(self._seq) == 0 and Config.lookahead:
+        if len(self._seq) == 0 and self._plan_left == 0 and Config.lookahead:
             return await self._extend_with_extra()
         return 0
 
     async def run(self) -> None:
         Log.debug('[queue] scanner thread start')
         self._abort_waiter = get_running_loop().create_task(wait_for_key(SCAN_CANCEL_KEYSTROKE, SCAN_CANCEL_KEYCOUNT, self._on_abort))
-        while self._seq:
-            if Config.aborted:
-                self._seq.clear()
-                continue
-            result = await self._func(self._seq[0])
-            sleep_time = await self._at_scan_finish(self._seq[0], result)
-            if sleep_time:
-                self._sleep_waiter = get_running_loop().create_task(self._sleep_task(sleep_time))
-                await self._sleep_waiter
-                self._sleep_waiter = None
-        if self._abort_waiter:
-            self._abort_waiter.cancel()
-            self._abort_waiter = None
+        try:
+            while self._seq or self._plan_left or self._input_open:
+                if self._plan_left and not Config.aborted:
+                    if sleep_time := await self._take_planned():
+                        await self._sleep(sleep_time)
+                    if not self._seq:
+                        continue
+                if not self._seq:
+                    # streaming input, wait for more items
+                    await self._state_signal.wait_for(lambda: bool(self._seq) or not self._input_open)
+                    continue
+                if Config.aborted:
+                    # drop everything not being scanned yet, let active scans finish
+                    self._plan_left = 0
+                    while len(self._seq) > len(self._scan_tasks):
+                        self._seq.pop()
+                    if not self._seq:
+                        continue
+                else:
+                    self._fill_scan_tasks()
+                result = await self._scan_tasks.popleft()
+                sleep_time = await self._at_scan_finish(self._seq[0], result)
+                if sleep_time:
+                    await self._sleep(sleep_time)
+                if result == DownloadResult.FAIL_EMPTY_HTML:
+                    if Config.aborted:
+                        self._seq.popleft()
+                    else:
+                        self._scan_tasks.appendleft(self._make_scan_task(self._seq[0]))
+                self._state_signal.notify()
+        finally:
+            # scans still in flight if loop exited with an exception
+            for task in self._scan_tasks:
+                task.cancel()
+            await gather(*self._scan_tasks, return_exceptions=True)
+            self._scan_tasks.clear()
+            self._state_signal.notify()
+            if self._abort_waiter:
+                self._abort_waiter.cancel()
+                self._abort_waiter = None
         Log.debug('[queue] scanner thread stop: scan complete')
         if self._id_gaps:
             gap_strings: list[str] = []
@@ -181,10 +310,31 @@ class VideoScanWorker:
                     Log.debug(f'[gaps scanner] all gaps are (%{modval:d})!')
 
     def done(self) -> bool:
-        return self.get_workload_size() == 0
+        return self.get_workload_size() == 0 and not self._input_open
 
     def has_found_any(self) -> bool:
-        return self._last_non404_id >= self._original_sequence[0].id
+        return self._first_id is not None and self._last_non404_id >= self._first_id
+
+    def open_input(self) -> None:
+        """Keeps scanner running while the queue is empty until close_input() is called, see extend()"""
+        self._input_open = True
+
+    def close_input(self) -> None:
+        self._input_open = False
+        self._state_signal.notify()
+
+    def extend(self, items: Iterable[VideoInfo]) -> None:
+        """Appends items to the queue. Used to feed scanner while it is already running"""
+        if Config.aborted:
+            return
+        items = list(items)
+        if items and self._first_id is None:
+            self._first_id = items[0].id
+            self._last_non404_id = self._first_id - 1
+        self._seq.extend(items)
+        self._index_items(items)
+        self._orig_count += len(items)
+        self._state_signal.notify()
 
     def watcher_wait_active(self) -> bool:
         return self._sleep_waiter is not None
@@ -193,11 +343,25 @@ class VideoScanWorker:
         return self._scan_count
 
     def get_workload_size(self) -> int:
-        return len(self._seq) + len(self._scanned_items)
+        return len(self._seq) + len(self._scanned_items) + self._plan_left
 
     def get_workload(self) -> list[VideoInfo]:
         return list(self._seq) + list(self._scanned_items)
 
+    def get_planned_ids(self) -> Iterator[int]:
+        """Planned ids not taken into queue yet, generated lazily"""
+        return self._plan.iter_from(self._plan_next) if self._plan and self._plan_left else iter(())
+
+    def get_planned_bounds(self) -> tuple[int, int] | None:
+        """Lowest and highest planned ids not taken into queue yet, **None** if there are none"""
+        return (self._plan_next, self._plan.max_id) if self._plan and self._plan_left else None
+
+    def get_planned_min_max_ids(self) -> tuple[int, int]:
+        return (self._plan.min_id, self._plan.max_id) if self._plan else get_min_max_ids(())
+
+    def get_predicted_count(self) -> int:
+        return self._predicted_count
+
     def get_prescanned_count(self) -> int:
         return len(self._scanned_items)
 
@@ -210,16 +374,52 @@ class VideoScanWorker:
     def register_task_finish_callback(self, callack: Callable[[VideoInfo, DownloadResult], Coroutine[Any, Any, None]]) -> None:
         self._task_finish_callback = callack
 
+    def register_items_taken_callback(self, callback: ItemsCallback_T) -> None:
+        """**callback** receives planned ids taken into queue as items, plus count of ids filtered out as existing"""
+        self._items_taken_callback = callback
+
+    async def wait_for_scanned(self) -> None:
+        await self._state_signal.wait_for(lambda: bool(self._scanned_items) or self.done())
+
     async def try_fetch_next(self) -> VideoInfo | None:
-        while not self._scanned_items and not self.done():
-            await sleep(0.1)
+        await self.wait_for_scanned()
         return self._scanned_items.popleft() if self._scanned_items else None
 
-    def find_vinfo_pred(self, pred: Callable[[VideoInfo], bool]) -> VideoInfo | None:
-        return next((vi for vi in self._original_sequence if pred(vi)), None)
-
-    def find_vinfo_last(self, id_: int) -> VideoInfo | None:
-        return next((vi for vi in reversed(self._original_sequence) if vi.id == id_), None)
+    def get_active_items(self) -> list[VideoInfo]:
+        """Items not finished (released) yet, in queue order for each id"""
+        return [vi for vis in self._id_index.values() for vi in vis]
+
+    def release(self, vi: VideoInfo) -> None:
+        """Forgets finished item, only its id is kept in the index of the state it finished in"""
+        vis = self._id_index.get(vi.id, [])
+        idx = next((i for i, vii in enumerate(vis) if vii is vi), None)
+        if idx is None:
+            return
+        del vis[idx]
+        if not vis:
+            del self._id_index[vi.id]
+        self._finished_ids[vi.state].add(vi.id)
+        if vi.has_flag(VideoInfo.Flags.RETURNED_404):
+            self._finished_404_ids.add(vi.id)
+        else:
+            self._finished_404_ids.discard(vi.id)
+
+    def find_vinfo(self, id_: int, pred: Callable[[VideoInfo], bool] | None = None) -> VideoInfo | None:
+        """First not finished item with id **id_** (optionally also matching **pred**) in queue order"""
+        return next((vi for vi in self._id_index.get(id_, ()) if pred is None or pred(vi)), None)
+
+    def has_id_in_states(self, id_: int, *states: VideoInfo.State) -> bool:
+        """Whether any item with id **id_** is in one of **states** or was finished in one of them"""
+        return (any(vi.state in states for vi in self._id_index.get(id_, ()))
+                or any(id_ in self._finished_ids[state] for state in states))
+
+    def get_id_stats(self, id_: int) -> tuple[bool, bool]:
+        """(was queued, returned 404) for the last item with id **id_**"""
+        if vis := self._id_index.get(id_):
+            return True, vis[-1].has_flag(VideoInfo.Flags.RETURNED_404)
+        if id_ in self._finished_404_ids:
+            return True, True
+        return any(id_ in ids for ids in self._finished_ids.values()), False
 
 #
 #
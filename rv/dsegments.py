@@ -0,0 +1,158 @@
+# coding=UTF-8
+"""
+Author: trickerer (https://github.com/trickerer, https://github.com/trickerer01)
+"""
+#########################################
+#
+#
+
+from __future__ import annotations
+
+import json
+import os
+from asyncio import Lock as AsyncLock
+from asyncio import gather
+from collections.abc import Awaitable, Callable
+
+from aiofile import AIOFile
+from aiohttp import ClientResponse
+
+from . import afs
+from .defs import DOWNLOAD_SEGMENT_SAVE_STEP, UTF8, Mem
+from .fetch_html import ensure_conn_closed
+from .iinfo import VideoInfo
+from .logger import Log
+
+if False is True:  # for hinting only
+    from .dthrottler import ThrottleChecker  # noqa: I001
+
+__all__ = ('DownloadSegments', 'download_segments')
+
+RequestFunc_T = Callable[[dict[str, str]], Awaitable[ClientResponse]]
+
+
+class DownloadSegments:
+    """
+    Segmented download progress. Stored in a '.segments' file next to the (preallocated) file being downloaded,
+    each segment is a list of [start, end (inclusive), bytes done]
+    """
+    def __init__(self, fullpath: str, total: int, segments: list[list[int]]) -> None:
+        self.fullpath: str = fullpath
+        self.total: int = total
+        self.segments: list[list[int]] = segments
+
+    @staticmethod
+    def sidecar_path(fullpath: str) -> str:
+        return f'{fullpath}.segments'
+
+    @staticmethod
+    def load(fullpath: str) -> DownloadSegments | None:
+        sidecar = DownloadSegments.sidecar_path(fullpath)
+        if not os.path.isfile(sidecar):
+            return None
+        try:
+            with open(sidecar, 'rt', encoding=UTF8) as sfile:
+                sdata = json.load(sfile)
+            segs = DownloadSegments(fullpath, int(sdata['total']), [[int(_) for _ in seg] for seg in sdata['segments']])
+            assert segs.segments and all(0 <= s <= e < segs.total and 0 <= d <= 1 + e - s for s, e, d in segs.segments)
+            return segs
+        except Exception:
+            Log.error(f'Error: invalid segments file \'{sidecar}\'! Download will start over')
+            os.remove(sidecar)
+            if os.path.isfile(fullpath):
+                os.remove(fullpath)
+            return None
+
+    @staticmethod
+    def create(fullpath: str, total: int, count: int) -> DownloadSegments:
+        seg_size = total // count
+        segments = [[i * seg_size, (total if i == count - 1 else (i + 1) * seg_size) - 1, 0] for i in range(count)]
+        with open(fullpath, 'wb') as outf:
+            outf.truncate(total)
+        segs = DownloadSegments(fullpath, total, segments)
+        segs.save()
+        return segs
+
+    @staticmethod
+    def remove_for(fullpath: str) -> None:
+        sidecar = DownloadSegments.sidecar_path(fullpath)
+        if os.path.isfile(sidecar):
+            os.remove(sidecar)
+
+    def save(self) -> None:
+        with open(self.sidecar_path(self.fullpath), 'wt', encoding=UTF8) as sfile:
+            json.dump({'total': self.total, 'segments': self.segments}, sfile)
+
+    def done_size(self) -> int:
+        return sum(seg[2] for seg in self.segments)
+
+    def missing(self) -> list[int]:
+        return [i for i, (s, e, d) in enumerate(self.segments) if d < 1 + e - s]
+
+    def first_missing_range(self) -> tuple[int, int]:
+        s, e, d = self.segments[self.missing()[0]]
+        return s + d, e
+
+    def is_complete(self) -> bool:
+        return not self.missing()
+
+
+async def download_segments(vi: VideoInfo, response: ClientResponse, segs: DownloadSegments,
+                            status_checker: ThrottleChecker, request_func: RequestFunc_T) -> None:
+    """
+    Fetches all missing segments concurrently writing them into preallocated file at their offsets.
+    **response** must be serving the first missing segment (starting at its current offset)
+    """
+    vi.set_flag(VideoInfo.Flags.SEGMENTED)
+    vi.segmented_size = segs.done_size()
+    save_lock = AsyncLock()
+
+    async def save_segments() -> None:
+        async with save_lock:
+            await afs.call(segs.save, op='segments')
+
+    async def fetch_segment(afp: AIOFile, idx: int, r: ClientResponse | None) -> None:
+        seg = segs.segments[idx]
+        try:
+            if r is None:
+                r = await request_func({'Range': f'bytes={seg[0] + seg[2]:d}-{seg[1]:d}'})
+                r.raise_for_status()
+                if r.status != 206:
+                    raise OSError(f'{vi.sfsname} segment {idx + 1:d}: server ignored range request ({r.status:d})!')
+            status_checker.add_response(r)
+            last_saved = seg[2]
+            async for chunk in r.content.iter_chunked(128 * Mem.KB):
+                remaining = 1 + seg[1] - seg[0] - seg[2]
+                if len(chunk) > remaining:
+                    chunk = chunk[:remaining]
+                await afp.write(chunk, seg[0] + seg[2])
+                seg[2] += len(chunk)
+                vi.segmented_size += len(chunk)
+                vi.bytes_written += len(chunk)
+                if seg[2] - last_saved >= DOWNLOAD_SEGMENT_SAVE_STEP * Mem.MB:
+                    await save_segments()
+                    last_saved = seg[2]
+                if len(chunk) == remaining:
+                    break
+        finally:
+            if r is not None:
+                status_checker.remove_response(r)
+                ensure_conn_closed(r)
+
+    missing = segs.missing()
+    Log.trace(f'[segments] {vi.sfsname}: fetching {len(missing):d} / {len(segs.segments):d} segment(s)')
+    try:
+        async with AIOFile(vi.my_fullpath, 'r+b') as afp:
+            results = await gather(*(fetch_segment(afp, idx, response if i == 0 else None) for i, idx in enumerate(missing)),
+                                   return_exceptions=True)
+    finally:
+        await save_segments()
+    if errors := [res for res in results if isinstance(res, BaseException)]:
+        raise errors[0]
+    if not segs.is_complete():
+        raise OSError(f'{vi.sfsname}: {len(segs.missing()):d} segment(s) were not completed!')
+    await afs.call(DownloadSegments.remove_for, vi.my_fullpath, op='segments')
+
+#
+#
+#########################################
@@ -6,32 +6,48 @@ Author: trickerer (https://github.com/trickerer, https://github.com/trickerer01)
 #
 #
 
-import os
 from asyncio import CancelledError, Task, get_running_loop, sleep
 from collections import deque
 
 from aiohttp import ClientResponse
 
 from .config import Config
-from .defs import DOWNLOAD_STATUS_CHECK_TIMER, Mem
+from .defs import THROTTLE_CHECK_INTERVAL, THROTTLE_CHECK_WINDOW, Mem
 from .downloader import VideoDownloadWorker
 from .iinfo import VideoInfo
 from .logger import Log
 
 
 class ThrottleChecker:
+    """
+    Watches download speed of a single file using bytes received counter, no file system calls involved.
+    Speed is averaged over a sliding window of THROTTLE_CHECK_WINDOW seconds sampled every THROTTLE_CHECK_INTERVAL seconds.
+    Once window is filled and average speed is below threshold all active connections are dropped
+    """
     def __init__(self, vi: VideoInfo) -> None:
         self._vi = vi
         self._init_size = 0
+        self._init_bytes_written = 0
+        self._samples = deque[tuple[float, int]]()
+        '''(time, bytes written) samples covering last window'''
         self._slow_download_amount_threshold = ThrottleChecker._orig_threshold()
         self._interrupted_speeds = deque[float](maxlen=3)
         self._speeds = deque[str](maxlen=5)
-        self._response: ClientResponse | None = None
+        self._responses: list[ClientResponse] = []
         self._checker: Task | None = None
 
     def prepare(self, response: ClientResponse, init_size: int) -> None:
         self._init_size = init_size
-        self._response = response
+        self._init_bytes_written = self._vi.bytes_written
+        self._responses = [response]
+
+    def add_response(self, response: ClientResponse) -> None:
+        if response not in self._responses:
+            self._responses.append(response)
+
+    def remove_response(self, response: ClientResponse) -> None:
+        if response in self._responses:
+            self._responses.remove(response)
 
     def run(self) -> None:
         assert self._checker is None
@@ -41,8 +57,9 @@ class ThrottleChecker:
         if self._checker is not None:
             self._checker.cancel()
             self._checker = None
-        self._response = None
+        self._responses.clear()
         self._speeds.clear()
+        self._samples.clear()
 
     @staticmethod
     def _orig_threshold() -> int:
@@ -50,11 +67,11 @@ class ThrottleChecker:
 
     @staticmethod
     def _calc_threshold(speed: int | float) -> int:
-        return max(1, int(DOWNLOAD_STATUS_CHECK_TIMER * speed * Mem.KB))
+        return max(1, int(THROTTLE_CHECK_WINDOW * speed * Mem.KB))
 
     @staticmethod
     def _calc_speed(threshold: int) -> float:
-        return threshold / Mem.KB / DOWNLOAD_STATUS_CHECK_TIMER
+        return threshold / Mem.KB / THROTTLE_CHECK_WINDOW
 
     def _recalculate_slow_download_amount_threshold(self) -> None:
         # Hyperbolic averaging with additional 2% off to prevent cycling interruptions in case of perfect connection stability
@@ -63,27 +80,42 @@ class ThrottleChecker:
         Log.trace(f'[throttler] recalculation, speeds + threshold: {all_speeds!s}. New speed threshold: {avg_speed:.6f} KB/s')
         self._slow_download_amount_threshold = self._calc_threshold(avg_speed)
 
+    def _add_sample(self, now: float) -> tuple[float, int] | None:
+        """Stores current bytes counter, returns (seconds, bytes received) over the full window if it's filled already"""
+        self._samples.append((now, self._vi.bytes_written))
+        while len(self._samples) > 1 and now - self._samples[1][0] >= THROTTLE_CHECK_WINDOW:
+            self._samples.popleft()
+        (time_first, bytes_first), (time_last, bytes_last) = self._samples[0], self._samples[-1]
+        return (time_last - time_first, bytes_last - bytes_first) if time_last - time_first >= THROTTLE_CHECK_WINDOW else None
+
     async def _check_video_download_status(self) -> None:
         dwn = VideoDownloadWorker.get()
-        dest = self._vi.my_fullpath
-        last_size = self._init_size
+        loop = get_running_loop()
         try:
+            self._add_sample(loop.time())
             while True:
-                await sleep(float(DOWNLOAD_STATUS_CHECK_TIMER))
+                await sleep(float(THROTTLE_CHECK_INTERVAL))
                 if not await dwn.is_writing(self._vi):  # finished already
                     Log.error(f'[throttler] {self._vi.sfsname} checker is still running for finished download!')
                     break
-                if self._response is None:
-                    Log.debug(f'[throttler] {self._vi.sfsname} self._response is None...')
+                if not self._responses:
+                    Log.debug(f'[throttler] {self._vi.sfsname} has no active responses...')
+                    self._samples.clear()
+                    continue
+                window = self._add_sample(loop.time())
+                if window is None:
                     continue
-                file_size = os.stat(dest).st_size if os.path.isfile(dest) else 0
-                last_speed = (file_size - last_size) / Mem.KB / DOWNLOAD_STATUS_CHECK_TIMER
+                window_seconds, window_bytes = window
+                last_speed = window_bytes / Mem.KB / window_seconds
                 self._speeds.append(f'{last_speed:.2f} KB/s')
-                if file_size < last_size + self._slow_download_amount_threshold:
+                if window_bytes < self._slow_download_amount_threshold * window_seconds / THROTTLE_CHECK_WINDOW:
+                    file_size = self._init_size + self._vi.bytes_written - self._init_bytes_written
                     Log.warn(f'[throttler] {self._vi.sfsname} check failed at {file_size:d} ({last_speed:.2f} KB/s)! '
                              f'Interrupting current try...')
                     self._vi.last_check_size = file_size
-                    self._response.connection.transport.abort()  # abort download task (forcefully - close connection)
+                    for response in list(self._responses):
+                        if response.connection is not None:
+                            response.connection.transport.abort()  # abort download task (forcefully - close connection)
                     # calculate normalized threshold if needed
                     if Config.throttle_auto is True and self._orig_threshold() > 10 * Mem.KB:
                         self._interrupted_speeds.append(last_speed)
@@ -93,7 +125,6 @@ class ThrottleChecker:
                     break
                 else:
                     self._interrupted_speeds.clear()
-                last_size = file_size
         except CancelledError:
             pass
 
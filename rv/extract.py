@@ -0,0 +1,140 @@
+# coding=UTF-8
+"""
+Author: trickerer (https://github.com/trickerer, https://github.com/trickerer01)
+"""
+#########################################
+#
+#
+
+from __future__ import annotations
+
+from collections.abc import Callable
+from typing import NamedTuple, TypeVar
+
+from bs4 import BeautifulSoup
+
+from .defs import UTF8, StrPair
+from .rex import re_paginator, re_time
+
+__all__ = ('HTML_PARSER', 'ListingPageData', 'VideoPageData', 'extract_listing_page', 'extract_raw', 'extract_video_page', 'make_soup')
+
+T = TypeVar('T')
+
+
+def _select_html_parser() -> str:
+    try:
+        import lxml  # noqa: F401
+        return 'lxml'
+    except ImportError:
+        return 'html.parser'
+
+
+HTML_PARSER = _select_html_parser()
+'''**lxml** if installed, **html.parser** otherwise'''
+
+
+def make_soup(raw: bytes | str | None, parser: str = '') -> BeautifulSoup:
+    return BeautifulSoup(raw, parser or HTML_PARSER, from_encoding=UTF8 if isinstance(raw, bytes) else None) if raw else BeautifulSoup()
+
+
+class VideoPageData(NamedTuple):
+    """Everything scan_video() needs from a video popup page. **None** means the section was not found"""
+    is_maintenance: bool
+    is_404: bool
+    title: str
+    duration: str | None
+    voters: str | None
+    arts: list[str] | None
+    cats: list[str] | None
+    uploader: str | None
+    tags: list[str] | None
+    description: str | None
+    comments: list[StrPair]
+    links: list[StrPair] | None
+    message: str | None
+
+
+class ListingPageData(NamedTuple):
+    """Everything process_pages() needs from a search / listing page"""
+    maxpage: int
+    video_refs: list[tuple[str, str, str]]
+    '''(href, title, duration)'''
+    previews: list[tuple[str, str, str]] | None
+    '''(preview link, title, href), **None** if previews container is missing'''
+
+
+def _section(soup: BeautifulSoup, name: str):
+    div = soup.find('div', string=name)
+    return div.parent if div is not None else None
+
+
+def extract_video_page(soup: BeautifulSoup, *, with_comments=False) -> VideoPageData:
+    is_maintenance = soup.find('title', string=lambda x: 'Maintenance' in x) is not None
+    is_404 = not is_maintenance and soup.find('title', string='404 Not Found') is not None
+    if is_maintenance or is_404:
+        return VideoPageData(is_maintenance, is_404, '', None, None, None, None, None, None, None, [], None, None)
+
+    titleh1 = soup.find('h1', class_='title_video')
+    title = titleh1.text if titleh1 else ''
+    try:
+        duration = str(soup.find('div', class_='info row').find('span', string=re_time).text)
+    except Exception:
+        duration = None
+    voters_span = soup.find('span', class_='voters count')
+    voters = voters_span.text if voters_span is not None else None
+    arts_div = _section(soup, 'Artist')
+    arts = [str(a.string).lower() for a in arts_div.find_all('span', class_='name')] if arts_div is not None else None
+    cats_div = _section(soup, 'Categories')
+    cats = [str(c.string).lower() for c in cats_div.find_all('span', class_=False)] if cats_div is not None else None
+    uploader_div = _section(soup, 'Uploaded by')
+    uploader_a = uploader_div.find('a') if uploader_div is not None else None
+    uploader = str(uploader_a.get_text(strip=True)).lower() if uploader_a is not None else None
+    tags_div = _section(soup, 'Tags')
+    tags = [str(elem.string) for elem in tags_div.find_all('a', class_='tag_item')] if tags_div is not None else None
+    description: str | None = None
+    comments: list[StrPair] = []
+    if with_comments:
+        desc_em = soup.find('em')  # exactly one
+        description = desc_em.get_text('\n') if desc_em is not None else None
+        for cidiv in soup.find_all('div', class_='comment-info'):
+            cudiv, ctdiv = cidiv.find('a'), cidiv.find('div', class_='coment-text')
+            if cudiv is not None and ctdiv is not None:
+                comments.append(StrPair(cudiv.text, ctdiv.get_text('\n')))
+    download_div = _section(soup, 'Download')
+    links = ([StrPair(lin.text, lin.get('href')) for lin in download_div.find_all('a', class_='tag_item')]
+             if download_div is not None else None)
+    message_span = soup.find('span', class_='message') if links is None else None
+    message = message_span.text if message_span is not None else None
+    return VideoPageData(False, False, title, duration, voters, arts, cats, uploader, tags, description, comments, links, message)
+
+
+def extract_listing_page(soup: BeautifulSoup, video_ref_class: str, *, with_previews=False) -> ListingPageData:
+    maxpage = 0
+    for page_ajax in soup.find_all('a', attrs={'data-action': 'ajax'}):
+        try:
+            maxpage = max(maxpage, int(re_paginator.search(str(page_ajax.get('data-parameters'))).group(1)))
+        except Exception:
+            pass
+    video_refs: list[tuple[str, str, str]] = []
+    for aref in soup.find_all('a', class_=video_ref_class):
+        title_div, time_div = aref.find('div', class_='thumb_title'), aref.find('div', class_='time')
+        video_refs.append((str(aref.get('href')), str(title_div.text) if title_div else '', str(time_div.text) if time_div else ''))
+    previews: list[tuple[str, str, str]] | None = None
+    if with_previews:
+        content_div = soup.find('div', class_='thumbs clearfix')
+        if content_div is not None:
+            prev_all = content_div.find_all('div', class_='img wrap_image')
+            titl_all = content_div.find_all('div', class_='thumb_title')
+            utitl_all = content_div.find_all('a', class_='th js-open-popup')
+            previews = [(str(p.get('data-preview')), str(t.text), str(u['href']))
+                        for p, t, u in zip(prev_all, titl_all, utitl_all, strict=False)]
+    return ListingPageData(maxpage, video_refs, previews)
+
+
+def extract_raw(extract_func: Callable[..., T], raw: bytes, *args, **kwargs) -> T:
+    """Parses **raw** html and extracts page data from it with **extract_func**. Can be executed in a parser worker process"""
+    return extract_func(make_soup(raw), *args, **kwargs)
+
+#
+#
+#########################################
@@ -8,27 +8,56 @@ Author: trickerer (https://github.com/trickerer, https://github.com/trickerer01)
 
 from __future__ import annotations
 
+import functools
 import random
+import time
 import urllib.parse
-from asyncio import AbstractEventLoop, get_running_loop, sleep
-from asyncio import Lock as AsyncLock
+from asyncio import AbstractEventLoop, CancelledError, Future, TimerHandle, get_running_loop, sleep
 from collections import deque
+from collections.abc import Callable
 from contextlib import AsyncExitStack
-
-from aiohttp import ClientConnectorError, ClientResponse, ClientResponseError, ClientSession, TCPConnector
+from types import SimpleNamespace
+from typing import TypeVar
+
+from aiohttp import (
+    ClientConnectorError,
+    ClientResponse,
+    ClientResponseError,
+    ClientSession,
+    TCPConnector,
+    TraceConfig,
+    TraceConnectionCreateEndParams,
+    TraceConnectionQueuedEndParams,
+    TraceConnectionQueuedStartParams,
+    TraceConnectionReuseconnParams,
+)
 from aiohttp_socks import ProxyConnector
 from bs4 import BeautifulSoup
 from fake_useragent import FakeUserAgent
 
 from .config import Config
-from .defs import CONNECT_REQUEST_DELAY, CONNECT_RETRY_DELAY, MAX_SCAN_QUEUE_SIZE, MAX_VIDEOS_QUEUE_SIZE, UTF8, Mem
+from .defs import (
+    CONNECT_DNS_CACHE_TTL,
+    CONNECT_REQUEST_DELAY,
+    CONNECT_REQUEST_DELAY_SPREAD,
+    CONNECT_RETRY_DELAY,
+    MAX_SCAN_QUEUE_SIZE,
+    MAX_VIDEOS_QUEUE_SIZE,
+    SITE,
+    Mem,
+)
+from .extract import extract_raw, make_soup
 from .logger import Log
+from .metrics import Metrics
+from .parse_pool import ParsePool
 
-__all__ = ('create_session', 'ensure_conn_closed', 'fetch_html', 'fetch_html_raw', 'wrap_request')
+__all__ = ('ClientSessionWrapper', 'create_session', 'ensure_conn_closed', 'fetch_html', 'fetch_html_raw', 'fetch_page', 'wrap_request')
 
 USER_AGENT_DEFAULT = 'Mozilla/5.0 (X11; Linux x86_64; rv:102.0) Gecko/20100101 Goanna/6.7 Firefox/102.0 PaleMoon/33.3.1'
 ua_generator = FakeUserAgent(browsers=('Firefox',), platforms=('desktop',), fallback=USER_AGENT_DEFAULT)
 
+T = TypeVar('T')
+
 sessionw: ClientSessionWrapper | None = None
 
 
@@ -58,16 +87,42 @@ class UAManager:
         return ua
 
 
+def _make_trace_config(pool: str) -> TraceConfig:
+    async def on_queued_start(_: ClientSession, ctx: SimpleNamespace, __: TraceConnectionQueuedStartParams) -> None:
+        ctx.queued_at = time.perf_counter()
+
+    async def on_queued_end(_: ClientSession, ctx: SimpleNamespace, __: TraceConnectionQueuedEndParams) -> None:
+        Metrics.observe('http_connection_wait_seconds', time.perf_counter() - ctx.queued_at, pool=pool)
+
+    async def on_create_end(_: ClientSession, __: SimpleNamespace, ___: TraceConnectionCreateEndParams) -> None:
+        Metrics.inc('http_connections_total', pool=pool, kind='new')
+
+    async def on_reuseconn(_: ClientSession, __: SimpleNamespace, ___: TraceConnectionReuseconnParams) -> None:
+        Metrics.inc('http_connections_total', pool=pool, kind='reused')
+
+    trace_config = TraceConfig()
+    trace_config.on_connection_queued_start.append(on_queued_start)
+    trace_config.on_connection_queued_end.append(on_queued_end)
+    trace_config.on_connection_create_end.append(on_create_end)
+    trace_config.on_connection_reuseconn.append(on_reuseconn)
+    return trace_config
+
+
 class ClientSessionWrapper:
     """
-    ClientSessionWrapper
+    ClientSessionWrapper\n
+    Holds separate connection pools for html pages and media so long-lived video streams never hold up short page requests.
+    Each pool has a proxied and a direct session
     """
-    PSESSION_INDEX = 0
-    NPSESSION_INDEX = 1
+    POOL_HTML = 'html'
+    POOL_MEDIA = 'media'
 
     def __init__(self) -> None:
         self._exitstack = AsyncExitStack()
-        self._sessions = (self.make_session(), self.make_session(True))
+        self._sessions: dict[tuple[str, bool], ClientSession] = {
+            (pool, noproxy): self.make_session(pool, noproxy)
+            for pool in (ClientSessionWrapper.POOL_HTML, ClientSessionWrapper.POOL_MEDIA) for noproxy in (False, True)
+        }
         self.default_exc_handler = get_running_loop().get_exception_handler()
         get_running_loop().set_exception_handler(self.ignore_unclosed_session_exc_handler)
 
@@ -75,7 +130,7 @@ class ClientSessionWrapper:
         global sessionw
         assert sessionw is None
         sessionw = self
-        [await self._exitstack.enter_async_context(s) for s in self._sessions]
+        [await self._exitstack.enter_async_context(s) for s in self._sessions.values()]
         return self
 
     async def __aexit__(self, exc_type, exc_val, exc_tb) -> None:
@@ -84,13 +139,8 @@ class ClientSessionWrapper:
         sessionw = None
         await self._exitstack.aclose()
 
-    @property
-    def psession(self) -> ClientSession:
-        return self._sessions[ClientSessionWrapper.PSESSION_INDEX]
-
-    @property
-    def npsession(self) -> ClientSession:
-        return self._sessions[ClientSessionWrapper.NPSESSION_INDEX]
+    def get_session(self, pool: str, noproxy: bool) -> ClientSession:
+        return self._sessions[(pool, noproxy)]
 
     @staticmethod
     def ignore_unclosed_session_exc_handler(selfloop: AbstractEventLoop, context: dict) -> None:
@@ -101,15 +151,23 @@ class ClientSessionWrapper:
             Log.trace(f'{message} exception ignored...')
 
     @staticmethod
-    def make_session(noproxy=False) -> ClientSession:
+    def pool_limit(pool: str) -> int:
+        if pool == ClientSessionWrapper.POOL_MEDIA:
+            return Config.media_connections or MAX_VIDEOS_QUEUE_SIZE * max(Config.download_segments, 1)
+        return Config.html_connections or max(MAX_SCAN_QUEUE_SIZE, Config.scan_tasks) + Config.page_prefetch + 1
+
+    @staticmethod
+    def make_session(pool: str, noproxy=False, limit=0) -> ClientSession:
         use_proxy = Config.proxy and noproxy is False
+        conn_kwargs = {'limit': limit or ClientSessionWrapper.pool_limit(pool), 'limit_per_host': Config.connections_per_host,
+                       'keepalive_timeout': float(Config.keepalive_timeout), 'ttl_dns_cache': CONNECT_DNS_CACHE_TTL}
         if use_proxy:
-            connector = ProxyConnector.from_url(Config.proxy, limit=MAX_VIDEOS_QUEUE_SIZE + MAX_SCAN_QUEUE_SIZE)
+            connector = ProxyConnector.from_url(Config.proxy, **conn_kwargs)
         else:
-            connector = TCPConnector(limit=MAX_VIDEOS_QUEUE_SIZE + MAX_SCAN_QUEUE_SIZE)
-        s = ClientSession(connector=connector, read_bufsize=Mem.MB)
+            connector = TCPConnector(**conn_kwargs)
+        s = ClientSession(connector=connector, read_bufsize=Mem.MB, trace_configs=[_make_trace_config(pool)] if Metrics.enabled else None)
         new_useragent = UAManager.select_useragent(Config.proxy if use_proxy else None)
-        Log.trace(f'[{"P" if use_proxy else "NP"}] Selected user-agent \'{new_useragent}\'...')
+        Log.trace(f'[{pool}][{"P" if use_proxy else "NP"}] Selected user-agent \'{new_useragent}\'...')
         s.headers.update({'User-Agent': new_useragent})
         # s.cookie_jar.update_cookies({'kt_rt_popAccess': '1'})
         s.cookie_jar.update_cookies({'kt_tcookie': '1', 'kt_is_visited': '1'})
@@ -124,35 +182,100 @@ class ClientSessionWrapper:
         return s
 
 
+class TokenBucket:
+    """
+    Request rate limiter for a single host\n
+    Holds up to **burst** tokens, one token is restored every refill interval. Waiters are served in FIFO order
+    """
+    def __init__(self, rate: float, burst: int) -> None:
+        self._rate: float = rate
+        self._burst: int = max(burst, 1)
+        self._tokens: int = self._burst
+        self._next_token_at: float = 0.0
+        self._waiters = deque[Future[None]]()
+        self._wake_handle: TimerHandle | None = None
+
+    def _interval(self) -> float:
+        if self._rate > 0.0:
+            return 1.0 / self._rate
+        return random.uniform(CONNECT_REQUEST_DELAY, CONNECT_REQUEST_DELAY + CONNECT_REQUEST_DELAY_SPREAD)
+
+    def _refill(self, now: float) -> None:
+        while self._tokens < self._burst and now >= self._next_token_at:
+            self._tokens += 1
+            if self._tokens < self._burst:
+                self._next_token_at += self._interval()
+
+    def _take(self, now: float) -> None:
+        if self._tokens == self._burst:
+            self._next_token_at = now + self._interval()
+        self._tokens -= 1
+
+    def _schedule_wake(self, loop: AbstractEventLoop) -> None:
+        if self._wake_handle is None and self._waiters:
+            self._wake_handle = loop.call_at(self._next_token_at, self._wake, loop)
+
+    def _wake(self, loop: AbstractEventLoop) -> None:
+        self._wake_handle = None
+        self._refill(loop.time())
+        while self._waiters and self._tokens > 0:
+            waiter = self._waiters.popleft()
+            if not waiter.done():
+                self._take(loop.time())
+                waiter.set_result(None)
+        self._schedule_wake(loop)
+
+    def reset(self) -> None:
+        if self._wake_handle is not None:
+            self._wake_handle.cancel()
+            self._wake_handle = None
+        for waiter in self._waiters:
+            waiter.cancel()
+        self._waiters.clear()
+        self._tokens = self._burst
+
+    async def acquire(self) -> None:
+        loop = get_running_loop()
+        self._refill(loop.time())
+        if not self._waiters and self._tokens > 0:
+            self._take(loop.time())
+            return
+        waiter = loop.create_future()
+        self._waiters.append(waiter)
+        self._schedule_wake(loop)
+        try:
+            await waiter
+        except CancelledError:
+            if waiter.done() and not waiter.cancelled():
+                # token was granted but never used, pass it on
+                self._tokens += 1
+                self._wake(loop)
+            raise
+
+
 class RequestQueue:
     """
-    Request delayed queue wrapper
+    Request delayed queue wrapper. Paces requests using a separate token bucket for each host
     """
-    _queue = deque[str]()
-    _ready = True
-    _lock = AsyncLock()
+    _buckets: dict[str, TokenBucket] = {}
 
     @staticmethod
     def _reset() -> None:
-        RequestQueue._ready = True
-        RequestQueue._queue.clear()
+        for bucket in RequestQueue._buckets.values():
+            bucket.reset()
+        RequestQueue._buckets.clear()
 
     @staticmethod
-    async def _set_ready() -> None:
-        await sleep(random.uniform(CONNECT_REQUEST_DELAY, CONNECT_REQUEST_DELAY + 0.75))
-        RequestQueue._ready = True
+    def _get_bucket(url: str) -> TokenBucket:
+        host = urllib.parse.urlparse(url).hostname or ''
+        if host not in RequestQueue._buckets:
+            RequestQueue._buckets[host] = TokenBucket(Config.request_rate, Config.request_burst)
+        return RequestQueue._buckets[host]
 
     @staticmethod
     async def until_ready(url: str) -> None:
-        """Pauses request until base delay passes (since last request)"""
-        async with RequestQueue._lock:
-            RequestQueue._queue.append(url)
-        while RequestQueue._ready is False or RequestQueue._queue[0] != url:
-            await sleep(0.2)
-        async with RequestQueue._lock:
-            RequestQueue._queue.popleft()
-            RequestQueue._ready = False
-            get_running_loop().create_task(RequestQueue._set_ready())
+        """Pauses request until host's request rate allows it"""
+        await RequestQueue._get_bucket(url).acquire()
 
 
 def ensure_conn_closed(r: ClientResponse | None) -> None:
@@ -164,14 +287,17 @@ def create_session() -> ClientSessionWrapper:
     return ClientSessionWrapper()
 
 
-async def wrap_request(method: str, url: str, **kwargs) -> ClientResponse:
-    """Queues request, updating headers/proxies beforehand, and returns the response"""
+async def wrap_request(method: str, url: str, *, pool=ClientSessionWrapper.POOL_HTML, **kwargs) -> ClientResponse:
+    """Queues request, updating headers/proxies beforehand, and returns the response. **pool** selects connection pool to use"""
+    if Config.site_base_url != SITE:
+        url = url.replace(SITE, Config.site_base_url, 1)
     if Config.nodelay is False:
-        await RequestQueue.until_ready(url)
+        with Metrics.timer('rate_limit_wait_seconds'):
+            await RequestQueue.until_ready(url)
     if 'timeout' not in kwargs:
         kwargs.update(timeout=Config.timeout)
     noproxy = kwargs.pop('noproxy', False)
-    r = await (sessionw.npsession if noproxy else sessionw.psession).request(method, url, **kwargs)
+    r = await sessionw.get_session(pool, noproxy).request(method, url, **kwargs)
     return r
 
 
@@ -202,6 +328,7 @@ async def fetch_html_raw(url: str, *, tries=0, **kwargs) -> bytes | None:
             else:
                 Log.error(f'[{retries + 1:d}] fetch_html exception status {f"{r.status:d}" if r is not None else "???"}: '
                           f'\'{e.message if isinstance(e, ClientResponseError) else e!s}\'')
+            Metrics.inc('html_retries_total', status=f'{r.status:d}' if r is not None else e.__class__.__name__)
             if (r is None or r.status != 403) and not isinstance(e, ClientConnectorError):
                 retries += 1
             elif r is not None and r.status == 403:
@@ -222,8 +349,29 @@ async def fetch_html_raw(url: str, *, tries=0, **kwargs) -> bytes | None:
 
 
 async def fetch_html(url: str, *, tries=0, **kwargs) -> BeautifulSoup:
-    raw = await fetch_html_raw(url, tries=tries, **kwargs)
-    return BeautifulSoup(raw, 'html.parser', from_encoding=UTF8) if raw else BeautifulSoup()
+    with Metrics.timer('html_fetch_seconds'):
+        raw = await fetch_html_raw(url, tries=tries, **kwargs)
+    with Metrics.timer('html_parse_seconds', stage='soup'):
+        return make_soup(raw)
+
+
+async def fetch_page(url: str, extract_func: Callable[..., T], *args, **kwargs) -> T | None:
+    """
+    Fetches html page and extracts plain page data from it using **extract_func** called with soup and extra arguments.
+    With parser processes enabled (see -parseproc) page is parsed in a worker process and event loop only does I/O.
+    Returns **None** if page could not be retrieved or is empty
+    """
+    with Metrics.timer('html_fetch_seconds'):
+        raw = await fetch_html_raw(url)
+    if not raw:
+        return None
+    if pool := ParsePool.get():
+        with Metrics.timer('html_parse_seconds', stage='process'):
+            return await pool.run(functools.partial(extract_raw, extract_func, raw, *args, **kwargs))
+    with Metrics.timer('html_parse_seconds', stage='soup'):
+        soup = make_soup(raw)
+    with Metrics.timer('html_parse_seconds', stage='extract'):
+        return extract_func(soup, *args, **kwargs)
 
 #
 #
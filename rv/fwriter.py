@@ -0,0 +1,136 @@
+# coding=UTF-8
+"""
+Author: trickerer (https://github.com/trickerer, https://github.com/trickerer01)
+"""
+#########################################
+#
+#
+
+from __future__ import annotations
+
+import os
+from asyncio import Future, get_running_loop
+
+from . import afs
+from .config import Config
+from .defs import DOWNLOAD_SEGMENT_SAVE_STEP, WRITE_ALIGNMENT, Mem
+from .dsegments import DownloadSegments
+from .logger import Log
+
+__all__ = ('FileWriter',)
+
+
+def _pwrite_all(fd: int, data: memoryview, offset: int) -> None:
+    while data:
+        if hasattr(os, 'pwrite'):
+            nbytes = os.pwrite(fd, data, offset)
+        else:
+            os.lseek(fd, offset, os.SEEK_SET)
+            nbytes = os.write(fd, data)
+        data = data[nbytes:]
+        offset += nbytes
+
+
+class FileWriter:
+    """
+    Buffered writer for downloaded data. Incoming chunks are coalesced into two reusable buffers, a full buffer is written out
+    in a single block ending at aligned file offset while the other one is being filled.
+    If **total** file size is known file is preallocated up front and trimmed back to actually written size on close.
+    Progress of preallocated file is stored in a segments file so it remains resumable even if the app gets killed
+    """
+    def __init__(self, fullpath: str, offset: int, total=0, buffer_size=0) -> None:
+        self._fullpath: str = fullpath
+        self._total: int = total
+        self._offset: int = offset
+        '''file offset of the buffer being filled'''
+        self._done_offset: int = offset
+        '''file offset up to which all writes are completed'''
+        buffer_size = max(buffer_size or Config.write_buffer_size * Mem.KB, WRITE_ALIGNMENT)
+        self._buffers: tuple[bytearray, bytearray] = (bytearray(buffer_size), bytearray(buffer_size))
+        self._buf_idx: int = 0
+        self._fill: int = 0
+        self._fd: int = -1
+        self._pending: Future[None] | None = None
+        self._segs: DownloadSegments | None = None
+        self._last_saved: int = offset
+
+    async def __aenter__(self) -> FileWriter:
+        flags = os.O_WRONLY | os.O_CREAT | (os.O_TRUNC if self._offset == 0 else 0) | getattr(os, 'O_BINARY', 0)
+        self._fd = await afs.call(os.open, self._fullpath, flags, 0o666, op='open')
+        if self._total > self._offset and hasattr(os, 'posix_fallocate'):
+            self._segs = DownloadSegments(self._fullpath, self._total, [[0, self._total - 1, self._offset]])
+            try:
+                await afs.call(self._segs.save, op='segments')
+                await afs.call(os.posix_fallocate, self._fd, self._offset, self._total - self._offset, op='fallocate')
+            except OSError as e:
+                Log.debug(f'Unable to preallocate {self._total - self._offset:d} bytes for \'{self._fullpath}\': {e!s}')
+                await afs.call(DownloadSegments.remove_for, self._fullpath, op='segments')
+                self._segs = None
+        return self
+
+    async def __aexit__(self, exc_type, exc_val, exc_tb) -> None:
+        try:
+            # data which is already received is written even on failure so download can be continued from there
+            if self._fill:
+                await self._flush(True)
+            await self._wait_pending()
+        finally:
+            if self._segs is not None:
+                if self._done_offset < self._total:
+                    await afs.call(os.ftruncate, self._fd, self._done_offset, op='truncate')
+                await afs.call(DownloadSegments.remove_for, self._fullpath, op='segments')
+            await afs.call(os.close, self._fd, op='close')
+
+    @property
+    def preallocated(self) -> bool:
+        return self._segs is not None
+
+    @property
+    def written(self) -> int:
+        """Total file size once all buffered data is written"""
+        return self._offset + self._fill
+
+    async def _wait_pending(self) -> None:
+        if self._pending is not None:
+            pending, self._pending = self._pending, None
+            await pending
+            self._done_offset = self._offset
+            if self._segs is not None and self._done_offset - self._last_saved >= DOWNLOAD_SEGMENT_SAVE_STEP * Mem.MB:
+                self._segs.segments[0][2] = self._last_saved = self._done_offset
+                await afs.call(self._segs.save, op='segments')
+
+    async def _submit(self, data: memoryview) -> None:
+        await self._wait_pending()
+        self._pending = get_running_loop().run_in_executor(None, _pwrite_all, self._fd, data, self._offset)
+        self._offset += len(data)
+
+    async def _flush(self, final=False) -> None:
+        buf = self._buffers[self._buf_idx]
+        nbytes = self._fill if final else self._fill - (self._offset + self._fill) % WRITE_ALIGNMENT
+        await self._submit(memoryview(buf)[:nbytes])
+        self._buf_idx ^= 1
+        tail = self._fill - nbytes
+        if tail:
+            self._buffers[self._buf_idx][:tail] = buf[nbytes:self._fill]
+        self._fill = tail
+
+    async def write(self, chunk: bytes) -> None:
+        view = memoryview(chunk)
+        while view:
+            buf = self._buffers[self._buf_idx]
+            if self._fill == 0 and len(view) >= len(buf):
+                # big enough to be written as is, no need to copy
+                nbytes = len(view) - (self._offset + len(view)) % WRITE_ALIGNMENT
+                await self._submit(view[:nbytes])
+                view = view[nbytes:]
+                continue
+            nbytes = min(len(buf) - self._fill, len(view))
+            buf[self._fill:self._fill + nbytes] = view[:nbytes]
+            self._fill += nbytes
+            view = view[nbytes:]
+            if self._fill == len(buf):
+                await self._flush()
+
+#
+#
+#########################################
@@ -9,6 +9,7 @@ Author: trickerer (https://github.com/trickerer, https://github.com/trickerer01)
 from __future__ import annotations
 
 import itertools
+from collections import deque
 
 from .config import Config
 from .defs import IDGAP_PREDICTION_AUTO, IDGAP_PREDICTION_OFF, PREDICTION_REENABLE_THRESHOLD, IntPair
@@ -36,6 +37,8 @@ class IdGapsPredictor:
         self._enabled = Config.predict_id_gaps != IDGAP_PREDICTION_OFF
         self._streak = 0
         self._streaks_count = 0
+        self._predicted: deque[int] = deque(maxlen=max(num_skip for _, num_skip in ID_SKIPS))
+        '''ids most recently forced to 404, those may never be queued'''
 
     @staticmethod
     def get() -> IdGapsPredictor:
@@ -44,16 +47,21 @@ class IdGapsPredictor:
         return IdGapsPredictor._instance
 
     @staticmethod
-    def _get_skip_num(vi: VideoInfo) -> int:
+    def _get_skip_num(id_: int) -> int:
         for idpair, num_skip in reversed(ID_SKIPS):
-            if idpair.first <= vi.id <= idpair.second:
+            if idpair.first <= id_ <= idpair.second:
                 return num_skip
         return 0
 
-    def need_skip(self, vi: VideoInfo) -> int:
-        if num_skip := (self._get_skip_num(vi) if self._enabled else 0):
-            prevs = tuple(VideoScanWorker.get().find_vinfo_last(vi.id - (_ + 1)) for _ in range(num_skip - 1))
-            prev_stats = tuple((bool(prevs[i]), prevs[i] and prevs[i].has_flag(VideoInfo.Flags.RETURNED_404)) for i in range(num_skip - 1))
+    def _get_id_stats(self, id_: int) -> tuple[bool, bool]:
+        """(was queued, returned 404)"""
+        if id_ in self._predicted:
+            return True, True
+        return VideoScanWorker.get().get_id_stats(id_)
+
+    def need_skip(self, id_: int) -> int:
+        if num_skip := (self._get_skip_num(id_) if self._enabled else 0):
+            prev_stats = tuple(self._get_id_stats(id_ - (_ + 1)) for _ in range(num_skip - 1))
             f_404s: tuple[bool, ...] = ()
             for i in range(1, num_skip):
                 if all(prev_stats[_][0] for _ in range(num_skip - i)):
@@ -62,6 +70,7 @@ class IdGapsPredictor:
             found_one = len(f_404s) == 1 and prev_stats[0][0] is not prev_stats[0][1]
             found_any = not all(_[0] is _[1] for _ in itertools.pairwise(f_404s))
             if found_one or found_any:
+                self._predicted.append(id_)
                 return num_skip
         return 0
 
@@ -71,7 +80,7 @@ class IdGapsPredictor:
 
     def count_existing(self, vi: VideoInfo) -> None:
         if self._streak:
-            skip_num = self._get_skip_num(vi)
+            skip_num = self._get_skip_num(vi.id)
             streak_is_complimentary = skip_num > 0 and (self._streak + 1) % skip_num == 0
             self._streak = 0
             self._streaks_count = (self._streaks_count + 1) if streak_is_complimentary else 0
@@ -0,0 +1,104 @@
+# coding=UTF-8
+"""
+Author: trickerer (https://github.com/trickerer, https://github.com/trickerer01)
+"""
+#########################################
+#
+#
+
+from __future__ import annotations
+
+import bisect
+from collections.abc import Iterable, Iterator
+
+from .defs import IntPair
+
+__all__ = ('IdPlan',)
+
+ID_MAX = 6000000
+ID_RANGES_NONEXISTENT = (
+    IntPair(236, 3045049),
+)
+
+
+class IdPlan:
+    """
+    Ids sequence as a sorted set of non-overlapping id intervals, with known to be non-existent ids subtracted.
+    Size, membership and iteration from any id are computed from intervals, ids are only generated on demand
+    """
+    def __init__(self, ids: Iterable[int]) -> None:
+        base_runs = self._make_runs(ids)
+        self._runs: list[IntPair] = self._subtract_nonexistent(base_runs)
+        self._firsts: list[int] = [run.first for run in self._runs]
+        self._lens: list[int] = []
+        '''cumulative ids count up to and including each run'''
+        total = 0
+        for run in self._runs:
+            total += 1 + run.second - run.first
+            self._lens.append(total)
+        self.removed_count: int = sum(1 + run.second - run.first for run in base_runs) - total
+
+    @staticmethod
+    def _make_runs(ids: Iterable[int]) -> list[IntPair]:
+        if isinstance(ids, range) and ids.step == 1:
+            return [IntPair(ids.start, ids.stop - 1)] if len(ids) else []
+        runs: list[IntPair] = []
+        for id_ in sorted(set(ids)):
+            if runs and runs[-1].second == id_ - 1:
+                runs[-1] = IntPair(runs[-1].first, id_)
+            else:
+                runs.append(IntPair(id_, id_))
+        return runs
+
+    @staticmethod
+    def _subtract_nonexistent(runs: list[IntPair]) -> list[IntPair]:
+        result: list[IntPair] = []
+        for run in runs:
+            parts = [IntPair(max(run.first, 0), min(run.second, ID_MAX))]
+            for dead in ID_RANGES_NONEXISTENT:
+                parts = [split for part in parts for split in (IntPair(part.first, min(part.second, dead.first - 1)),
+                                                               IntPair(max(part.first, dead.second + 1), part.second))]
+            result.extend(part for part in parts if part.first <= part.second)
+        return result
+
+    def __len__(self) -> int:
+        return self._lens[-1] if self._lens else 0
+
+    def __contains__(self, id_: object) -> bool:
+        if not isinstance(id_, int):
+            return False
+        idx = bisect.bisect_right(self._firsts, id_) - 1
+        return idx >= 0 and id_ <= self._runs[idx].second
+
+    def __iter__(self) -> Iterator[int]:
+        return self.iter_from(0)
+
+    def __str__(self) -> str:
+        return f'[{", ".join(f"{run.first:d}" if run.first == run.second else f"{run.first:d}-{run.second:d}" for run in self._runs)}]'
+
+    __repr__ = __str__
+
+    @property
+    def min_id(self) -> int:
+        return self._runs[0].first if self._runs else 0
+
+    @property
+    def max_id(self) -> int:
+        return self._runs[-1].second if self._runs else 0
+
+    def iter_from(self, id_: int) -> Iterator[int]:
+        """Lazily generates planned ids starting from **id_** (inclusive), in ascending order"""
+        for run in self._runs[max(0, bisect.bisect_right(self._firsts, id_) - 1):]:
+            yield from range(max(run.first, id_), run.second + 1)
+
+    def count_from(self, id_: int) -> int:
+        """Number of planned ids starting from **id_** (inclusive)"""
+        idx = bisect.bisect_right(self._firsts, id_) - 1
+        if idx < 0:
+            return len(self)
+        run = self._runs[idx]
+        return len(self) - self._lens[idx] + max(0, 1 + run.second - max(id_, run.first))
+
+#
+#
+#########################################
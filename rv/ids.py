@@ -6,15 +6,14 @@ Author: trickerer (https://github.com/trickerer, https://github.com/trickerer01)
 #
 #
 
-import itertools
 from asyncio import sleep
 
 from .config import Config
 from .download import download
 from .fetch_html import create_session
-from .iinfo import VideoInfo
+from .idplan import IdPlan
 from .logger import Log
-from .path_util import prefilter_existing_items
+from .path_util import file_already_exists, scan_dest_folder
 from .tagger import extract_id_or_group, extract_ids_from_links
 from .validators import find_and_resolve_config_conflicts
 
@@ -45,27 +44,23 @@ async def process_ids() -> int:
     if find_and_resolve_config_conflicts() is True:
         await sleep(3.0)
 
-    Config.id_sequence = list(itertools.filterfalse(lambda x: 236 <= x <= 3045049 or x < 0 or x > 6000000, base_id_sequence))
-    if removed_count := base_id_sequence_len - len(Config.id_sequence):
+    Config.id_sequence = IdPlan(base_id_sequence)
+    if removed_count := Config.id_sequence.removed_count:
         Log.warn(f'Removed {removed_count:d} known to be non-existent ids!')
 
-    v_entries = [VideoInfo(idi) for idi in Config.id_sequence]
-    orig_count = len(v_entries)
-
-    if orig_count > 0:
-        prefilter_existing_items(v_entries)
-
-    removed_count = orig_count - len(v_entries)
+    if not Config.id_sequence:
+        Log.fatal('\nNo videos found. Aborted.')
+        return -1
 
-    if orig_count == removed_count:
-        if orig_count > 0:
-            Log.fatal(f'\nAll {orig_count:d} videos already exist. Aborted.')
-        else:
-            Log.fatal('\nNo videos found. Aborted.')
+    # existing items are filtered out as planned ids are taken into queue
+    scan_dest_folder()
+    # stops at first id not downloaded yet, only checks the whole plan if everything is already downloaded
+    if not Config.continue_mode and all(file_already_exists(id_, None, False) for id_ in Config.id_sequence):
+        Log.fatal(f'\nAll {len(Config.id_sequence):d} videos already exist. Aborted.')
         return -1
 
     async with create_session():
-        await download(v_entries, True, removed_count)
+        await download([], True, 0, plan=Config.id_sequence)
 
     return 0
 
@@ -9,20 +9,20 @@ Author: trickerer (https://github.com/trickerer, https://github.com/trickerer01)
 from __future__ import annotations
 
 import os
-import re
+import sys
 from collections.abc import Iterable
 from enum import IntEnum
 
 from .config import Config
-from .defs import DEFAULT_EXT, DEFAULT_QUALITY, PREFIX, UTF8, Quality
-from .logger import Log
-from .rex import re_infolist_filename
+from .defs import DEFAULT_EXT, DEFAULT_QUALITY, PREFIX, QUALITIES, Quality
 from .util import format_time, normalize_filename, normalize_path
 
-__all__ = ('VideoInfo', 'export_video_info', 'get_min_max_ids')
+__all__ = ('VideoInfo', 'get_min_max_ids')
 
+QUALITIES_INTERNED: dict[str, Quality] = {q: q for q in QUALITIES}
 
-class VideoInfo:  # up to ~3 Kb (when all info is filled, asizeof)
+
+class VideoInfo:  # ~256 bytes when empty, tags/description/comments are dropped once stored by info list writer
     class State(IntEnum):
         NEW = 0
         QUEUED = 1
@@ -41,17 +41,47 @@ class VideoInfo:  # up to ~3 Kb (when all info is filled, asizeof)
         ALREADY_EXISTED_SIMILAR = 0x2
         FILE_WAS_CREATED = 0x4
         RETURNED_404 = 0x8
+        SEGMENTED = 0x10
+        PREALLOCATED = 0x20
+        RESTORED = 0x40
+        CACHED = 0x80
+
+    __slots__ = (
+        '_flags',
+        '_id',
+        '_quality',
+        '_state',
+        '_subfolder',
+        'bytes_written',
+        'comments',
+        'description',
+        'dstart_time',
+        'duration',
+        'expected_size',
+        'filename',
+        'last_check_size',
+        'last_check_time',
+        'link',
+        'private',
+        'rating',
+        'segmented_size',
+        'start_size',
+        'start_time',
+        'tags',
+        'title',
+        'uploader',
+    )
 
     def __init__(self, m_id: int, m_title='', m_link='', m_subfolder='', m_filename='', m_rating='', m_duration=0) -> None:
         self._id = m_id or 0
 
         self.title: str = m_title or ''
         self.link: str = m_link or ''
-        self.subfolder: str = m_subfolder or ''
+        self.subfolder = m_subfolder or ''
         self.filename: str = m_filename or ''
         self.rating: str = m_rating or ''
         self.duration: int = m_duration or 0
-        self.quality: Quality = Config.quality or DEFAULT_QUALITY
+        self.quality = Config.quality or DEFAULT_QUALITY
         self.tags: str = ''
         self.description: str = ''
         self.comments: str = ''
@@ -59,6 +89,7 @@ class VideoInfo:  # up to ~3 Kb (when all info is filled, asizeof)
         self.private: bool = False
         self.expected_size: int = 0
         self.bytes_written: int = 0
+        self.segmented_size: int = 0
         self.dstart_time: int = 0
         self.start_size: int = 0
         self.start_time: int = 0
@@ -74,9 +105,17 @@ class VideoInfo:  # up to ~3 Kb (when all info is filled, asizeof)
     def set_flag(self, flag: VideoInfo.Flags) -> None:
         self._flags |= flag
 
+    def reset_flag(self, flag: int | VideoInfo.Flags) -> None:
+        self._flags &= ~flag
+
     def has_flag(self, flag: int | VideoInfo.Flags) -> bool:
         return bool(self._flags & flag)
 
+    def get_downloaded_size(self) -> int:
+        if self.has_flag(VideoInfo.Flags.SEGMENTED) or self.has_flag(VideoInfo.Flags.PREALLOCATED):  # file size is not progress
+            return self.segmented_size
+        return os.stat(self.my_fullpath).st_size if os.path.isfile(self.my_fullpath) else 0
+
     def __eq__(self, other: VideoInfo | int) -> bool:
         return self.id == other.id if isinstance(other, type(self)) else self.id == other if isinstance(other, int) else False
 
@@ -88,6 +127,22 @@ class VideoInfo:  # up to ~3 Kb (when all info is filled, asizeof)
     def id(self) -> int:
         return self._id
 
+    @property
+    def subfolder(self) -> str:
+        return self._subfolder
+
+    @subfolder.setter
+    def subfolder(self, subfolder: str) -> None:
+        self._subfolder = sys.intern(subfolder)
+
+    @property
+    def quality(self) -> Quality:
+        return self._quality
+
+    @quality.setter
+    def quality(self, quality: Quality) -> None:
+        self._quality = QUALITIES_INTERNED.get(quality, quality)
+
     @property
     def fduration(self) -> str:
         return f'[{format_time(self.duration)}]'
@@ -141,95 +196,6 @@ def get_min_max_ids(seq: Iterable[VideoInfo]) -> tuple[int, int]:
             max_id = id_
     return min_id, max_id
 
-
-def try_merge_info_files(info_dict: dict[int, str], subfolder: str, list_type: str) -> list[str]:
-    parsed_files: list[str] = []
-    if not Config.merge_lists:
-        return parsed_files
-    dir_fullpath = normalize_path(f'{Config.dest_base}{subfolder}')
-    if not os.path.isdir(dir_fullpath):
-        return parsed_files
-    # Log.debug(f'\nMerging {Config.dest_base}{subfolder} \'{list_type}\' info lists...')
-    with os.scandir(dir_fullpath) as listing:
-        info_lists: list[re.Match[str]] = sorted(filter(
-            None, (re_infolist_filename.fullmatch(f.name) for f in listing
-                   if f.is_file() and f.name.startswith(f'{PREFIX}!{list_type}_'))), key=lambda m: m.string)
-    if not info_lists:
-        return parsed_files
-    parsed_dict: dict[int, str] = {}
-    for fmatch in info_lists:
-        fmname = fmatch.string
-        # Log.debug(f'Parsing {fmname}...')
-        list_fullpath = f'{dir_fullpath}{fmname}'
-        try:
-            with open(list_fullpath, 'rt', encoding=UTF8) as listfile:
-                last_id = 0
-                for line in listfile.readlines():
-                    line = line.strip('\ufeff')
-                    if line in ('', '\n'):
-                        continue
-                    if line.startswith(PREFIX):
-                        delim_idx = line.find(':')
-                        idi = line[len(PREFIX):delim_idx]
-                        last_id = int(idi)
-                        # Log.debug(f'new id: {last_id:d}{f" (override!)" if last_id in parsed_dict else ""}...')
-                        parsed_dict[last_id] = ''
-                        if len(line) > delim_idx + 2:
-                            parsed_dict[last_id] += line[delim_idx + 2:].strip()
-                            # Log.debug(f'at {last_id:d}: (in place) now \'{parsed_dict[last_id]}\'')
-                            last_id = 0
-                    else:
-                        assert last_id
-                        if not parsed_dict[last_id]:
-                            line = f'\n{line}'
-                        parsed_dict[last_id] += line
-                        # Log.debug(f'at {last_id:d}: adding \'{line}\'')
-                parsed_files.append(list_fullpath)
-        except Exception:
-            Log.error(f'Error reading from {fmname}. Skipped')
-            continue
-    for k, v in parsed_dict.items():
-        if k not in info_dict:
-            info_dict[k] = v
-    return parsed_files
-
-
-def export_video_info(info_list: Iterable[VideoInfo]) -> None:
-    """Saves tags, descriptions and comments for each subfolder in scenario and base dest folder based on video info"""
-    tags_dict: dict[str, dict[int, str]] = {}
-    desc_dict: dict[str, dict[int, str]] = {}
-    comm_dict: dict[str, dict[int, str]] = {}
-    for vi in info_list:
-        if vi.link:
-            for d, s in zip((tags_dict, desc_dict, comm_dict), (vi.tags, vi.description, vi.comments), strict=True):
-                if vi.subfolder not in d:
-                    d[vi.subfolder] = {}
-                d[vi.subfolder][vi.id] = s
-    for conf, dct, name, proc_cb in zip(
-        (Config.save_tags, Config.save_descriptions, Config.save_comments),
-        (tags_dict, desc_dict, comm_dict),
-        ('tags', 'descriptions', 'comments'),
-        (lambda tags: f' {tags.strip()}\n', lambda description: f'{description}\n', lambda comments: f'{comments}\n'),
-        strict=True,
-    ):
-        if not conf:
-            continue
-        for subfolder, sdct in dct.items():
-            merged_files = try_merge_info_files(sdct, subfolder, name)
-            if not sdct:
-                continue
-            if Config.skip_empty_lists and not any(sdct[idi] for idi in sdct):
-                continue
-            keys = sorted(sdct.keys())
-            min_id, max_id = keys[0], keys[-1]
-            info_folder = f'{Config.dest_base}{subfolder}'
-            fullpath = f'{normalize_path(info_folder)}{PREFIX}!{name}_{min_id:d}-{max_id:d}.txt'
-            if not os.path.isdir(info_folder):
-                os.makedirs(info_folder)
-            with open(fullpath, 'wt', encoding=UTF8) as sfile:
-                sfile.writelines(f'{PREFIX}{idi:d}:{proc_cb(sdct[idi])}' for idi in keys)
-            [os.remove(merged_file) for merged_file in merged_files if merged_file != fullpath]
-
 #
 #
 #########################################
@@ -0,0 +1,212 @@
+# coding=UTF-8
+"""
+Author: trickerer (https://github.com/trickerer, https://github.com/trickerer01)
+"""
+#########################################
+#
+#
+
+from __future__ import annotations
+
+import heapq
+import os
+from asyncio import Lock as AsyncLock
+from collections.abc import Callable, Iterable, Iterator
+from contextlib import nullcontext
+from typing import TextIO
+
+from . import afs
+from .config import Config
+from .defs import PREFIX, START_TIME, UTF8
+from .logger import Log
+from .rex import re_infolist_filename, re_infosegment_filename
+from .util import normalize_path
+
+if False is True:  # for hinting only
+    from .iinfo import VideoInfo  # noqa: I001
+
+__all__ = ('InfoListWriter', 'export_video_info')
+
+INFO_LISTS: tuple[tuple[str, Callable[[VideoInfo], str], Callable[[str], str]], ...] = (
+    ('tags', lambda vi: vi.tags, lambda tags: f' {tags.strip()}\n'),
+    ('descriptions', lambda vi: vi.description, lambda description: f'{description}\n'),
+    ('comments', lambda vi: vi.comments, lambda comments: f'{comments}\n'),
+)
+
+
+class UnsortedInfoListError(Exception):
+    pass
+
+
+def _read_records(list_fullpath: str, parsed_files: list[str]) -> Iterator[tuple[int, str]]:
+    """Lazily parses info list file (or segment) record by record. File is only reported as parsed once fully read"""
+    try:
+        with open(list_fullpath, 'rt', encoding=UTF8) as listfile:
+            cur_id: int | None = None
+            cur_text = ''
+            in_place = False
+            for line in listfile:
+                line = line.strip('\ufeff')
+                if line.startswith(PREFIX):
+                    if cur_id is not None:
+                        yield cur_id, cur_text.removesuffix('\n')
+                    delim_idx = line.find(':')
+                    cur_id = int(line[len(PREFIX):delim_idx])
+                    in_place = len(line) > delim_idx + 2
+                    cur_text = line[delim_idx + 2:].strip() if in_place else ''
+                elif cur_id is None or in_place:
+                    assert line in ('', '\n')
+                else:
+                    # only a prefixed line starts a new record, blank lines are part of multi-line text (comments, paragraphs)
+                    cur_text += line if cur_text else f'\n{line}'
+            if cur_id is not None:
+                yield cur_id, cur_text.removesuffix('\n')
+        parsed_files.append(list_fullpath)
+    except (OSError, ValueError, AssertionError):
+        Log.error(f'Error reading from {os.path.basename(list_fullpath)}. Skipped')
+
+
+def _merge_sorted(sources: list[Callable[[], Iterable[tuple[int, str]]]]) -> Iterator[tuple[int, str]]:
+    """
+    Streaming k-way merge of id-sorted sources, keeping memory usage independent of lists size.
+    If the same id is found in multiple sources the latest source wins
+    """
+    last_id: int | None = None
+    last_text = ''
+    for id_, _, text in heapq.merge(*(((id_, prio, text) for id_, text in source()) for prio, source in enumerate(sources)),
+                                    key=lambda record: record[:2]):
+        if id_ != last_id:
+            if last_id is not None:
+                if id_ < last_id:
+                    raise UnsortedInfoListError
+                yield last_id, last_text
+            last_id = id_
+        last_text = text
+    if last_id is not None:
+        yield last_id, last_text
+
+
+def _merge_unsorted(sources: list[Callable[[], Iterable[tuple[int, str]]]]) -> Iterator[tuple[int, str]]:
+    merged_dict: dict[int, str] = {}
+    for source in sources:
+        merged_dict.update(source())
+    yield from sorted(merged_dict.items())
+
+
+def compact_info_lists(folder: str, name: str, proc_cb: Callable[[str], str]) -> str | None:
+    """
+    Merges info list segments of type **name** stored in **folder** (and existing info lists if merging is enabled)
+    into a single sorted info list, removing merged files. Returns resulting file path
+    """
+    with os.scandir(folder) as listing:
+        filenames = sorted(f.name for f in listing if f.is_file() and f.name.startswith(f'{PREFIX}!{name}_'))
+    segment_files = [f'{folder}{fname}' for fname in filenames if re_infosegment_filename.fullmatch(fname)]
+    list_files = [f'{folder}{fname}' for fname in filenames if re_infolist_filename.fullmatch(fname)] if Config.merge_lists else []
+    if not segment_files:
+        return None
+    parsed_files: list[str] = []
+    # segments are written in completion order, they are only as big as a single run so sort them in memory
+    segments_records: dict[int, str] = {}
+    for segment_file in segment_files:
+        segments_records.update(_read_records(segment_file, parsed_files))
+    segments_parsed = len(parsed_files)
+    sources: list[Callable[[], Iterable[tuple[int, str]]]] = [
+        *(lambda list_file=list_file: _read_records(list_file, parsed_files) for list_file in list_files),
+        lambda: sorted(segments_records.items()),
+    ]
+    tmp_fullpath = f'{folder}{PREFIX}!{name}_{START_TIME.strftime("%Y%m%d%H%M%S")}.tmp'
+    min_id = max_id = 0
+    any_text = False
+    for merge_func in (_merge_sorted, _merge_unsorted):
+        del parsed_files[segments_parsed:]
+        min_id = max_id = 0
+        any_text = False
+        try:
+            with open(tmp_fullpath, 'wt', encoding=UTF8) as sfile:
+                for idi, text in merge_func(sources):
+                    min_id = min_id or idi
+                    max_id = idi
+                    any_text = any_text or bool(text)
+                    sfile.write(f'{PREFIX}{idi:d}:{proc_cb(text)}')
+            break
+        except UnsortedInfoListError:
+            Log.debug(f'Info lists \'{name}\' in {folder} are not sorted, merging in memory...')
+    result_fullpath: str | None = None
+    if max_id and (any_text or not Config.skip_empty_lists):
+        result_fullpath = f'{folder}{PREFIX}!{name}_{min_id:d}-{max_id:d}.txt'
+        os.replace(tmp_fullpath, result_fullpath)
+        [os.remove(parsed_file) for parsed_file in parsed_files if parsed_file != result_fullpath]
+    else:
+        os.remove(tmp_fullpath)
+        [os.remove(segment_file) for segment_file in segment_files if segment_file in parsed_files]
+    return result_fullpath
+
+
+class InfoListWriter:
+    """
+    Appends tags, descriptions and comments of each processed item to per-subfolder info list segments as soon as
+    item is finished, so a crash loses nothing. Stored texts are dropped from the item. Segments (including ones left by crashed runs) are merged into final
+    info lists on exit
+    """
+    _instance: InfoListWriter | None = None
+
+    @staticmethod
+    def get() -> InfoListWriter | None:
+        return InfoListWriter._instance
+
+    def __enter__(self) -> InfoListWriter:
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb) -> None:
+        self.close()
+        InfoListWriter._instance = None
+
+    def __init__(self) -> None:
+        assert InfoListWriter._instance is None
+        InfoListWriter._instance = self
+
+        self._lists = [info_list for info_list, conf in zip(
+            INFO_LISTS, (Config.save_tags, Config.save_descriptions, Config.save_comments), strict=True) if conf]
+        self._segments: dict[tuple[str, str], TextIO] = {}
+        self._stored_ids: set[int] = set()
+        self._lock = AsyncLock()
+        '''segment files are written from fs threads, one item at a time'''
+
+    async def _get_segment(self, folder: str, name: str) -> TextIO:
+        if (folder, name) not in self._segments:
+            await afs.makedirs(folder, exist_ok=True)
+            segment_fullpath = f'{folder}{PREFIX}!{name}_seg{START_TIME.strftime("%Y%m%d%H%M%S")}.txt'
+            self._segments[(folder, name)] = await afs.call(lambda: open(segment_fullpath, 'at', encoding=UTF8, buffering=1), op='open')
+        return self._segments[(folder, name)]
+
+    async def store(self, vi: VideoInfo) -> None:
+        if not vi.link or vi.id in self._stored_ids:
+            return
+        self._stored_ids.add(vi.id)
+        folder = normalize_path(f'{Config.dest_base}{vi.subfolder}')
+        async with self._lock:
+            for name, value_cb, proc_cb in self._lists:
+                segment = await self._get_segment(folder, name)
+                await afs.call(segment.write, f'{PREFIX}{vi.id:d}:{proc_cb(value_cb(vi))}', op='infolist')
+        # spilled to segment files, no need to keep them in memory until the end of the run
+        vi.tags = vi.description = vi.comments = ''
+
+    def close(self) -> None:
+        for (folder, name), segment in self._segments.items():
+            segment.close()
+            compact_info_lists(folder, name, next(proc_cb for lname, _, proc_cb in self._lists if lname == name))
+        self._segments.clear()
+
+
+async def export_video_info(info_list: Iterable[VideoInfo]) -> None:
+    """
+    Saves tags, descriptions and comments for each subfolder in scenario and base dest folder based on video info.
+    Items already stored by active info list writer are not stored again, lists are finalized once writer is closed
+    """
+    with nullcontext(InfoListWriter.get()) if InfoListWriter.get() else InfoListWriter() as writer:
+        for vi in info_list:
+            await writer.store(vi)
+
+#
+#
+#########################################
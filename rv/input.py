@@ -6,14 +6,19 @@ Author: trickerer (https://github.com/trickerer, https://github.com/trickerer01)
 # Original solution by Bharel: https://stackoverflow.com/a/70664652
 #
 
-from asyncio import CancelledError, sleep
+from asyncio import CancelledError, get_running_loop, sleep
+from asyncio import Queue as AsyncQueue
 from collections.abc import Callable
 from contextlib import contextmanager, nullcontext
 from platform import system
 
 __all__ = ('wait_for_key',)
 
-if system() == 'Windows':
+KEY_SEQUENCE_TIMEOUT = 1.0
+'''max interval between consecutive key strokes of a sequence'''
+IS_WINDOWS = system() == 'Windows'
+
+if IS_WINDOWS:
     import msvcrt
 
     set_terminal_raw = nullcontext
@@ -21,6 +26,7 @@ if system() == 'Windows':
     next_input = msvcrt.getwch
 else:
     import functools
+    import os
     import sys
     from select import select
     from termios import TCSADRAIN, tcgetattr, tcsetattr
@@ -42,24 +48,88 @@ else:
     next_input = functools.partial(sys.stdin.read, 1)
 
 
+async def wait_for_key_reader(key: str, count: int) -> bool:
+    """
+    Waits for key sequence being notified by event loop of stdin being readable, no polling involved.
+    Returns **False** if stdin was closed before the sequence was entered
+    """
+    loop = get_running_loop()
+    fd = sys.stdin.fileno()
+    strokes: AsyncQueue[str | None] = AsyncQueue()
+
+    def on_readable() -> None:
+        try:
+            data = os.read(fd, 64)
+        except OSError:
+            data = b''
+        if not data:
+            # EOF or hangup, stdin will stay readable forever
+            loop.remove_reader(fd)
+            strokes.put_nowait(None)
+            return
+        for ch in data.decode(errors='replace'):
+            strokes.put_nowait(ch)
+
+    loop.add_reader(fd, on_readable)
+    try:
+        stroke_count = 0
+        last_stroke_time = 0.0
+        while stroke_count < count:
+            ch = await strokes.get()
+            if ch is None:
+                return False
+            stroke_time = loop.time()
+            if ch != key:
+                stroke_count = 0
+            elif stroke_count == 0 or stroke_time - last_stroke_time <= KEY_SEQUENCE_TIMEOUT:
+                stroke_count += 1
+            else:
+                stroke_count = 1
+            last_stroke_time = stroke_time
+        return True
+    finally:
+        loop.remove_reader(fd)
+
+
+async def wait_for_key_polling(key: str, count: int) -> bool:
+    """Checks input for key sequence every second. Returns **False** if input reached its end before the sequence was entered"""
+    stroke_sequence: list[str] = []
+    while stroke_sequence != [key] * count:
+        await sleep(KEY_SEQUENCE_TIMEOUT)
+        if not input_ready():
+            stroke_sequence.clear()
+            continue
+        while input_ready():
+            ch = next_input()
+            if not ch:
+                return False
+            if ch == key:
+                stroke_sequence.append(ch)
+                if stroke_sequence == [key] * count:
+                    return True
+            else:
+                stroke_sequence.clear()
+                while input_ready():
+                    if not next_input():
+                        return False
+    return True
+
+
 async def wait_for_key(key: str, count: int, callback: Callable[[], None]) -> None:
+    """Calls **callback** once **key** is pressed **count** times in a row"""
     try:
-        stroke_sequence: list[str] = []
         with set_terminal_raw():
-            while stroke_sequence != [key] * count:
-                await sleep(1.0)
-                if not input_ready():
-                    stroke_sequence.clear()
-                    continue
-                while input_ready():
-                    ch = next_input()
-                    if ch == key:
-                        stroke_sequence.append(ch)
-                    else:
-                        stroke_sequence.clear()
-                        while input_ready():
-                            next_input()
-            callback()
+            if IS_WINDOWS:
+                # event loop can't watch console input
+                entered = await wait_for_key_polling(key, count)
+            else:
+                try:
+                    entered = await wait_for_key_reader(key, count)
+                except (NotImplementedError, OSError):
+                    # event loop has no reader support or stdin can't be watched (not pollable)
+                    entered = await wait_for_key_polling(key, count)
+            if entered:
+                callback()
     except CancelledError:
         pass
 
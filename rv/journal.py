@@ -0,0 +1,142 @@
+# coding=UTF-8
+"""
+Author: trickerer (https://github.com/trickerer, https://github.com/trickerer01)
+"""
+#########################################
+#
+#
+
+from __future__ import annotations
+
+import json
+import os
+import time
+
+from . import afs
+from .config import Config
+from .defs import JOURNAL_SYNC_INTERVAL, PREFIX, START_TIME, UTF8, DownloadResult
+from .iinfo import VideoInfo
+from .logger import Log
+
+__all__ = ('JobJournal',)
+
+JOURNAL_FINAL_RESULTS = (
+    DownloadResult.SUCCESS,
+    DownloadResult.FAIL_NOT_FOUND,
+    DownloadResult.FAIL_ALREADY_EXISTS,
+    DownloadResult.FAIL_SKIPPED,
+    DownloadResult.FAIL_DELETED,
+    DownloadResult.FAIL_FILTERED_OUTER,
+)
+
+
+class JobJournal:
+    """
+    Append-only JSON-lines log of items state transitions: scanned items with their resolved link, quality, file name
+    and subfolder, and final scan / download results\n
+    When journal file already exists it is replayed first: finished items are skipped and scanned items
+    go straight to download without being scanned again (see -journal). Journal file is removed once the run completes
+    """
+    _instance: JobJournal | None = None
+
+    @staticmethod
+    def get() -> JobJournal | None:
+        return JobJournal._instance
+
+    @staticmethod
+    def file_path() -> str:
+        return Config.journal_file or f'{Config.dest_base}{PREFIX}{START_TIME.strftime("%Y-%m-%d_%H_%M_%S")}.journal.jsonl'
+
+    def __enter__(self) -> JobJournal:
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb) -> None:
+        self.close(exc_type is None and not Config.aborted)
+        JobJournal._instance = None
+
+    def __init__(self, file_path: str) -> None:
+        assert JobJournal._instance is None
+        JobJournal._instance = self
+
+        self._file_path: str = file_path
+        self._replayed: dict[int, dict | None] = {}
+        '''last record of each id found in existing journal file, None if item was finished'''
+        self._pending_syncs: int = 0
+        self._load()
+        if not os.path.isdir(os.path.dirname(file_path)):
+            os.makedirs(os.path.dirname(file_path))
+        torn = False
+        if os.path.isfile(file_path) and os.path.getsize(file_path) > 0:
+            with open(file_path, 'rb') as jfile:
+                jfile.seek(-1, os.SEEK_END)
+                torn = jfile.read(1) != b'\n'
+        self._file = open(file_path, 'at', encoding=UTF8, buffering=1)
+        if torn:
+            self._file.write('\n')  # an interrupted write left last line incomplete
+        # continue cmdfile has to point to the same journal
+        Config.journal_file = file_path
+
+    def _load(self) -> None:
+        if not os.path.isfile(self._file_path):
+            return
+        bad_lines = 0
+        with open(self._file_path, 'rt', encoding=UTF8) as jfile:
+            for line in jfile:
+                if not line.strip():
+                    continue
+                try:
+                    record: dict = json.loads(line)
+                    finished = record['state'] != VideoInfo.State.SCANNED.name and DownloadResult[record['result']] in JOURNAL_FINAL_RESULTS
+                    self._replayed[int(record['id'])] = None if finished else record
+                except Exception:
+                    bad_lines += 1
+        Log.info(f'[journal] replaying {len(self._replayed):d} items from \'{self._file_path}\''
+                 f'{f" ({bad_lines:d} damaged lines ignored)" if bad_lines else ""}')
+
+    async def _write(self, record: dict) -> None:
+        self._file.write(f'{json.dumps(record)}\n')
+        self._pending_syncs += 1
+        if self._pending_syncs >= JOURNAL_SYNC_INTERVAL:
+            self._pending_syncs = 0
+            await afs.call(os.fsync, self._file.fileno(), op='fsync')
+
+    def close(self, remove: bool) -> None:
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+            if remove and os.path.isfile(self._file_path):
+                Log.trace(f'All items processed. Removing journal \'{self._file_path}\'...')
+                os.remove(self._file_path)
+
+    async def record_scanned(self, vi: VideoInfo) -> None:
+        await self._write({
+            'id': vi.id, 'state': vi.state_str, 'result': DownloadResult.SUCCESS.name, 'ts': round(time.time(), 3),
+            'link': vi.link, 'quality': vi.quality, 'filename': vi.filename, 'subfolder': vi.subfolder,
+            'title': vi.title, 'duration': vi.duration, 'uploader': vi.uploader,
+            **{k: v for k, v in (('tags', vi.tags), ('description', vi.description), ('comments', vi.comments)) if v},
+        })
+
+    async def record_result(self, vi: VideoInfo, result: DownloadResult) -> None:
+        if result == DownloadResult.FAIL_SKIPPED and Config.aborted:
+            # may be an interrupted scan, not a filter decision
+            return
+        await self._write({'id': vi.id, 'state': vi.state_str, 'result': result.name, 'ts': round(time.time(), 3)})
+
+    def is_finished(self, id_: int) -> bool:
+        return id_ in self._replayed and self._replayed[id_] is None
+
+    def restore_scanned(self, id_: int) -> VideoInfo | None:
+        """Recreates item scanned in previous run, ready to be downloaded. If its link has expired item is scanned again"""
+        if not (record := self._replayed.get(id_)) or record['state'] != VideoInfo.State.SCANNED.name:
+            return None
+        vi = VideoInfo(id_, record['title'], record['link'], record['subfolder'], record['filename'], m_duration=record['duration'])
+        vi.quality = record['quality']
+        vi.uploader = record['uploader']
+        vi.tags, vi.description, vi.comments = record.get('tags', ''), record.get('description', ''), record.get('comments', '')
+        vi.set_state(VideoInfo.State.SCANNED)
+        vi.set_flag(VideoInfo.Flags.RESTORED)
+        return vi
+
+#
+#
+#########################################
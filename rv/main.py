@@ -9,6 +9,7 @@ Author: trickerer (https://github.com/trickerer, https://github.com/trickerer01)
 import sys
 from asyncio import get_running_loop, run, sleep
 from collections.abc import Callable, Coroutine, Sequence
+from contextlib import nullcontext
 
 from .cmdargs import HelpPrintExitException, parse_logging_args, prepare_arglist
 from .config import Config
@@ -16,7 +17,9 @@ from .defs import MIN_PYTHON_VERSION, MIN_PYTHON_VERSION_STR
 from .download import at_interrupt
 from .ids import process_ids
 from .logger import Log
+from .metrics import MetricsExporter
 from .pages import process_pages
+from .parse_pool import ParsePool
 from .version import APP_NAME, APP_VERSION
 
 __all__ = ('main_async', 'main_sync')
@@ -52,7 +55,9 @@ async def main(args: Sequence[str]) -> int:
     action_name = Config.get_action_string()
     assert action_name in actions, f'Unknown action \'{action_name}\'!'
     proc = actions[action_name]
-    return await proc()
+    with ParsePool(Config.parse_processes) if Config.parse_processes else nullcontext():
+        async with MetricsExporter():
+            return await proc()
 
 
 async def run_main(args: Sequence[str]) -> int:
@@ -69,7 +74,7 @@ async def main_async(args: Sequence[str]) -> int:
         Log.warn('Warning: catched KeyboardInterrupt/SystemExit...')
         return ErrorCodes.INTERRUPTED
     finally:
-        at_interrupt()
+        await at_interrupt()
 
 
 def main_sync(args: Sequence[str]) -> int:
@@ -0,0 +1,225 @@
+# coding=UTF-8
+"""
+Author: trickerer (https://github.com/trickerer, https://github.com/trickerer01)
+"""
+#########################################
+#
+#
+
+from __future__ import annotations
+
+import bisect
+import json
+import time
+from asyncio import CancelledError, Task, get_running_loop, sleep
+from collections.abc import Iterator
+from contextlib import contextmanager
+
+from aiohttp import web
+
+from .config import Config
+from .defs import METRICS_DUMP_INTERVAL, METRICS_LOOP_LAG_INTERVAL, METRICS_SPEED_BUCKETS, METRICS_TIME_BUCKETS, UTF8
+from .logger import Log
+
+__all__ = ('Metrics', 'MetricsExporter')
+
+Labels = tuple[tuple[str, str], ...]
+
+
+class Histogram:
+    def __init__(self, buckets: tuple[float, ...]) -> None:
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value: float) -> None:
+        self.counts[bisect.bisect_left(self.buckets, value)] += 1
+        self.sum += value
+        self.count += 1
+
+    def cumulative(self) -> list[tuple[str, int]]:
+        total = 0
+        result: list[tuple[str, int]] = []
+        for le, count in zip((*(f'{b:g}' for b in self.buckets), '+Inf'), self.counts, strict=True):
+            total += count
+            result.append((le, total))
+        return result
+
+
+class Metrics:
+    """
+    Opt-in pipeline metrics: counters and histograms, keyed by name and labels.
+    Recording is a no-op unless metrics output is requested (see --metrics-file, --metrics-port)
+    """
+    enabled = False
+    _counters: dict[str, dict[Labels, float]] = {}
+    _histograms: dict[str, dict[Labels, Histogram]] = {}
+    _docs: dict[str, str] = {
+        'rate_limit_wait_seconds': 'Time spent waiting for request rate limiter',
+        'html_fetch_seconds': 'Html page fetch time, including retries',
+        'html_parse_seconds': 'Html page parse time, \'process\' stage is parsing in a worker process',
+        'filter_seconds': 'Video filtering time (extra tags, scenario, votes)',
+        'download_ttfb_seconds': 'Media request time to response headers',
+        'download_speed_bytes_per_second': 'Average speed of completed downloads',
+        'download_bytes_total': 'Media bytes written',
+        'html_retries_total': 'Html fetch retries by status',
+        'http_connections_total': 'Connections used by pool, \'new\' ones required a handshake, \'reused\' ones were kept alive',
+        'http_connection_wait_seconds': 'Time spent waiting for a free connection in pool',
+        'download_retries_total': 'Media download retries by status',
+        'scan_results_total': 'Video scan results',
+        'download_results_total': 'Video download results',
+        'screenshot_results_total': 'Video screenshot download results',
+        'fs_call_seconds': 'Filesystem call time by operation, moved off the event loop',
+        'event_loop_lag_seconds': 'Event loop wakeup delay, time the loop was blocked',
+    }
+
+    @staticmethod
+    def _reset() -> None:
+        Metrics.enabled = False
+        Metrics._counters.clear()
+        Metrics._histograms.clear()
+
+    @staticmethod
+    def _labels(labels: dict[str, str]) -> Labels:
+        return tuple(sorted((k, str(v)) for k, v in labels.items()))
+
+    @staticmethod
+    def inc(name: str, amount: float = 1, **labels: str) -> None:
+        if not Metrics.enabled:
+            return
+        series = Metrics._counters.setdefault(name, {})
+        key = Metrics._labels(labels)
+        series[key] = series.get(key, 0) + amount
+
+    @staticmethod
+    def observe(name: str, value: float, **labels: str) -> None:
+        if not Metrics.enabled:
+            return
+        series = Metrics._histograms.setdefault(name, {})
+        key = Metrics._labels(labels)
+        if key not in series:
+            series[key] = Histogram(METRICS_SPEED_BUCKETS if name.endswith('_per_second') else METRICS_TIME_BUCKETS)
+        series[key].observe(value)
+
+    @staticmethod
+    @contextmanager
+    def timer(name: str, **labels: str) -> Iterator[None]:
+        """Observes time spent inside the block (in seconds) in histogram **name**"""
+        if not Metrics.enabled:
+            yield
+            return
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            Metrics.observe(name, time.perf_counter() - start, **labels)
+
+    @staticmethod
+    def snapshot() -> list[dict]:
+        """All series as plain dicts, one per series (JSON-lines format)"""
+        ts = round(time.time(), 3)
+        records: list[dict] = []
+        for name, series in Metrics._counters.items():
+            for labels, value in series.items():
+                records.append({'ts': ts, 'name': name, 'type': 'counter', 'labels': dict(labels), 'value': value})
+        for name, series in Metrics._histograms.items():
+            for labels, hist in series.items():
+                records.append({'ts': ts, 'name': name, 'type': 'histogram', 'labels': dict(labels),
+                                'count': hist.count, 'sum': hist.sum, 'buckets': dict(hist.cumulative())})
+        return records
+
+    @staticmethod
+    def render_prometheus() -> str:
+        """All series in Prometheus text exposition format"""
+        def fmt_labels(labels: Labels, extra: tuple[str, str] | None = None) -> str:
+            pairs = [*labels, *((extra,) if extra else ())]
+            return '{' + ','.join(f'{k}="{v}"' for k, v in pairs) + '}' if pairs else ''
+
+        lines: list[str] = []
+        for name, series in Metrics._counters.items():
+            lines.extend((f'# HELP rv_{name} {Metrics._docs.get(name, name)}', f'# TYPE rv_{name} counter'))
+            lines.extend(f'rv_{name}{fmt_labels(labels)} {value:g}' for labels, value in series.items())
+        for name, series in Metrics._histograms.items():
+            lines.extend((f'# HELP rv_{name} {Metrics._docs.get(name, name)}', f'# TYPE rv_{name} histogram'))
+            for labels, hist in series.items():
+                lines.extend(f'rv_{name}_bucket{fmt_labels(labels, ("le", le))} {count:d}' for le, count in hist.cumulative())
+                lines.append(f'rv_{name}_sum{fmt_labels(labels)} {hist.sum:g}')
+                lines.append(f'rv_{name}_count{fmt_labels(labels)} {hist.count:d}')
+        return '\n'.join(lines) + '\n'
+
+    @staticmethod
+    def dump(file_path: str) -> None:
+        """Appends current snapshot to JSON-lines file"""
+        try:
+            with open(file_path, 'at', encoding=UTF8) as mfile:
+                mfile.writelines(f'{json.dumps(record)}\n' for record in Metrics.snapshot())
+        except Exception:
+            Log.error(f'Error: unable to write metrics to \'{file_path}\'!')
+
+
+class MetricsExporter:
+    """
+    Enables metrics for the duration of the run, periodically dumps them to --metrics-file
+    and serves them at http://127.0.0.1:<--metrics-port>/metrics
+    """
+    def __init__(self) -> None:
+        self._dumper: Task | None = None
+        self._lag_monitor: Task | None = None
+        self._runner: web.AppRunner | None = None
+
+    async def __aenter__(self) -> MetricsExporter:
+        Metrics.enabled = bool(Config.metrics_file or Config.metrics_port)
+        if Metrics.enabled:
+            self._lag_monitor = get_running_loop().create_task(self._monitor_loop_lag())
+        if Config.metrics_file:
+            self._dumper = get_running_loop().create_task(self._dump_periodically())
+        if Config.metrics_port:
+            app = web.Application()
+            app.router.add_get('/metrics', self._serve_metrics)
+            self._runner = web.AppRunner(app, access_log=None)
+            await self._runner.setup()
+            await web.TCPSite(self._runner, '127.0.0.1', Config.metrics_port).start()
+            Log.info(f'Serving metrics at http://127.0.0.1:{Config.metrics_port:d}/metrics')
+        return self
+
+    async def __aexit__(self, exc_type, exc_val, exc_tb) -> None:
+        if self._dumper is not None:
+            self._dumper.cancel()
+            self._dumper = None
+        if self._lag_monitor is not None:
+            self._lag_monitor.cancel()
+            self._lag_monitor = None
+        if Config.metrics_file:
+            Metrics.dump(Config.metrics_file)
+        if self._runner is not None:
+            await self._runner.cleanup()
+            self._runner = None
+        Metrics.enabled = False
+
+    async def _dump_periodically(self) -> None:
+        try:
+            while True:
+                await sleep(float(METRICS_DUMP_INTERVAL))
+                Metrics.dump(Config.metrics_file)
+        except CancelledError:
+            pass
+
+    @staticmethod
+    async def _monitor_loop_lag() -> None:
+        """Measures how late the loop wakes up a sleeping task, which is how long it was blocked by something else"""
+        try:
+            while True:
+                time_start = time.perf_counter()
+                await sleep(METRICS_LOOP_LAG_INTERVAL)
+                Metrics.observe('event_loop_lag_seconds', max(0.0, time.perf_counter() - time_start - METRICS_LOOP_LAG_INTERVAL))
+        except CancelledError:
+            pass
+
+    @staticmethod
+    async def _serve_metrics(_: web.Request) -> web.Response:
+        return web.Response(text=Metrics.render_prometheus(), content_type='text/plain', charset=UTF8)
+
+#
+#
+#########################################
@@ -0,0 +1,207 @@
+# coding=UTF-8
+"""
+Author: trickerer (https://github.com/trickerer, https://github.com/trickerer01)
+"""
+#########################################
+#
+#
+
+from __future__ import annotations
+
+import bisect
+import json
+import mmap
+import os
+import re
+import struct
+import sys
+import zlib
+from collections.abc import Iterator
+
+from .defs import UTF8
+from .logger import Log
+from .util import normalize_path
+
+__all__ = ('NumsIndex',)
+
+INDEX_MAGIC = b'RVNI'
+INDEX_VERSION = 1
+INDEX_HEADER = struct.Struct('<4sIQQI')
+'''magic, version, source mtime (ns), source size, entries count'''
+INDEX_OFFSET = struct.Struct('<I')
+INDEX_OFFSET_PAIR = struct.Struct('<II')
+
+WTAG_NON_LITERAL_CHARS = frozenset('*?|`()[]{}.,+-\\^$')
+
+
+class _Keys:
+    """Sorted keys view for bisect"""
+    def __init__(self, index: NumsIndex) -> None:
+        self._index = index
+
+    def __len__(self) -> int:
+        return len(self._index)
+
+    def __getitem__(self, idx: int) -> bytes:
+        return self._index._entry(idx)[0]
+
+
+class NumsIndex:
+    """
+    Read-only name -> number mapping for tags / artists / categories, loaded lazily from compact index file.\n
+    Index file is built from source json once and rebuilt whenever source file changes (mtime or size).
+    Keys are kept sorted (as UTF-8) so lookups are binary searches and wildcard expansion only checks keys sharing its literal prefix.
+    Index is stored next to source file or, if that location is read-only, in user cache folder.
+    If index file cannot be written at all the same layout is built in memory
+    """
+    def __init__(self, file_loc: str, name: str) -> None:
+        self.file_loc: str = file_loc
+        self.name: str = name
+        self._loaded: bool = False
+        self._count: int = 0
+        self._offsets: memoryview | None = None
+        self._blob: memoryview | None = None
+        self._mmap: mmap.mmap | None = None
+
+    @property
+    def index_loc(self) -> str:
+        return f'{self.file_loc}.idx'
+
+    @property
+    def index_loc_cached(self) -> str:
+        cache_base = (os.environ.get('LOCALAPPDATA') if sys.platform == 'win32' else os.environ.get('XDG_CACHE_HOME')) or '~/.cache'
+        # different installs may have different sources
+        src_hash = zlib.crc32(os.path.abspath(self.file_loc).encode(UTF8))
+        return normalize_path(os.path.expanduser(f'{cache_base}/rv')) + f'{os.path.basename(self.file_loc)}.{src_hash:08x}.idx'
+
+    def __bool__(self) -> bool:
+        return self._loaded
+
+    def __len__(self) -> int:
+        return self._count
+
+    def __contains__(self, key: str) -> bool:
+        return self._find(key) >= 0
+
+    def __getitem__(self, key: str) -> str:
+        idx = self._find(key)
+        if idx < 0:
+            raise KeyError(key)
+        return self._entry(idx)[1].decode(UTF8)
+
+    def __iter__(self) -> Iterator[str]:
+        return (self._entry(i)[0].decode(UTF8) for i in range(self._count))
+
+    def get(self, key: str, default: str | None = None) -> str | None:
+        idx = self._find(key)
+        return self._entry(idx)[1].decode(UTF8) if idx >= 0 else default
+
+    def close(self) -> None:
+        self._offsets = self._blob = None
+        if self._mmap is not None:
+            self._mmap.close()
+            self._mmap = None
+        self._loaded = False
+        self._count = 0
+
+    def load(self) -> None:
+        self.close()
+        Log.trace(f'Loading {self.name}...')
+        try:
+            src_stat = os.stat(self.file_loc)
+            index_locs = (self.index_loc, self.index_loc_cached)
+            if not any(self._map_index(index_loc, src_stat) for index_loc in index_locs):
+                data = self._build(src_stat)
+                if not any(self._store_index(index_loc, data) and self._map_index(index_loc, src_stat) for index_loc in index_locs):
+                    self._set_data(memoryview(data))
+        except Exception:
+            Log.error(f'Failed to load {self.name} from {normalize_path(os.path.abspath(self.file_loc), False)}')
+            self.close()
+        self._loaded = True
+
+    def expand(self, pattern: re.Pattern[str], wtag: str) -> list[str]:
+        """Returns all keys fully matching **pattern** compiled from **wtag**, in sorted order"""
+        prefix = self.literal_prefix(wtag)
+        bprefix = prefix.encode(UTF8)
+        start = bisect.bisect_left(_Keys(self), bprefix) if bprefix else 0
+        matches: list[str] = []
+        for i in range(start, self._count):
+            key = self._entry(i)[0]
+            if not key.startswith(bprefix):
+                break
+            skey = key.decode(UTF8)
+            if pattern.fullmatch(skey):
+                matches.append(skey)
+        return matches
+
+    @staticmethod
+    def literal_prefix(wtag: str) -> str:
+        """Longest beginning of **wtag** which is matched literally. Top-level alternation makes it empty"""
+        if '|' in wtag:
+            return ''
+        for i, c in enumerate(wtag):
+            if c in WTAG_NON_LITERAL_CHARS:
+                return wtag[:i]
+        return wtag
+
+    def _find(self, key: str) -> int:
+        if not self._count:
+            return -1
+        bkey = key.encode(UTF8)
+        idx = bisect.bisect_left(_Keys(self), bkey)
+        return idx if idx < self._count and self._entry(idx)[0] == bkey else -1
+
+    def _entry(self, idx: int) -> tuple[bytes, bytes]:
+        start, end = INDEX_OFFSET_PAIR.unpack_from(self._offsets, idx * INDEX_OFFSET.size)
+        key, _, value = bytes(self._blob[start:end]).partition(b'\0')
+        return key, value
+
+    def _set_data(self, data: memoryview) -> None:
+        self._count = INDEX_HEADER.unpack_from(data)[4]
+        offsets_end = INDEX_HEADER.size + (self._count + 1) * INDEX_OFFSET.size
+        self._offsets = data[INDEX_HEADER.size:offsets_end]
+        self._blob = data[offsets_end:]
+
+    def _store_index(self, index_loc: str, data: bytes) -> bool:
+        try:
+            os.makedirs(os.path.dirname(index_loc), exist_ok=True)
+            with open(f'{index_loc}.tmp', 'wb') as ifile:
+                ifile.write(data)
+            os.replace(f'{index_loc}.tmp', index_loc)
+            Log.trace(f'Built {self.name} index \'{normalize_path(os.path.abspath(index_loc), False)}\'')
+            return True
+        except OSError:
+            if os.path.isfile(f'{index_loc}.tmp'):
+                os.remove(f'{index_loc}.tmp')
+            return False
+
+    def _map_index(self, index_loc: str, src_stat: os.stat_result) -> bool:
+        if not os.path.isfile(index_loc):
+            return False
+        with open(index_loc, 'rb') as ifile:
+            try:
+                mapped = mmap.mmap(ifile.fileno(), 0, access=mmap.ACCESS_READ)
+            except ValueError:
+                return False
+        magic, version, src_mtime, src_size, _ = INDEX_HEADER.unpack_from(mapped) if len(mapped) >= INDEX_HEADER.size else (b'',) * 5
+        if (magic, version, src_mtime, src_size) != (INDEX_MAGIC, INDEX_VERSION, src_stat.st_mtime_ns, src_stat.st_size):
+            mapped.close()
+            return False
+        self._mmap = mapped
+        self._set_data(memoryview(mapped))
+        return True
+
+    def _build(self, src_stat: os.stat_result) -> bytes:
+        with open(self.file_loc, 'rt', encoding=UTF8) as json_file:
+            entries = sorted((k.encode(UTF8), (v[:v.find(',')] if ',' in v else v).encode(UTF8)) for k, v in json.load(json_file).items())
+        offsets = bytearray()
+        blob = bytearray()
+        for key, value in entries:
+            offsets += INDEX_OFFSET.pack(len(blob))
+            blob += key + b'\0' + value
+        offsets += INDEX_OFFSET.pack(len(blob))
+        return INDEX_HEADER.pack(INDEX_MAGIC, INDEX_VERSION, src_stat.st_mtime_ns, src_stat.st_size, len(entries)) + offsets + blob
+
+#
+#
+#########################################
@@ -6,7 +6,10 @@ Author: trickerer (https://github.com/trickerer, https://github.com/trickerer01)
 #
 #
 
-from asyncio import sleep
+from __future__ import annotations
+
+from asyncio import Task, gather, get_running_loop, sleep
+from collections.abc import AsyncIterator, Callable
 
 from .config import Config
 from .defs import (
@@ -20,11 +23,12 @@ from .defs import (
     NamingFlags,
 )
 from .download import download
-from .fetch_html import create_session, fetch_html
+from .extract import ListingPageData, extract_listing_page
+from .fetch_html import create_session, fetch_page
 from .iinfo import VideoInfo
 from .logger import Log
-from .path_util import prefilter_existing_items
-from .rex import re_page_entry, re_paginator, re_preview_entry
+from .path_util import filter_existing_items, prefilter_existing_items, scan_dest_folder
+from .rex import re_page_entry, re_preview_entry
 from .util import get_time_seconds, has_naming_flag
 from .validators import find_and_resolve_config_conflicts
 from .version import APP_NAME
@@ -32,6 +36,45 @@ from .version import APP_NAME
 __all__ = ('process_pages',)
 
 
+class PagePrefetcher:
+    """
+    Fetches up to Config.page_prefetch listing pages ahead of the page being processed.
+    Pages are consumed strictly in order, pages left unconsumed (early stop) are cancelled
+    """
+    def __init__(self, get_page_addr: Callable[[int], str], video_ref_class: str, with_previews: bool) -> None:
+        self._get_page_addr = get_page_addr
+        self._video_ref_class = video_ref_class
+        self._with_previews = with_previews
+        self._pages: dict[int, Task[ListingPageData | None]] = {}
+
+    async def __aenter__(self) -> PagePrefetcher:
+        return self
+
+    async def __aexit__(self, exc_type, exc_val, exc_tb) -> None:
+        await self.cancel()
+
+    def prefetch(self, page_num: int, last_page: int) -> None:
+        for page_next in range(page_num + 1, min(page_num + Config.page_prefetch, last_page) + 1):
+            if page_next not in self._pages:
+                Log.trace(f'prefetching page {page_next:d}...')
+                self._pages[page_next] = get_running_loop().create_task(self._fetch(page_next))
+
+    async def _fetch(self, page_num: int) -> ListingPageData | None:
+        return await fetch_page(self._get_page_addr(page_num), extract_listing_page, self._video_ref_class,
+                                with_previews=self._with_previews)
+
+    async def get(self, page_num: int) -> ListingPageData | None:
+        if page_num in self._pages:
+            return await self._pages.pop(page_num)
+        return await self._fetch(page_num)
+
+    async def cancel(self) -> None:
+        for task in self._pages.values():
+            task.cancel()
+        await gather(*self._pages.values(), return_exceptions=True)
+        self._pages.clear()
+
+
 async def process_pages() -> int:
     full_download = Config.quality != QUALITIES[-1]
     video_ref_class = 'th' if Config.playlist_name else 'th js-open-popup'
@@ -48,63 +91,59 @@ async def process_pages() -> int:
             return -1
         return 0
 
-    v_entries: list[VideoInfo] = []
-    maxpage = Config.end if Config.start == Config.end else 0
-
-    pi = Config.start
-    async with create_session():
+    def get_page_addr(page_num: int) -> str:
+        return (
+            (SITE_AJAX_REQUEST_PLAYLIST_PAGE % (Config.playlist_id, Config.playlist_name, page_num)) if Config.playlist_name else
+            (SITE_AJAX_REQUEST_FAVOURITES_PAGE % (Config.favourites, page_num)) if Config.favourites else
+            (SITE_AJAX_REQUEST_UPLOADER_PAGE % (Config.uploader, page_num)) if Config.uploader else
+            (SITE_AJAX_REQUEST_MODEL_PAGE % (Config.model, page_num)) if Config.model else
+            (SITE_AJAX_REQUEST_SEARCH_PAGE % (Config.search_tags, Config.search_arts, Config.search_cats, Config.search,
+                                              Config.blacklist, Config.duration.min, Config.duration.max, page_num))
+        )
+
+    async def scan_pages(prefetcher: PagePrefetcher) -> AsyncIterator[list[VideoInfo]]:
+        """Yields entries found on each page, in pages order"""
+        maxpage = Config.end if Config.start == Config.end else 0
+        pi = Config.start
         while pi <= Config.end:
             if pi > maxpage > 0:
                 Log.info('reached parsed max page, page scan completed')
                 break
 
-            page_addr = (
-                (SITE_AJAX_REQUEST_PLAYLIST_PAGE % (Config.playlist_id, Config.playlist_name, pi)) if Config.playlist_name else
-                (SITE_AJAX_REQUEST_FAVOURITES_PAGE % (Config.favourites, pi)) if Config.favourites else
-                (SITE_AJAX_REQUEST_UPLOADER_PAGE % (Config.uploader, pi)) if Config.uploader else
-                (SITE_AJAX_REQUEST_MODEL_PAGE % (Config.model, pi)) if Config.model else
-                (SITE_AJAX_REQUEST_SEARCH_PAGE % (Config.search_tags, Config.search_arts, Config.search_cats, Config.search,
-                                                  Config.blacklist, Config.duration.min, Config.duration.max, pi))
-            )
-            a_html = await fetch_html(page_addr)
-            if not a_html:
-                Log.error(f'Error: cannot get html for page {pi:d}')
-                continue
-
-            if not len(a_html):
+            if maxpage > 0 and Config.page_prefetch:
+                prefetcher.prefetch(pi, min(maxpage, Config.end))
+            page = await prefetcher.get(pi)
+            if page is None:
                 Log.error(f'Error: got empty HTML for page {pi}! Retrying...')
                 continue
 
             pi += 1
 
             if maxpage == 0:
-                for page_ajax in a_html.find_all('a', attrs={'data-action': 'ajax'}):
-                    try:
-                        maxpage = max(maxpage, int(re_paginator.search(str(page_ajax.get('data-parameters'))).group(1)))
-                    except Exception:
-                        pass
+                maxpage = page.maxpage
                 if maxpage == 0:
                     Log.info('Could not extract max page, assuming single page search')
                     maxpage = 1
                 else:
                     Log.debug(f'Extracted max page: {maxpage:d}')
+                if Config.page_prefetch and not Config.get_maxid:
+                    prefetcher.prefetch(pi - 1, min(maxpage, Config.end))
 
             if Config.get_maxid:
-                mirefs = a_html.find_all('a', class_=video_ref_class)
-                max_id = max(int(re_page_entry.search(_.get('href')).group(1)) for _ in mirefs)
+                max_id = max(int(re_page_entry.search(href).group(1)) for href, _, _ in page.video_refs)
                 Log.fatal(f'{APP_NAME}: {max_id:d}')
-                return 0
+                return
 
             Log.info(f'page {pi - 1:d}...{" (this is the last page!)" if (0 < maxpage == pi - 1) else ""}')
 
             lower_count = 0
             queued_ids = set()
+            page_entries: list[VideoInfo] = []
             if full_download:
-                arefs = a_html.find_all('a', class_=video_ref_class)
-                orig_count = len(arefs)
-                for aref in arefs:
+                orig_count = len(page.video_refs)
+                for href, my_title, my_time in page.video_refs:
                     try:  # some post previews may be invalid
-                        cur_id = int(re_page_entry.search(aref.get('href')).group(1))
+                        cur_id = int(re_page_entry.search(href).group(1))
                     except Exception:
                         continue
                     if bound_res := check_id_bounds(cur_id):
@@ -115,26 +154,18 @@ async def process_pages() -> int:
                         Log.warn(f'Warning: id {cur_id:d} already queued, skipping')
                         continue
                     queued_ids.add(cur_id)
-                    my_title = str(aref.find('div', class_='thumb_title').text)
-                    my_utitle = str(aref['href'][:-1][aref['href'][:-1].rfind('/') + 1:])
-                    my_duration = get_time_seconds(str(aref.find('div', class_='time').text))
+                    my_utitle = href[:-1][href[:-1].rfind('/') + 1:]
+                    my_duration = get_time_seconds(my_time)
                     use_utitle = has_naming_flag(NamingFlags.USE_URL_TITLE)
-                    v_entries.append(VideoInfo(cur_id, my_utitle if use_utitle else my_title, m_duration=my_duration))
+                    page_entries.append(VideoInfo(cur_id, my_utitle if use_utitle else my_title, m_duration=my_duration))
             else:
-                content_div = a_html.find('div', class_='thumbs clearfix')
-
-                if content_div is None:
+                if page.previews is None:
                     Log.error(f'Error: cannot get content div for page {pi:d}')
                     continue
 
-                prev_all = content_div.find_all('div', class_='img wrap_image')
-                titl_all = content_div.find_all('div', class_='thumb_title')
-                utitl_all = content_div.find_all('a', class_='th js-open-popup')
-                orig_count = len(prev_all)
-                for i, p in enumerate(prev_all):
-                    link = str(p.get('data-preview'))
-                    title = str(titl_all[i].text)
-                    urltitle = str(utitl_all[i]['href'][:-1][utitl_all[i]['href'][:-1].rfind('/') + 1:])
+                orig_count = len(page.previews)
+                for link, title, uhref in page.previews:
+                    urltitle = uhref[:-1][uhref[:-1].rfind('/') + 1:]
                     v_id = re_preview_entry.search(link)
                     cur_id, cur_ext = int(v_id.group(1)), str(v_id.group(2))
                     if bound_res := check_id_bounds(cur_id):
@@ -148,30 +179,63 @@ async def process_pages() -> int:
                     use_prefix = has_naming_flag(NamingFlags.PREFIX)
                     use_title = has_naming_flag(NamingFlags.TITLE)
                     use_utitle = has_naming_flag(NamingFlags.USE_URL_TITLE)
-                    v_entries.append(VideoInfo(
+                    page_entries.append(VideoInfo(
                         cur_id, '', link, '', f'{PREFIX if use_prefix else ""}{cur_id:d}'
                         f'{f"_{urltitle if use_utitle else title}" if use_title else ""}_preview.{cur_ext}',
                     ))
 
+            if page_entries:
+                yield page_entries
+
             if pi - 1 > Config.start and 0 < lower_count == orig_count and not Config.scan_all_pages:
                 if not (0 < maxpage <= pi - 1):
                     Log.info(f'Page {pi - 1:d} has all post ids below lower bound. Pages scan stopped!')
                 break
 
+        await prefetcher.cancel()
+
+    async def prefilter_pages(pages: AsyncIterator[list[VideoInfo]]) -> AsyncIterator[tuple[list[VideoInfo], int]]:
+        """Yields each page's entries with existing items filtered out, plus filtered out items count"""
+        nonlocal found_count, removed_count
+        scan_dest_folder()
+        async for page_entries in pages:
+            page_entries.reverse()
+            page_count = len(page_entries)
+            filter_existing_items(page_entries)
+            found_count += page_count
+            removed_count += page_count - len(page_entries)
+            yield page_entries, page_count - len(page_entries)
+
+    def report_nothing_queued() -> int:
+        if found_count > 0:
+            Log.fatal(f'\nAll {found_count:d} videos already exist. Aborted.')
+        else:
+            Log.fatal('\nNo videos found. Aborted.')
+        return -1
+
+    found_count = removed_count = 0
+
+    async with create_session(), PagePrefetcher(get_page_addr, video_ref_class, not full_download) as prefetcher:
+        if Config.stream_pages and not Config.get_maxid:
+            await download([], full_download, 0, prefilter_pages(scan_pages(prefetcher)))
+            return report_nothing_queued() if found_count == removed_count else 0
+
+        v_entries: list[VideoInfo] = []
+        async for page_entries in scan_pages(prefetcher):
+            v_entries.extend(page_entries)
+        if Config.get_maxid:
+            return 0
+
         v_entries.reverse()
-        orig_count = len(v_entries)
+        found_count = len(v_entries)
 
-        if orig_count > 0:
+        if found_count > 0:
             prefilter_existing_items(v_entries)
 
-        removed_count = orig_count - len(v_entries)
+        removed_count = found_count - len(v_entries)
 
-        if orig_count == removed_count:
-            if orig_count > 0:
-                Log.fatal(f'\nAll {orig_count:d} videos already exist. Aborted.')
-            else:
-                Log.fatal('\nNo videos found. Aborted.')
-            return -1
+        if found_count == removed_count:
+            return report_nothing_queued()
 
         await download(v_entries, full_download, removed_count)
 
@@ -0,0 +1,56 @@
+# coding=UTF-8
+"""
+Author: trickerer (https://github.com/trickerer, https://github.com/trickerer01)
+"""
+#########################################
+#
+#
+
+from __future__ import annotations
+
+import multiprocessing
+from asyncio import get_running_loop
+from collections.abc import Callable
+from concurrent.futures import ProcessPoolExecutor
+from typing import TypeVar
+
+from .logger import Log
+
+__all__ = ('ParsePool',)
+
+T = TypeVar('T')
+
+
+class ParsePool:
+    """
+    Process pool html pages are parsed in (see -parseproc). Workers receive raw page bytes and return plain extracted data,
+    so neither soup construction nor tree walks are done on the event loop thread
+    """
+    _instance: ParsePool | None = None
+
+    @staticmethod
+    def get() -> ParsePool | None:
+        return ParsePool._instance
+
+    def __enter__(self) -> ParsePool:
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb) -> None:
+        self._executor.shutdown(wait=True, cancel_futures=True)
+        ParsePool._instance = None
+
+    def __init__(self, workers: int) -> None:
+        assert ParsePool._instance is None
+        ParsePool._instance = self
+
+        # spawned workers don't inherit event loop, sessions and threads of the main process
+        self._executor = ProcessPoolExecutor(workers, multiprocessing.get_context('spawn'))
+        Log.debug(f'[parse] using {workers:d} parser process(es)')
+
+    async def run(self, func: Callable[[], T]) -> T:
+        """Runs picklable **func** in a worker process"""
+        return await get_running_loop().run_in_executor(self._executor, func)
+
+#
+#
+#########################################
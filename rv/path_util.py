@@ -6,21 +6,27 @@ Author: trickerer (https://github.com/trickerer, https://github.com/trickerer01)
 #
 #
 
+import json
 import os
+import time
 from collections.abc import MutableSequence
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
 
 import psutil
 
 from .config import Config
-from .defs import DEFAULT_EXT, PREFIX, Quality
+from .defs import DEFAULT_EXT, DEST_SCAN_CACHE_RACY_TIME, MAX_DEST_SCAN_THREADS, PREFIX, UTF8, Quality
 from .iinfo import VideoInfo
 from .logger import Log
 from .rex import re_media_filename
 from .util import normalize_path
 
 __all__ = (
+    'FoundFilesIndex',
     'file_already_exists',
     'file_already_exists_arr',
+    'filter_existing_id',
+    'filter_existing_items',
     'is_file_being_used',
     'prefilter_existing_items',
     'register_new_file',
@@ -29,7 +35,62 @@ __all__ = (
 )
 
 found_filenames_dict: dict[str, list[str]] = {}
-media_matches_cache: dict[str, tuple[str, Quality]] = {}
+
+
+class FoundFilesIndex:
+    """
+    Media files found in destination folders, indexed by video id: id -> [(folder, file name, quality)]\n
+    Built once by scan_dest_folder(), kept in sync with found_filenames_dict by register_new_file() / unregister_unfinished_file()
+    """
+    _files: dict[str, list[tuple[str, str, Quality]]] = {}
+    _folder_nums: dict[str, int] = {}
+
+    @staticmethod
+    def _reset() -> None:
+        found_filenames_dict.clear()
+        FoundFilesIndex._files.clear()
+        FoundFilesIndex._folder_nums.clear()
+
+    @staticmethod
+    def build() -> None:
+        FoundFilesIndex._files.clear()
+        FoundFilesIndex._folder_nums.clear()
+        for folder, filenames in found_filenames_dict.items():
+            FoundFilesIndex.add_folder(folder)
+            for fname in filenames:
+                FoundFilesIndex.add(folder, fname)
+
+    @staticmethod
+    def add_folder(folder: str) -> None:
+        if folder not in FoundFilesIndex._folder_nums:
+            FoundFilesIndex._folder_nums[folder] = len(FoundFilesIndex._folder_nums)
+
+    @staticmethod
+    def add(folder: str, fname: str) -> None:
+        f_id, f_quality = get_media_file_match(fname)
+        if f_id:
+            if f_id not in FoundFilesIndex._files:
+                FoundFilesIndex._files[f_id] = []
+            FoundFilesIndex._files[f_id].append((folder, fname, f_quality))
+
+    @staticmethod
+    def remove(folder: str, fname: str) -> None:
+        f_id = get_media_file_match(fname)[0]
+        files = FoundFilesIndex._files.get(f_id, [])
+        for i, (f_folder, f_name, _) in enumerate(files):
+            if f_folder == folder and f_name == fname:
+                del files[i]
+                break
+        if not files:
+            FoundFilesIndex._files.pop(f_id, None)
+
+    @staticmethod
+    def get(idi: int) -> list[tuple[str, str, Quality]]:
+        """Returns files with given id in the same order they appear in found_filenames_dict"""
+        files = FoundFilesIndex._files.get(str(idi), [])
+        if len(files) > 1:
+            files = sorted(files, key=lambda f: FoundFilesIndex._folder_nums[f[0]])
+        return files
 
 
 def report_duplicates() -> None:
@@ -58,6 +119,62 @@ def report_duplicates() -> None:
         Log.info('No duplicates found')
 
 
+class DestScanManifest:
+    """
+    Destination folders listing from previous run, keyed by folder path: folder -> [mtime_ns, [subfolders], [files]]\n
+    Folder modification time changes whenever its own entries are added, removed or renamed so unchanged folders need not be listed again
+    """
+    def __init__(self, enabled: bool) -> None:
+        self._enabled = enabled
+        self._folders: dict[str, list] = {}
+        self._new_folders: dict[str, list] = {}
+        if self._enabled and os.path.isfile(self.file_path()):
+            try:
+                with open(self.file_path(), 'rt', encoding=UTF8) as mfile:
+                    self._folders = json.load(mfile)
+            except Exception:
+                Log.error(f'Error: unable to read dest scan manifest \'{self.file_path()}\'! Ignored')
+                self._folders = {}
+
+    @staticmethod
+    def file_path() -> str:
+        return f'{Config.dest_base}{PREFIX}!dirscan.json'
+
+    def list_folder(self, base_folder: str) -> tuple[list[str], list[str]]:
+        """Returns subfolders (full normalized paths) and file names in **base_folder**, in listing order. Thread-safe"""
+        if not os.path.isdir(base_folder):
+            return [], []
+        mtime_ns = os.stat(base_folder).st_mtime_ns if self._enabled else 0
+        if self._enabled and self._folders.get(base_folder, [-1])[0] == mtime_ns:
+            _, subfolders, files = self._new_folders[base_folder] = self._folders[base_folder]
+            return subfolders, files
+        subfolders: list[str] = []
+        files: list[str] = []
+        with os.scandir(base_folder) as listing:
+            for dentry in listing:
+                if dentry.is_dir():
+                    subfolders.append(normalize_path(f'{base_folder}{dentry.name}'))
+                elif dentry.is_file():
+                    files.append(dentry.name)
+        # folder modified too recently can still be modified within the same mtime tick, it can't be trusted later
+        if self._enabled and time.time() - mtime_ns / 1_000_000_000 > DEST_SCAN_CACHE_RACY_TIME:
+            self._new_folders[base_folder] = [mtime_ns, subfolders, files]
+        return subfolders, files
+
+    @property
+    def hits(self) -> int:
+        return sum(1 for folder, entry in self._new_folders.items() if self._folders.get(folder) is entry)
+
+    def save(self) -> None:
+        if not self._enabled or not os.path.isdir(Config.dest_base):
+            return
+        try:
+            with open(self.file_path(), 'wt', encoding=UTF8) as mfile:
+                json.dump(self._new_folders, mfile)
+        except Exception:
+            Log.error(f'Error: unable to save dest scan manifest \'{self.file_path()}\'!')
+
+
 def scan_dest_folder() -> None:
     """
     Scans base destination folder plus {Config.folder_scan_depth} levels of subfolders and
@@ -68,6 +185,7 @@ def scan_dest_folder() -> None:
     |____file3
     |__file1
     => files{'folder1': ['file1'], 'subfolder1': ['file2','file3']}\n
+    Folders are listed in parallel, dict order is the same as of recursive walk.
     This function may only be called once!
     """
     assert len(found_filenames_dict.keys()) == 0
@@ -81,40 +199,51 @@ def scan_dest_folder() -> None:
             if not dirname:
                 break
 
-        def scan_folder(base_folder: str, level: int) -> None:
-            if os.path.isdir(base_folder):
-                with os.scandir(base_folder) as listing:
-                    for dentry in listing:
-                        fullpath = f'{base_folder}{dentry.name}'
-                        if dentry.is_dir():
-                            fullpath = normalize_path(fullpath)
-                            if level < scan_depth:
-                                found_filenames_dict[fullpath] = []
-                                scan_folder(fullpath, level + 1)
-                        elif dentry.is_file():
-                            found_filenames_dict[base_folder].append(dentry.name)
-
-        found_filenames_dict[dest_base] = []
-        scan_folder(dest_base, 0)
+        manifest = DestScanManifest(bool(Config.dest_scan_cache))
+        listings: dict[str, tuple[list[str], list[str]]] = {}
+
+        def scan_tree(root_folder: str, root_level: int) -> None:
+            with ThreadPoolExecutor(MAX_DEST_SCAN_THREADS) as pool:
+                pending = {pool.submit(manifest.list_folder, root_folder): (root_folder, root_level)}
+                while pending:
+                    done, _ = wait(pending, return_when=FIRST_COMPLETED)
+                    for future in done:
+                        base_folder, level = pending.pop(future)
+                        listings[base_folder] = future.result()
+                        if level < scan_depth:
+                            for subfolder in listings[base_folder][0]:
+                                pending[pool.submit(manifest.list_folder, subfolder)] = (subfolder, level + 1)
+
+            def collect(base_folder: str, level: int) -> None:
+                subfolders, files = listings[base_folder]
+                found_filenames_dict[base_folder].extend(files)
+                if level < scan_depth:
+                    for subfolder in subfolders:
+                        found_filenames_dict[subfolder] = []
+                        collect(subfolder, level + 1)
+
+            found_filenames_dict[root_folder] = []
+            collect(root_folder, root_level)
+
+        scan_tree(dest_base, 0)
         if Config.dest_base not in found_filenames_dict:
-            found_filenames_dict[Config.dest_base] = []
-            scan_folder(Config.dest_base, Config.folder_scan_levelup)
+            scan_tree(Config.dest_base, Config.folder_scan_levelup)
+        manifest.save()
+        FoundFilesIndex.build()
         base_files_count = len(found_filenames_dict[dest_base])
         total_files_count = sum(len(li) for li in found_filenames_dict.values())
+        cached_str = f', {manifest.hits:d} folder(s) unchanged' if Config.dest_scan_cache else ''
         Log.info(f'Found {base_files_count:d} file(s) in base and '
                  f'{total_files_count - base_files_count:d} file(s) in {len(found_filenames_dict.keys()) - 1:d} subfolder(s) '
-                 f'(total files: {total_files_count:d}, scan depth: {scan_depth:d})')
+                 f'(total files: {total_files_count:d}, scan depth: {scan_depth:d}{cached_str})')
 
     if Config.report_duplicates:
         report_duplicates()
 
 
 def get_media_file_match(fname: str) -> tuple[str, Quality]:
-    if fname not in media_matches_cache:
-        f_match = re_media_filename.match(fname)
-        f_id, f_quality = (f_match.group(1), Quality(f_match.group(2) or '')) if f_match else ('', '')
-        media_matches_cache[fname] = (f_id, f_quality)
-    return media_matches_cache[fname]
+    f_match = re_media_filename.match(fname)
+    return (f_match.group(1), Quality(f_match.group(2) or '')) if f_match else ('', '')
 
 
 def register_new_file(vi: VideoInfo) -> None:
@@ -124,48 +253,38 @@ def register_new_file(vi: VideoInfo) -> None:
             found_filenames_dict[base_folder] = [vi.filename]
         else:
             found_filenames_dict[base_folder].append(vi.filename)
+        FoundFilesIndex.add_folder(base_folder)
+        FoundFilesIndex.add(base_folder, vi.filename)
 
 
 def unregister_unfinished_file(vi: VideoInfo) -> None:
     base_folder = vi.my_folder
     if file_exists_in_folder(base_folder, vi.id, vi.quality, False):
         found_filenames_dict[base_folder].remove(vi.filename)
+        FoundFilesIndex.remove(base_folder, vi.filename)
 
 
 def file_exists_in_folder(base_folder: str, idi: int, quality: Quality, check_folder: bool) -> str:
-    orig_file_names = found_filenames_dict.get(base_folder)
-    if orig_file_names is not None and (not check_folder or os.path.isdir(base_folder)):
-        for fname in orig_file_names:
-            f_id, f_quality = get_media_file_match(fname)
-            if f_id and str(idi) == f_id and (not quality or not f_quality or quality <= f_quality):
+    for folder, fname, f_quality in FoundFilesIndex.get(idi):
+        if folder == base_folder and (not quality or not f_quality or quality <= f_quality):
+            if not check_folder or os.path.isdir(base_folder):
                 return f'{normalize_path(base_folder)}{fname}'
+            break
     return ''
 
 
 def file_already_exists(idi: int, quality: Quality | None = None, check_folder=True) -> str:
-    for fullpath in found_filenames_dict:
-        fullpath = file_exists_in_folder(fullpath, idi, quality or Config.quality, check_folder)
-        if len(fullpath) > 0:
-            return fullpath
+    quality = quality or Config.quality
+    for folder, fname, f_quality in FoundFilesIndex.get(idi):
+        if (not quality or not f_quality or quality <= f_quality) and (not check_folder or os.path.isdir(folder)):
+            return f'{normalize_path(folder)}{fname}'
     return ''
 
 
-def file_exists_in_folder_arr(base_folder: str, idi: int, quality: Quality) -> list[str]:
-    orig_file_names = found_filenames_dict.get(base_folder)
-    folder_files: list[str] = []
-    if orig_file_names is not None and os.path.isdir(base_folder):
-        for fname in orig_file_names:
-            f_id, f_quality = get_media_file_match(fname)
-            if f_id and str(idi) == f_id and (not quality or not f_quality or quality == f_quality):
-                folder_files.append(f'{normalize_path(base_folder)}{fname}')
-    return folder_files
-
-
 def file_already_exists_arr(idi: int, quality: Quality) -> list[str]:
-    found_files: list[str] = []
-    for fullpath in found_filenames_dict:
-        found_files.extend(file_exists_in_folder_arr(fullpath, idi, quality or Config.quality))
-    return found_files
+    quality = quality or Config.quality
+    return [f'{normalize_path(folder)}{fname}' for folder, fname, f_quality in FoundFilesIndex.get(idi)
+            if (not quality or not f_quality or quality == f_quality) and os.path.isdir(folder)]
 
 
 def prefilter_existing_items(vi_list: MutableSequence[VideoInfo]) -> None:
@@ -175,16 +294,31 @@ def prefilter_existing_items(vi_list: MutableSequence[VideoInfo]) -> None:
     This function may only be called once!
     """
     scan_dest_folder()
+    filter_existing_items(vi_list)
+
+
+def filter_existing_items(vi_list: MutableSequence[VideoInfo]) -> None:
+    """Same as prefilter_existing_items() but uses already scanned dest folder, can be called any number of times"""
     if Config.continue_mode:
         return
 
     i: int
     for i in reversed(range(len(vi_list))):
-        if fullpath := file_already_exists(vi_list[i].id, None, False):
-            Log.info(f'Info: {vi_list[i].sname} found in \'{os.path.split(fullpath)[0]}/\'. Skipped.')
+        if filter_existing_id(vi_list[i].id):
             del vi_list[i]
 
 
+def filter_existing_id(id_: int) -> bool:
+    """Same as filter_existing_items() but for a single id, no VideoInfo is required. Returns True if id is filtered out"""
+    if Config.continue_mode:
+        return False
+
+    if fullpath := file_already_exists(id_, None, False):
+        Log.info(f'Info: {PREFIX}{id_:d}.{DEFAULT_EXT} found in \'{os.path.split(fullpath)[0]}/\'. Skipped.')
+        return True
+    return False
+
+
 def is_file_being_used(filepath: str) -> str:
     """
     :param filepath: Path the to file in question
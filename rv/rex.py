@@ -13,6 +13,7 @@ from .defs import EXTENSIONS_V, PREFIX, QUALITIES
 # common
 re_media_filename = re.compile(fr'^(?:{PREFIX})?(\d+).*?(?:_({"|".join(QUALITIES)}))?\.(?:{"|".join(EXTENSIONS_V)})$')
 re_infolist_filename = re.compile(fr'{PREFIX}!(?:tag|description|comment)s_\d+-\d+\.txt')
+re_infosegment_filename = re.compile(fr'{PREFIX}!(?:tag|description|comment)s_seg\d+\.txt')
 re_replace_symbols = re.compile(r'[^0-9a-zA-Z.,_+%!\-()\[\] ]+')
 re_ext = re.compile(r'(\.[^&]{3,5})&')
 re_time = re.compile(r'\d+(?::\d+){1,2}')
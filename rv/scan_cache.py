@@ -0,0 +1,103 @@
+# coding=UTF-8
+"""
+Author: trickerer (https://github.com/trickerer, https://github.com/trickerer01)
+"""
+#########################################
+#
+#
+
+from __future__ import annotations
+
+import json
+import os
+import sqlite3
+import time
+from threading import Lock
+
+from .config import Config
+from .defs import PREFIX, SCAN_CACHE_COMMIT_INTERVAL, StrPair
+from .extract import VideoPageData
+from .logger import Log
+
+__all__ = ('ScanCache',)
+
+
+class ScanCache:
+    """
+    Persistent storage of extracted video page data, keyed by video id\n
+    Lets scan_video() skip fetching popup pages which were scanned recently (see --scan-cache-ttl).
+    Database lives in dest folder so load() and store() are meant to be run in fs threads (see afs)
+    """
+    _instance: ScanCache | None = None
+
+    @staticmethod
+    def get() -> ScanCache | None:
+        return ScanCache._instance
+
+    @staticmethod
+    def file_path() -> str:
+        return f'{Config.dest_base}{PREFIX}!scancache.db'
+
+    def __enter__(self) -> ScanCache:
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb) -> None:
+        self.close()
+        ScanCache._instance = None
+
+    def __init__(self, db_path: str, ttl_minutes: int) -> None:
+        assert ScanCache._instance is None
+        ScanCache._instance = self
+
+        self._ttl: float = ttl_minutes * 60.0
+        self._pending_writes: int = 0
+        self._hits: int = 0
+        self._misses: int = 0
+        self._lock = Lock()
+        if not os.path.isdir(os.path.dirname(db_path)):
+            os.makedirs(os.path.dirname(db_path))
+        self._db: sqlite3.Connection | None = sqlite3.connect(db_path, check_same_thread=False)
+        self._db.execute(
+            'CREATE TABLE IF NOT EXISTS scans ('
+            'id INTEGER PRIMARY KEY, scanned REAL NOT NULL, with_comments INTEGER NOT NULL, data TEXT NOT NULL)',
+        )
+        self._db.commit()
+
+    def close(self) -> None:
+        if self._db is not None:
+            self._db.commit()
+            self._db.close()
+            self._db = None
+            Log.debug(f'[scan cache] {self._hits:d} hits, {self._misses:d} misses')
+
+    def load(self, id_: int, with_comments: bool) -> VideoPageData | None:
+        """Returns cached page data for **id_** if it is not older than TTL and contains all requested info"""
+        with self._lock:
+            row = self._db.execute('SELECT scanned, with_comments, data FROM scans WHERE id = ?', (id_,)).fetchone()
+        if row is None or time.time() - row[0] > self._ttl or (with_comments and not row[1]):
+            self._misses += 1
+            return None
+        try:
+            page = VideoPageData(**json.loads(row[2]))
+            page = page._replace(comments=[StrPair(*c) for c in page.comments],
+                                 links=[StrPair(*lin) for lin in page.links] if page.links is not None else None)
+        except Exception:
+            Log.error(f'[scan cache] invalid cache entry for id {id_:d}, ignored')
+            self._misses += 1
+            return None
+        self._hits += 1
+        return page
+
+    def store(self, id_: int, page: VideoPageData, with_comments: bool) -> None:
+        data = json.dumps(page._asdict())
+        with self._lock:
+            self._db.execute('INSERT OR REPLACE INTO scans (id, scanned, with_comments, data) VALUES (?, ?, ?, ?)',
+                             (id_, time.time(), int(with_comments), data))
+            self._pending_writes += 1
+            if self._pending_writes >= SCAN_CACHE_COMMIT_INTERVAL:
+                self._db.commit()
+                self._pending_writes = 0
+
+#
+#
+#########################################
@@ -19,7 +19,7 @@ from .defs import (
 )
 from .iinfo import VideoInfo
 from .logger import Log
-from .tagger import extract_id_or_group, is_filtered_out_by_extra_tags, valid_extra_tag
+from .tagger import ExtraTagsMatcher, extract_id_or_group, valid_extra_tag
 from .validators import valid_duration, valid_int, valid_rating
 
 __all__ = ('DownloadScenario',)
@@ -39,6 +39,7 @@ class SubQueryParams:
         self.minscore: int | None = minscore
         self.untagged_policy: str = utp or ''
         self.id_sequence: list[int] = id_sequence or []
+        self.matcher: ExtraTagsMatcher = ExtraTagsMatcher(self.extra_tags)
 
     @property
     def utp(self) -> str:
@@ -121,7 +122,7 @@ class DownloadScenario:
 
     def get_matching_subquery(self, vi: VideoInfo, tags_raw: list[str], score: str, rating: str) -> SubQueryParams | None:
         for sq in self.queries:
-            if not is_filtered_out_by_extra_tags(vi, tags_raw, sq.extra_tags, sq.id_sequence, sq.subfolder):
+            if not sq.matcher.is_filtered_out(vi, tags_raw, sq.id_sequence, sq.subfolder):
                 sq_skip = False
                 for vsrs, csri, srn, pc in zip((score, rating), (sq.minscore, sq.minrating), ('score', 'rating'), ('', '%'), strict=True):
                     if len(vsrs) > 0 and csri is not None and sq_skip is False:
@@ -0,0 +1,145 @@
+# coding=UTF-8
+"""
+Author: trickerer (https://github.com/trickerer, https://github.com/trickerer01)
+"""
+#########################################
+#
+#
+
+from __future__ import annotations
+
+from asyncio.tasks import as_completed
+from collections import deque
+
+from aiohttp import ClientSession
+
+from . import afs
+from .config import Config
+from .defs import PREFIX, SCREENSHOTS_COUNT, SCREENSHOTS_TASKS_MAX, DownloadResult, Mem
+from .fetch_html import ClientSessionWrapper
+from .fwriter import FileWriter
+from .iinfo import VideoInfo
+from .logger import Log
+from .metrics import Metrics
+from .util import StateSignal
+
+__all__ = ('ScreenshotWorker',)
+
+
+class ScreenshotWorker:
+    """
+    Downloads timeline screenshots of processed videos in parallel with video downloads, up to SCREENSHOTS_TASKS_MAX at once.
+    Uses its own connection pool and doesn't go through request queue, so screenshots never take video requests' turns.
+    Screenshots already saved are skipped without a request
+    """
+    _instance: ScreenshotWorker | None = None
+
+    @staticmethod
+    def get() -> ScreenshotWorker | None:
+        return ScreenshotWorker._instance
+
+    def __enter__(self) -> ScreenshotWorker:
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb) -> None:
+        ScreenshotWorker._instance = None
+
+    def __init__(self) -> None:
+        assert ScreenshotWorker._instance is None
+        ScreenshotWorker._instance = self
+
+        self._session: ClientSession | None = None
+        self._queue: deque[tuple[VideoInfo, int]] = deque()
+        self._remaining: dict[int, int] = {}
+        '''number of screenshots not yet processed for each video'''
+        self._failed: dict[int, int] = {}
+        self._input_open: bool = True
+        self._state_signal: StateSignal = StateSignal()
+        self._results: dict[DownloadResult, int] = {}
+
+    def queue(self, vi: VideoInfo) -> None:
+        if vi.id in self._remaining:
+            return
+        self._remaining[vi.id] = SCREENSHOTS_COUNT
+        self._queue.extend((vi, scr_idx + 1) for scr_idx in range(SCREENSHOTS_COUNT))
+        self._state_signal.notify()
+
+    def close_input(self) -> None:
+        """No more videos are going to be queued, worker finishes once queue is empty"""
+        self._input_open = False
+        self._state_signal.notify()
+
+    def has_work(self) -> bool:
+        return bool(self._queue) or self._input_open
+
+    async def _download_screenshot(self, vi: VideoInfo, scr_num: int) -> DownloadResult:
+        sname = f'{PREFIX}{vi.id:d}_{scr_num:02d}.webp'
+        sfilename = f'{f"{vi.subfolder}/" if len(vi.subfolder) > 0 else ""}{PREFIX}{vi.id:d}/{scr_num:02d}.webp'
+        my_folder = f'{vi.my_folder}{PREFIX}{vi.id:d}/'
+        fullpath = f'{my_folder}{scr_num:02d}.webp'
+        my_link = f'{Config.site_base_url}/contents/videos_screenshots/{vi.id - vi.id % 1000:d}/{vi.id:d}/336x189/{scr_num:d}.jpg'
+
+        if await afs.isfile(fullpath):
+            Log.trace(f'[screenshots] {sfilename} already exists, skipped')
+            return DownloadResult.FAIL_ALREADY_EXISTS
+
+        if not await afs.isdir(my_folder):
+            try:
+                await afs.makedirs(my_folder, exist_ok=True)  # other screenshots of this video may be creating it right now
+            except Exception:
+                Log.fatal(f'ERROR: Unable to create subfolder \'{my_folder}\'!')
+                raise
+
+        ret = DownloadResult.SUCCESS
+        try:
+            async with self._session.get(my_link, timeout=Config.timeout) as r:
+                if r.status == 404:
+                    Log.error(f'Got 404 for {sname}...!')
+                    return DownloadResult.FAIL_NOT_FOUND
+                if r.content_type and 'text' in r.content_type:
+                    Log.error(f'File not found at {my_link}!')
+                    return DownloadResult.FAIL_NOT_FOUND
+                r.raise_for_status()
+
+                expected_size = r.content_length
+                async with FileWriter(fullpath, 0, buffer_size=256 * Mem.KB) as outf:
+                    async for chunk in r.content.iter_any():
+                        await outf.write(chunk)
+
+            file_size = await afs.getsize(fullpath)
+            if expected_size and file_size != expected_size:
+                Log.error(f'Error: file size mismatch for {sfilename}: {file_size:d} / {expected_size:d}')
+                ret = DownloadResult.FAIL_RETRIES
+        except Exception as e:
+            Log.error(f'{sname}: {e.__class__.__name__}: {e!s}')
+            ret = DownloadResult.FAIL_RETRIES
+        if ret != DownloadResult.SUCCESS and await afs.isfile(fullpath):
+            # partial file would be taken for a complete one next time
+            await afs.remove(fullpath)
+        return ret
+
+    async def _at_task_finish(self, vi: VideoInfo, result: DownloadResult) -> None:
+        Metrics.inc('screenshot_results_total', result=result.name)
+        self._results[result] = self._results.get(result, 0) + 1
+        if result not in (DownloadResult.SUCCESS, DownloadResult.FAIL_ALREADY_EXISTS):
+            self._failed[vi.id] = self._failed.get(vi.id, 0) + 1
+        self._remaining[vi.id] -= 1
+        if self._remaining[vi.id] == 0 and vi.id in self._failed:
+            Log.warn(f'{vi.sffilename}: {self._failed.pop(vi.id):d} / {SCREENSHOTS_COUNT:d} screenshots failed to download')
+
+    async def _cons(self) -> None:
+        while await self._state_signal.wait_for(lambda: bool(self._queue) or not self._input_open) and self._queue:
+            vi, scr_num = self._queue.popleft()
+            await self._at_task_finish(vi, await self._download_screenshot(vi, scr_num))
+
+    async def run(self) -> None:
+        async with ClientSessionWrapper.make_session('screenshots', limit=SCREENSHOTS_TASKS_MAX) as self._session:
+            for cv in as_completed([self._cons() for _ in range(SCREENSHOTS_TASKS_MAX)]):
+                await cv
+        self._session = None
+        if self._results:
+            Log.info(f'[screenshots] {", ".join(f"{result.name}: {count:d}" for result, count in sorted(self._results.items()))}')
+
+#
+#
+#########################################
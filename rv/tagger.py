@@ -8,8 +8,9 @@ Author: trickerer (https://github.com/trickerer, https://github.com/trickerer01)
 
 import json
 import os
-from collections.abc import Callable, Collection, Iterable, MutableSequence
-from typing import TypeAlias
+import re
+from collections.abc import Callable, Collection, Iterable, MutableSequence, Set
+from typing import NamedTuple, TypeAlias
 
 from .config import Config
 from .defs import (
@@ -26,6 +27,7 @@ from .defs import (
 )
 from .iinfo import VideoInfo
 from .logger import Log
+from .nums_index import NumsIndex
 from .rex import (
     prepare_regex_fullmatch,
     re_bracketed_tag,
@@ -45,11 +47,13 @@ from .rex import (
 from .util import assert_nonempty, normalize_path
 
 __all__ = (
+    'ExtraTagsMatcher',
     'extract_id_or_group',
     'extract_ids_from_links',
     'filtered_tags',
     'get_artist_num',
     'get_category_num',
+    'get_extra_tags_matcher',
     'get_matching_tag',
     'get_tag_num',
     'is_filtered_out_by_extra_tags',
@@ -64,15 +68,18 @@ __all__ = (
 )
 
 TagConflictsDict: TypeAlias = dict[str, tuple[list[str], list[str]]]
+CompiledTag: TypeAlias = str | re.Pattern[str]
 
-TAG_NUMS: dict[str, str] = {}
-ART_NUMS: dict[str, str] = {}
-CAT_NUMS: dict[str, str] = {}
+TAG_NUMS = NumsIndex(FILE_LOC_TAGS, 'tag nums')
+ART_NUMS = NumsIndex(FILE_LOC_ARTS, 'artist nums')
+CAT_NUMS = NumsIndex(FILE_LOC_CATS, 'category nums')
 PLA_NUMS: dict[str, str] = {}
 PLA_NUMS_REV: dict[str, str] = {}
 TAG_ALIASES: dict[str, str] = {}
 TAG_CONFLICTS: TagConflictsDict = {}
 
+extra_tags_matchers: dict[tuple[str, ...], 'ExtraTagsMatcher'] = {}
+
 
 def valid_playlist_name(plist: str) -> tuple[int, str]:
     try:
@@ -295,10 +302,9 @@ def expand_tags(pwtag: str) -> Iterable[str]:
             load_tag_nums()
         Log.debug(f'Expanding tags from wtag \'{pwtag}\'...')
         pat = prepare_regex_fullmatch(normalize_wtag(pwtag))
-        for tag in TAG_NUMS:
-            if pat.fullmatch(tag):
-                Log.debug(f' - \'{tag}\'')
-                expanded_tags.add(tag)
+        for tag in TAG_NUMS.expand(pat, pwtag):
+            Log.debug(f' - \'{tag}\'')
+            expanded_tags.add(tag)
     return expanded_tags
 
 
@@ -311,10 +317,9 @@ def expand_artists(pwtag: str) -> Iterable[str]:
             load_artist_nums()
         Log.debug(f'Expanding artists from wtag \'{pwtag}\'...')
         pat = prepare_regex_fullmatch(normalize_wtag(pwtag))
-        for artist in ART_NUMS:
-            if pat.fullmatch(artist):
-                Log.debug(f' - \'{artist}\'')
-                expanded_artists.add(artist)
+        for artist in ART_NUMS.expand(pat, pwtag):
+            Log.debug(f' - \'{artist}\'')
+            expanded_artists.add(artist)
     return expanded_artists
 
 
@@ -327,10 +332,9 @@ def expand_categories(pwtag: str) -> Iterable[str]:
             load_category_nums()
         Log.debug(f'Expanding categories from wtag \'{pwtag}\'...')
         pat = prepare_regex_fullmatch(normalize_wtag(pwtag))
-        for category in CAT_NUMS:
-            if pat.fullmatch(category):
-                Log.debug(f' - \'{category}\'')
-                expanded_categories.add(category)
+        for category in CAT_NUMS.expand(pat, pwtag):
+            Log.debug(f' - \'{category}\'')
+            expanded_categories.add(category)
     return expanded_categories
 
 
@@ -358,16 +362,24 @@ def normalize_wtag(wtag: str) -> str:
     return wtag
 
 
-def get_matching_tag(wtag: str, mtags: Iterable[str], *, force_regex=False) -> str | None:
-    if not is_wtag(wtag) and not force_regex:
-        return wtag if wtag in mtags else None
-    pat = prepare_regex_fullmatch(normalize_wtag(wtag))
+def compile_wtag(wtag: str, *, force_regex=False) -> CompiledTag:
+    return prepare_regex_fullmatch(normalize_wtag(wtag)) if is_wtag(wtag) or force_regex else wtag
+
+
+def get_compiled_matching_tag(ctag: CompiledTag, mtags: Iterable[str], mtags_set: Set[str] | None = None) -> str | None:
+    """**mtags_set** is optional set of **mtags** for plain tags lookup, regex tags are matched in **mtags** order"""
+    if isinstance(ctag, str):
+        return ctag if ctag in (mtags if mtags_set is None else mtags_set) else None
     for htag in mtags:
-        if pat.fullmatch(htag):
+        if ctag.fullmatch(htag):
             return htag
     return None
 
 
+def get_matching_tag(wtag: str, mtags: Iterable[str], *, force_regex=False) -> str | None:
+    return get_compiled_matching_tag(compile_wtag(wtag, force_regex=force_regex), mtags)
+
+
 def get_or_group_matching_tag(orgr: str, mtags: Iterable[str]) -> str | None:
     for tag in orgr[1:-1].split('~'):
         mtag = get_matching_tag(tag, mtags)
@@ -467,77 +479,152 @@ def solve_tag_conflicts(vi: VideoInfo, tags_raw: list[str]) -> None:
                 tags_raw.remove(ctag)
 
 
-def is_filtered_out_by_extra_tags(vi: VideoInfo, tags_raw: list[str], extra_tags: list[str],
-                                  id_seq: list[int], subfolder: str, id_seq_ex: list[int] | None = None) -> bool:
-    suc = True
-    sname = f'{f"[{subfolder}] " if subfolder else ""}Video {vi.sname}'
-    if id_seq and vi.id not in id_seq and not (id_seq_ex and vi.id in id_seq_ex):
-        suc = False
-        Log.trace(f'{sname} isn\'t contained in id list \'{id_seq!s}\'. Skipped!')
-
-    for extag in extra_tags:
+class CompiledExtraTag(NamedTuple):
+    extag: str
+    negative: bool
+    my_extag: str
+    utag: bool
+    base: list[CompiledTag]
+    '''or group / and group members or a single tag (utag without prefix), matched against video tags or uploader'''
+    text: list[CompiledTag]
+    '''same, converted for title / description matching'''
+
+
+class ExtraTagsMatcher:
+    """
+    Extra tags prepared once for repeated matching: plain tags are looked up directly and wildcards are precompiled.
+    Makes the same decisions and trace output as parsing every extra tag for each video
+    """
+    def __init__(self, extra_tags: Iterable[str]) -> None:
+        self.extra_tags: list[str] = list(extra_tags)
+        self._ctags: list[CompiledExtraTag] = [self._compile(extag) for extag in self.extra_tags]
+
+    @staticmethod
+    def _compile(extag: str) -> CompiledExtraTag:
         if extag.startswith('('):
-            or_match_base = get_or_group_matching_tag(extag, tags_raw)
-            or_match_titl = match_text(extag, vi.title, 'or') if Config.check_title_pos and vi.title else None
-            or_match_desc = match_text(extag, vi.description, 'or') if Config.check_description_pos and vi.description else None
-            if or_match_base:
-                Log.trace(f'{sname} has BASE POS match: \'{or_match_base!s}\'')
-            if or_match_titl:
-                Log.trace(f'{sname} has TITL POS match: \'{or_match_titl!s}\'')
-            if or_match_desc:
-                Log.trace(f'{sname} has DESC POS match: \'{or_match_desc!s}\'')
-            if not bool(or_match_base or or_match_titl or or_match_desc):
-                suc = False
-                Log.trace(f'{sname} misses required tag matching \'{extag}\'. Skipped!')
+            return CompiledExtraTag(extag, False, extag, False,
+                                    [compile_wtag(tag) for tag in extag[1:-1].split('~')],
+                                    [compile_wtag(tag) for tag in convert_extra_tag_for_text_matching(extag)[1:-1].split('~')])
         elif extag.startswith('-('):
-            neg_matches = get_neg_and_group_matches(extag, tags_raw)
-            for conf, cn, td in zip(
-                (Config.check_title_neg, Config.check_description_neg),
-                ('TITL', 'DESC'),
-                (vi.title, vi.description),
-                strict=True,
-            ):
-                if conf and td:
-                    for tmatch in match_text(extag, td, 'and'):
-                        tmatch_s = tmatch[:100]
-                        Log.trace(f'{sname} has {cn} NEG match: \'{tmatch_s}\'')
-                        if tmatch_s not in neg_matches:
-                            neg_matches.append(f'{tmatch_s}...')
-            if neg_matches:
-                suc = False
-                Log.info(f'{sname} contains excluded tags combination \'{extag}\': {",".join(neg_matches)}. Skipped!')
-        else:
-            negative = extag.startswith('-')
-            my_extag = extag[1:] if negative else extag
-            if is_utag(my_extag):
-                my_utag = my_extag[2:]
-                mtag = get_matching_tag(my_utag, (vi.uploader,))
-                if negative is False and mtag:
-                    Log.trace(f'{sname} has BASE POS match: \'{mtag}\' (from utag \'{my_extag}\')')
-            else:
-                mtag = get_matching_tag(my_extag, tags_raw)
-                if negative is False and mtag:
-                    Log.trace(f'{sname} has BASE POS match: \'{mtag}\'')
-                for conf, cn, np, td in zip(
-                    (Config.check_title_pos, Config.check_title_neg, Config.check_description_pos, Config.check_description_neg),
-                    ('TITL', 'TITL', 'DESC', 'DESC'),
-                    ('POS', 'NEG', 'POS', 'NEG'),
-                    (vi.title, vi.title, vi.description, vi.description),
+            return CompiledExtraTag(extag, True, extag, False,
+                                    [compile_wtag(tag, force_regex=True) for tag in extag[2:-1].split(',')],
+                                    [compile_wtag(tag, force_regex=True) for tag in convert_extra_tag_for_text_matching(extag)[2:-1].split(',')])
+        negative = extag.startswith('-')
+        my_extag = extag[1:] if negative else extag
+        if is_utag(my_extag):
+            return CompiledExtraTag(extag, negative, my_extag, True, [compile_wtag(my_extag[2:])], [])
+        return CompiledExtraTag(extag, negative, my_extag, False,
+                                [compile_wtag(my_extag)], [compile_wtag(convert_extra_tag_for_text_matching(my_extag))])
+
+    @staticmethod
+    def _or_group_match(ctags: list[CompiledTag], mtags: Iterable[str], mtags_set: Set[str] | None = None) -> str | None:
+        for ctag in ctags:
+            mtag = get_compiled_matching_tag(ctag, mtags, mtags_set)
+            if mtag:
+                return mtag
+        return None
+
+    @staticmethod
+    def _neg_and_group_matches(ctags: list[CompiledTag], mtags: Iterable[str], mtags_set: Set[str] | None = None) -> list[str]:
+        matched_tags: list[str] = []
+        for ctag in ctags:
+            mtag = get_compiled_matching_tag(ctag, mtags, mtags_set)
+            if not mtag:
+                return []
+            matched_tags.append(mtag)
+        return matched_tags
+
+    def is_filtered_out(self, vi: VideoInfo, tags_raw: list[str], id_seq: Collection[int], subfolder: str,
+                        id_seq_ex: list[int] | None = None) -> bool:
+        suc = True
+        sname = f'{f"[{subfolder}] " if subfolder else ""}Video {vi.sname}'
+        if id_seq and vi.id not in id_seq and not (id_seq_ex and vi.id in id_seq_ex):
+            suc = False
+            Log.trace(f'{sname} isn\'t contained in id list \'{id_seq!s}\'. Skipped!')
+
+        tags_set = frozenset(tags_raw)
+        texts: dict[str, list[str]] = {}
+
+        def text_of(td: str) -> list[str]:
+            if td not in texts:
+                texts[td] = [td.replace('\n', ' ').strip().lower()]
+            return texts[td]
+
+        for ct in self._ctags:
+            extag = ct.extag
+            if extag.startswith('('):
+                or_match_base = self._or_group_match(ct.base, tags_raw, tags_set)
+                or_match_titl = self._or_group_match(ct.text, text_of(vi.title)) if Config.check_title_pos and vi.title else None
+                or_match_desc = (self._or_group_match(ct.text, text_of(vi.description))
+                                 if Config.check_description_pos and vi.description else None)
+                if or_match_base:
+                    Log.trace(f'{sname} has BASE POS match: \'{or_match_base!s}\'')
+                if or_match_titl:
+                    Log.trace(f'{sname} has TITL POS match: \'{or_match_titl!s}\'')
+                if or_match_desc:
+                    Log.trace(f'{sname} has DESC POS match: \'{or_match_desc!s}\'')
+                if not bool(or_match_base or or_match_titl or or_match_desc):
+                    suc = False
+                    Log.trace(f'{sname} misses required tag matching \'{extag}\'. Skipped!')
+            elif extag.startswith('-('):
+                neg_matches = self._neg_and_group_matches(ct.base, tags_raw, tags_set)
+                for conf, cn, td in zip(
+                    (Config.check_title_neg, Config.check_description_neg),
+                    ('TITL', 'DESC'),
+                    (vi.title, vi.description),
                     strict=True,
                 ):
-                    if conf and td and ((np == 'NEG') == negative) and not mtag:
-                        mtag = match_text(my_extag, td)
-                        if mtag:
-                            mtag = f'{mtag[:100]}...'
-                            if negative is False:
-                                Log.trace(f'{sname} has {cn} {np} match: \'{mtag}\'')
-            if mtag is not None and negative:
-                suc = False
-                Log.info(f'{sname} contains excluded tag \'{mtag}\' (\'{extag}\'). Skipped!')
-            elif mtag is None and not negative:
-                suc = False
-                Log.trace(f'{sname} misses required tag matching \'{my_extag}\'. Skipped!')
-    return not suc
+                    if conf and td:
+                        for tmatch in self._neg_and_group_matches(ct.text, text_of(td)):
+                            tmatch_s = tmatch[:100]
+                            Log.trace(f'{sname} has {cn} NEG match: \'{tmatch_s}\'')
+                            if tmatch_s not in neg_matches:
+                                neg_matches.append(f'{tmatch_s}...')
+                if neg_matches:
+                    suc = False
+                    Log.info(f'{sname} contains excluded tags combination \'{extag}\': {",".join(neg_matches)}. Skipped!')
+            else:
+                negative, my_extag = ct.negative, ct.my_extag
+                if ct.utag:
+                    mtag = get_compiled_matching_tag(ct.base[0], (vi.uploader,))
+                    if negative is False and mtag:
+                        Log.trace(f'{sname} has BASE POS match: \'{mtag}\' (from utag \'{my_extag}\')')
+                else:
+                    mtag = get_compiled_matching_tag(ct.base[0], tags_raw, tags_set)
+                    if negative is False and mtag:
+                        Log.trace(f'{sname} has BASE POS match: \'{mtag}\'')
+                    for conf, cn, np, td in zip(
+                        (Config.check_title_pos, Config.check_title_neg, Config.check_description_pos, Config.check_description_neg),
+                        ('TITL', 'TITL', 'DESC', 'DESC'),
+                        ('POS', 'NEG', 'POS', 'NEG'),
+                        (vi.title, vi.title, vi.description, vi.description),
+                        strict=True,
+                    ):
+                        if conf and td and ((np == 'NEG') == negative) and not mtag:
+                            mtag = get_compiled_matching_tag(ct.text[0], text_of(td))
+                            if mtag:
+                                mtag = f'{mtag[:100]}...'
+                                if negative is False:
+                                    Log.trace(f'{sname} has {cn} {np} match: \'{mtag}\'')
+                if mtag is not None and negative:
+                    suc = False
+                    Log.info(f'{sname} contains excluded tag \'{mtag}\' (\'{extag}\'). Skipped!')
+                elif mtag is None and not negative:
+                    suc = False
+                    Log.trace(f'{sname} misses required tag matching \'{my_extag}\'. Skipped!')
+        return not suc
+
+
+def get_extra_tags_matcher(extra_tags: Iterable[str]) -> ExtraTagsMatcher:
+    key = tuple(extra_tags)
+    if key not in extra_tags_matchers:
+        extra_tags_matchers[key] = ExtraTagsMatcher(key)
+    return extra_tags_matchers[key]
+
+
+def is_filtered_out_by_extra_tags(vi: VideoInfo, tags_raw: list[str], extra_tags: list[str],
+                                  id_seq: Collection[int], subfolder: str, id_seq_ex: list[int] | None = None) -> bool:
+    return get_extra_tags_matcher(extra_tags).is_filtered_out(vi, tags_raw, id_seq, subfolder, id_seq_ex)
 
 
 def filtered_tags(tags_list: Collection[str]) -> str:
@@ -625,15 +712,15 @@ def load_actpac_json(file_loc: str, dest_dict: dict[str, str] | TagConflictsDict
 
 
 def load_tag_nums() -> None:
-    load_actpac_json(FILE_LOC_TAGS, TAG_NUMS, 'tag nums')
+    TAG_NUMS.load()
 
 
 def load_artist_nums() -> None:
-    load_actpac_json(FILE_LOC_ARTS, ART_NUMS, 'artist nums')
+    ART_NUMS.load()
 
 
 def load_category_nums() -> None:
-    load_actpac_json(FILE_LOC_CATS, CAT_NUMS, 'category nums')
+    CAT_NUMS.load()
 
 
 def load_playlist_nums() -> None:
@@ -6,22 +6,82 @@ Author: trickerer (https://github.com/trickerer, https://github.com/trickerer01)
 #
 #
 
+import asyncio
+import contextlib
 import functools
+import itertools
+import json
+import os
 import pathlib
-from collections.abc import Callable
+import random
+import socket
+import sys
+import time
+import tracemalloc
+from collections.abc import Callable, Coroutine, Sequence
 from io import StringIO
 from tempfile import TemporaryDirectory
 from unittest import TestCase
-from unittest.mock import patch
+from unittest.mock import AsyncMock, MagicMock, patch
 
-from .cmdargs import prepare_arglist
+from aiohttp import ClientSession
+
+from . import afs
+from .bench import StubSite, StubSiteParams
+from .cmdargs import HelpPrintExitException, prepare_arglist
 from .config import Config
-from .defs import DOWNLOAD_MODE_TOUCH, QUALITIES, QUALITY_480P, SEARCH_RULE_DEFAULT, SITE, Duration
-from .fetch_html import RequestQueue
+from .defs import (
+    DOWNLOAD_MODE_TOUCH,
+    PREFIX,
+    QUALITIES,
+    QUALITY_360P,
+    QUALITY_480P,
+    QUALITY_720P,
+    QUALITY_1080P,
+    SCREENSHOTS_COUNT,
+    SEARCH_RULE_DEFAULT,
+    SITE,
+    UTF8,
+    WRITE_ALIGNMENT,
+    DownloadResult,
+    Duration,
+    Mem,
+    Quality,
+)
+from .download import download_video
+from .downloader import VideoDownloadWorker
+from .dscanner import VideoScanWorker
+from .dsegments import DownloadSegments, download_segments
+from .dthrottler import ThrottleChecker
+from .extract import HTML_PARSER, ListingPageData, VideoPageData, extract_listing_page, extract_video_page, make_soup
+from .fetch_html import ClientSessionWrapper, RequestQueue, create_session, fetch_page, wrap_request
+from .fwriter import FileWriter
+from .idplan import IdPlan
+from .ids import process_ids
+from .iinfo import VideoInfo
+from .infolist import InfoListWriter, export_video_info
+from .input import IS_WINDOWS, wait_for_key, wait_for_key_reader
+from .journal import JobJournal
 from .logger import Log
 from .main import main_sync
-from .path_util import found_filenames_dict
+from .metrics import Metrics, MetricsExporter
+from .nums_index import NumsIndex
+from .pages import process_pages
+from .parse_pool import ParsePool
+from .path_util import (
+    DestScanManifest,
+    FoundFilesIndex,
+    file_already_exists,
+    file_already_exists_arr,
+    found_filenames_dict,
+    get_media_file_match,
+    register_new_file,
+    scan_dest_folder,
+    unregister_unfinished_file,
+)
 from .rex import prepare_regex_fullmatch
+from .scan_cache import ScanCache
+from .screenshots import ScreenshotWorker
 from .tagger import (
     ART_NUMS,
     CAT_NUMS,
@@ -31,6 +91,8 @@ from .tagger import (
     TAG_NUMS,
     extract_id_or_group,
     extract_ids_from_links,
+    get_extra_tags_matcher,
+    is_filtered_out_by_extra_tags,
     load_artist_nums,
     load_category_nums,
     load_playlist_nums,
@@ -43,6 +105,7 @@ from .tagger import (
 from .version import APP_NAME, APP_VERSION
 
 RUN_CONN_TESTS = 0
+RUN_BENCHMARKS = 0
 
 
 def test_prepare(log=False) -> Callable[[], Callable[[], None]]:
@@ -50,9 +113,10 @@ def test_prepare(log=False) -> Callable[[], Callable[[], None]]:
         @functools.wraps(test_func)
         def invoke_test(*args, **kwargs) -> None:
             def set_up_test() -> None:
-                found_filenames_dict.clear()
+                FoundFilesIndex._reset()
                 Log._disabled = not log
                 Config._reset()
+                Metrics._reset()
                 RequestQueue._reset()
             set_up_test()
             test_func(*args, **kwargs)
@@ -97,6 +161,136 @@ class FileCheckTests(TestCase):
         self.assertIsNone(TAG_CONFLICTS.get(''))
         print(f'{self._testMethodName} passed')
 
+    @test_prepare()
+    def test_filecheck07_found_files(self) -> None:
+        with TemporaryDirectory(prefix=f'{APP_NAME}_{self._testMethodName}_') as tempdir:
+            Config.dest_base = f'{pathlib.Path(tempdir).as_posix()}/'
+            Config.folder_scan_depth = 1
+            pathlib.Path(f'{Config.dest_base}sub').mkdir()
+            for fname in ('rv_1_720p.mp4', 'rv_2.mp4', 'sub/rv_1_1080p.mp4', 'sub/rv_3_480p.mp4', 'sub/notes.txt'):
+                pathlib.Path(f'{Config.dest_base}{fname}').touch()
+            scan_dest_folder()
+            self.assertEqual(f'{Config.dest_base}sub/rv_1_1080p.mp4', file_already_exists(1, QUALITY_1080P))
+            self.assertEqual(f'{Config.dest_base}rv_1_720p.mp4', file_already_exists(1, QUALITY_480P))
+            self.assertEqual(f'{Config.dest_base}rv_2.mp4', file_already_exists(2, QUALITY_1080P))
+            self.assertListEqual([f'{Config.dest_base}rv_1_720p.mp4'], file_already_exists_arr(1, QUALITY_720P))
+            self.assertListEqual([], file_already_exists_arr(3, QUALITY_720P))
+            self.assertEqual('', file_already_exists(4))
+            vi = VideoInfo(4, m_subfolder='sub', m_filename='rv_4_360p.mp4')
+            vi.quality = QUALITY_360P
+            register_new_file(vi)
+            self.assertIn('rv_4_360p.mp4', found_filenames_dict[f'{Config.dest_base}sub/'])
+            self.assertEqual(f'{Config.dest_base}sub/rv_4_360p.mp4', file_already_exists(4, QUALITY_360P))
+            unregister_unfinished_file(vi)
+            self.assertEqual('', file_already_exists(4, QUALITY_360P))
+        print(f'{self._testMethodName} passed')
+
+    @test_prepare()
+    def test_filecheck08_dest_scan(self) -> None:
+        def scan_reference(dest_base: str, scan_depth: int) -> dict[str, list[str]]:
+            found: dict[str, list[str]] = {dest_base: []}
+
+            def scan_folder(base_folder: str, level: int) -> None:
+                for dentry in sorted(pathlib.Path(base_folder).iterdir(), key=lambda p: p.name):
+                    if dentry.is_dir():
+                        if level < scan_depth:
+                            found[f'{dentry.as_posix()}/'] = []
+                            scan_folder(f'{dentry.as_posix()}/', level + 1)
+                    elif dentry.is_file() and dentry.name != manifest_name:
+                        found[base_folder].append(dentry.name)
+            scan_folder(dest_base, 0)
+            return found
+
+        def sorted_found() -> dict[str, list[str]]:
+            return {k: sorted(_ for _ in v if _ != manifest_name) for k, v in found_filenames_dict.items()}
+
+        manifest_name = f'{PREFIX}!dirscan.json'
+
+        with TemporaryDirectory(prefix=f'{APP_NAME}_{self._testMethodName}_') as tempdir:
+            tempdir_posix = f'{pathlib.Path(tempdir).as_posix()}/'
+            for fname in ('base/rv_1.mp4', 'base/s1/rv_2.mp4', 'base/s1/s11/rv_3.mp4', 'base/s1/s11/s111/rv_4.mp4', 'base/s2/rv_5.mp4'):
+                pathlib.Path(f'{tempdir_posix}{fname}').parent.mkdir(parents=True, exist_ok=True)
+                pathlib.Path(f'{tempdir_posix}{fname}').touch()
+            for folder in pathlib.Path(tempdir_posix).rglob('*'):
+                if folder.is_dir():
+                    os.utime(folder, (time.time() - 3600.0, time.time() - 3600.0))
+            Config.dest_base = f'{tempdir_posix}base/'
+            Config.folder_scan_depth = 2
+            scan_dest_folder()
+            self.assertDictEqual(scan_reference(Config.dest_base, 2), sorted_found())
+            FoundFilesIndex._reset()
+            Config.folder_scan_levelup = 1
+            scan_dest_folder()
+            self.assertDictEqual(scan_reference(tempdir_posix, 3), sorted_found())
+            Config.folder_scan_levelup = 0
+            Config.dest_scan_cache = True
+            # 1: all listed, 2: base listed (manifest file added), 3: nothing listed, 4: s2 listed (new file added)
+            for expected_listings in (4, 1, 0, 1):
+                FoundFilesIndex._reset()
+                with patch('os.scandir', wraps=os.scandir) as scandir_mock:
+                    scan_dest_folder()
+                    self.assertEqual(expected_listings, scandir_mock.call_count)
+                self.assertTrue(pathlib.Path(DestScanManifest.file_path()).is_file())
+                self.assertDictEqual(scan_reference(Config.dest_base, 2), sorted_found())
+                if expected_listings == 4:
+                    os.utime(Config.dest_base, (time.time() - 1800.0, time.time() - 1800.0))
+                elif expected_listings == 0:
+                    pathlib.Path(f'{Config.dest_base}s2/rv_6.mp4').touch()
+            self.assertIn('rv_6.mp4', found_filenames_dict[f'{Config.dest_base}s2/'])
+        print(f'{self._testMethodName} passed')
+
+    @test_prepare()
+    def test_filecheck09_nums_index(self) -> None:
+        with (TemporaryDirectory(prefix=f'{APP_NAME}_{self._testMethodName}_') as tempdir,
+              patch.dict(os.environ, {'XDG_CACHE_HOME': f'{tempdir}/cache', 'LOCALAPPDATA': f'{tempdir}/cache'})):
+            json_path = f'{pathlib.Path(tempdir).as_posix()}/nums.json'
+            pathlib.Path(json_path).write_text(
+                '{"girl": "12, 1,000 posts", "gir": "11", "big_girl": "7, 5 posts", "caf\u00e9": "3", "1girl": "9, 1 post"}', encoding='utf-8')
+            nums = NumsIndex(json_path, 'test nums')
+            self.assertFalse(nums)
+            nums.load()
+            self.assertTrue(nums)
+            self.assertTrue(pathlib.Path(nums.index_loc).is_file())
+            self.assertEqual(5, len(nums))
+            self.assertEqual('12', nums.get('girl'))
+            self.assertEqual('3', nums['caf\u00e9'])
+            self.assertIn('1girl', nums)
+            self.assertIsNone(nums.get('gi'))
+            self.assertIsNone(nums.get(''))
+            self.assertRaises(KeyError, nums.__getitem__, 'boy')
+            self.assertListEqual(['1girl', 'big_girl', 'caf\u00e9', 'gir', 'girl'], list(nums))
+            self.assertEqual('gi', NumsIndex.literal_prefix('gi?l*'))
+            self.assertEqual('', NumsIndex.literal_prefix('girl|*_girl'))
+            for wtag, expected in (('gir*', ['gir', 'girl']), ('*girl', ['1girl', 'big_girl', 'girl']), ('ca?\u00e9', ['caf\u00e9'])):
+                self.assertListEqual(expected, nums.expand(prepare_regex_fullmatch(normalize_wtag(wtag)), wtag))
+            with patch.object(NumsIndex, '_build', side_effect=AssertionError) as build_mock:
+                nums.load()
+                self.assertEqual('9', nums.get('1girl'))
+                build_mock.assert_not_called()
+            pathlib.Path(json_path).write_text('{"boy": "1"}', encoding='utf-8')
+            with patch('os.replace', side_effect=OSError):
+                nums.load()
+                self.assertListEqual(['boy'], list(nums))
+            nums.load()
+            self.assertEqual('1', nums['boy'])
+            pathlib.Path(nums.index_loc).unlink()
+            os.makedirs(f'{nums.index_loc}.tmp')  # source folder is read-only
+            nums.load()
+            self.assertEqual('1', nums['boy'])
+            self.assertFalse(pathlib.Path(nums.index_loc).is_file())
+            self.assertTrue(pathlib.Path(nums.index_loc_cached).is_file())
+            self.assertTrue(nums.index_loc_cached.startswith(f'{pathlib.Path(tempdir).as_posix()}/cache/rv/'))
+            with patch.object(NumsIndex, '_build', side_effect=AssertionError) as build_mock:
+                nums.load()
+                self.assertEqual('1', nums['boy'])
+                build_mock.assert_not_called()
+            nums.close()
+            pathlib.Path(json_path).unlink()
+            nums.load()
+            self.assertTrue(nums)
+            self.assertEqual(0, len(nums))
+        print(f'{self._testMethodName} passed')
+
 
 class CmdTests(TestCase):
     @test_prepare()
@@ -268,6 +462,29 @@ class CmdTests(TestCase):
         self.assertIsNotNone(match_text(Config.extra_tags[0], 'a triggered bluff'))
         print(f'{self._testMethodName} passed')
 
+    @test_prepare()
+    def test_cmd_wtags03(self):
+        prepare_arglist(['pages', '-start', '1', '-pages', '5', '--check-title-pos', '--check-description-neg',
+                         'gir*', '(boo*~ca?)', '-(ba*,bo?)', '-u:bad*', '-spoo*'])
+        matcher = get_extra_tags_matcher(Config.extra_tags)
+        self.assertIs(matcher, get_extra_tags_matcher(list(Config.extra_tags)))
+        vi = VideoInfo(5, m_title='A Cat story')
+        vi.uploader = 'gooduser'
+        messages: list[str] = []
+        with (patch.object(Log, 'trace', side_effect=lambda text, *_: messages.append(text)),
+              patch.object(Log, 'info', side_effect=lambda text, *_: messages.append(text))):
+            self.assertFalse(is_filtered_out_by_extra_tags(vi, ['girl', 'bone'], Config.extra_tags, [], 'sub'))
+            vi.description = 'Spooky\nstory'
+            self.assertTrue(matcher.is_filtered_out(vi, ['girl', 'bone'], [], 'sub'))
+        self.assertListEqual([
+            "[sub] Video rv_5.mp4 has BASE POS match: 'girl'",
+            "[sub] Video rv_5.mp4 has TITL POS match: 'a cat story'",
+            "[sub] Video rv_5.mp4 has BASE POS match: 'girl'",
+            "[sub] Video rv_5.mp4 has TITL POS match: 'a cat story'",
+            "[sub] Video rv_5.mp4 contains excluded tag 'spooky story...' ('-spoo*'). Skipped!",
+        ], messages)
+        print(f'{self._testMethodName} passed')
+
     @test_prepare()
     def test_cmd_extra_h_c01(self):
         prepare_arglist(['pages', '-start', '10', '-pages', '11',
@@ -277,6 +494,1016 @@ class CmdTests(TestCase):
         self.assertListEqual([('cf_clearance', 'clear120825')], Config.extra_cookies)
         print(f'{self._testMethodName} passed')
 
+    @test_prepare()
+    def test_cmd_scan_tasks01(self):
+        prepare_arglist(['ids', '-start', '1000', '-count', '10', '-scantasks', '4'])
+        self.assertEqual(4, Config.scan_tasks)
+        self.assertIn('-scantasks', Config.make_continue_arguments())
+        self.assertRaises(HelpPrintExitException, prepare_arglist, ['ids', '-start', '1000', '-count', '10', '-scantasks', '0'])
+        print(f'{self._testMethodName} passed')
+
+    @test_prepare()
+    def test_cmd_metrics01(self):
+        prepare_arglist(['ids', '-start', '1000', '-count', '10', '--metrics-port', '9100'])
+        self.assertEqual(9100, Config.metrics_port)
+        # resumed run must not try to bind the same port or append to the same file
+        self.assertNotIn('--metrics-port', Config.make_continue_arguments())
+        print(f'{self._testMethodName} passed')
+
+
+class WorkerTests(TestCase):
+    @test_prepare()
+    def test_scanner_tasks01(self):
+        Config.scan_tasks = 4
+        active_max = active = 0
+        finished: list[int] = []
+
+        async def fake_scan(vi: VideoInfo) -> DownloadResult:
+            nonlocal active, active_max
+            active += 1
+            active_max = max(active, active_max)
+            await asyncio.sleep(0.001 * (vi.id % 5))
+            active -= 1
+            return DownloadResult.SUCCESS if vi.id % 3 else DownloadResult.FAIL_NOT_FOUND
+
+        async def on_finish(vi: VideoInfo, _: DownloadResult) -> None:
+            finished.append(vi.id)
+
+        async def no_keys(*_) -> None:
+            pass
+
+        async def run_scanner() -> list[int]:
+            with VideoScanWorker([VideoInfo(idi) for idi in range(1, 21)], fake_scan) as scn:
+                scn.register_task_finish_callback(on_finish)
+                await scn.run()
+                scanned_ids: list[int] = []
+                while vi := await scn.try_fetch_next():
+                    scanned_ids.append(vi.id)
+                return scanned_ids
+
+        with patch('rv.dscanner.wait_for_key', no_keys):
+            scanned = asyncio.run(run_scanner())
+        self.assertEqual(4, active_max)
+        self.assertListEqual([idi for idi in range(1, 21) if idi % 3], scanned)
+        self.assertListEqual([idi for idi in range(1, 21) if idi % 3 == 0], finished)
+        print(f'{self._testMethodName} passed')
+
+    @test_prepare()
+    def test_scanner_tasks02(self):
+        Config.scan_tasks = 3
+        cancelled: list[int] = []
+
+        async def fake_scan(vi: VideoInfo) -> DownloadResult:
+            if vi.id == 1:
+                raise RuntimeError('scan failed')
+            try:
+                await asyncio.sleep(10.0)
+            except asyncio.CancelledError:
+                cancelled.append(vi.id)
+                raise
+            return DownloadResult.SUCCESS
+
+        async def no_keys(*_) -> None:
+            pass
+
+        async def run_scanner() -> None:
+            with VideoScanWorker([VideoInfo(idi) for idi in range(1, 6)], fake_scan) as scn:
+                with self.assertRaises(RuntimeError):
+                    await scn.run()
+            self.assertFalse([t for t in asyncio.all_tasks() if t is not asyncio.current_task()])
+
+        with patch('rv.dscanner.wait_for_key', no_keys):
+            asyncio.run(run_scanner())
+        self.assertListEqual([2, 3], sorted(cancelled))
+        print(f'{self._testMethodName} passed')
+
+    @test_prepare()
+    def test_scanner_plan01(self):
+        Config.scan_tasks = 2
+        taken: list[tuple[list[int], int]] = []
+        queue_sizes: list[int] = []
+
+        async def fake_scan(vi: VideoInfo) -> DownloadResult:
+            queue_sizes.append(len(scn.get_workload()) - scn.get_prescanned_count())
+            await asyncio.sleep(0.001)
+            return DownloadResult.SUCCESS
+
+        async def on_finish(*_) -> None:
+            pass
+
+        async def no_keys(*_) -> None:
+            pass
+
+        async def run_scanner() -> list[int]:
+            await scn.run()
+            scanned_ids: list[int] = []
+            while vi := await scn.try_fetch_next():
+                scanned_ids.append(vi.id)
+            return scanned_ids
+
+        plan = IdPlan(range(230, 3045060))
+        with (patch('rv.dscanner.wait_for_key', no_keys), patch('rv.dscanner.filter_existing_id', lambda id_: id_ == 231),
+              VideoScanWorker([], fake_scan, plan, lambda id_: id_ % 2 == 0) as scn):
+            scn.register_task_finish_callback(on_finish)
+            scn.register_items_taken_callback(lambda items, filtered_count: taken.append(([vi.id for vi in items], filtered_count)))
+            self.assertEqual(16, scn.get_workload_size())
+            self.assertListEqual([3045058, 3045059], list(plan.iter_from(3045058)))
+            scanned = asyncio.run(run_scanner())
+            self.assertEqual(8, scn.get_predicted_count())
+        self.assertListEqual([233, 235, 3045051, 3045053, 3045055, 3045057, 3045059], scanned)
+        self.assertEqual(1, sum(filtered_count for _, filtered_count in taken))
+        self.assertListEqual(scanned, [idi for ids, _ in taken for idi in ids])
+        self.assertLessEqual(max(queue_sizes), Config.scan_tasks)
+        print(f'{self._testMethodName} passed')
+
+    @test_prepare()
+    def test_process_ids01(self):
+        downloads: list[IdPlan] = []
+
+        async def fake_download(_, __, ___, plan: IdPlan) -> None:
+            downloads.append(plan)
+
+        with TemporaryDirectory(prefix=f'{APP_NAME}_{self._testMethodName}_') as tempdir:
+            for idi in (5, 6, 7):
+                pathlib.Path(f'{tempdir}/{PREFIX}{idi:d}_720p.mp4').touch()
+            with patch('rv.ids.download', fake_download):
+                for end_id, exit_code in ((7, -1), (8, 0)):
+                    Config._reset()
+                    FoundFilesIndex._reset()
+                    found_filenames_dict.clear()
+                    prepare_arglist(['ids', '-start', '5', '-end', str(end_id), '-path', tempdir])
+                    self.assertEqual(exit_code, asyncio.run(process_ids()))
+        self.assertListEqual(['[5-8]'], [str(plan) for plan in downloads])
+        print(f'{self._testMethodName} passed')
+
+    @test_prepare()
+    def test_continue_ids01(self):
+        async def no_scan(_: VideoInfo) -> DownloadResult:
+            return DownloadResult.SUCCESS
+
+        with (VideoScanWorker([], no_scan, IdPlan(range(100, 4000001))) as scn,
+              VideoDownloadWorker([], no_scan, 0) as dwn):
+            self.assertListEqual(['-start', '100', '-end', '4000000'], dwn._make_continue_ids_arguments())
+            scn.extend([VideoInfo(50)])
+            self.assertListEqual(['-start', '50', '-end', '4000000'], dwn._make_continue_ids_arguments())
+        Config.use_id_sequence = True
+        with VideoScanWorker([], no_scan, IdPlan([12, 3, 5])), VideoDownloadWorker([], no_scan, 0) as dwn:
+            self.assertListEqual(['-seq', '(id=3~id=5~id=12)'], dwn._make_continue_ids_arguments())
+        print(f'{self._testMethodName} passed')
+
+    @test_prepare()
+    def test_id_plan01(self):
+        plan = IdPlan(range(-5, 6000010))
+        self.assertEqual(236 + (6000000 - 3045050 + 1), len(plan))
+        self.assertEqual(6000015 - len(plan), plan.removed_count)
+        self.assertTupleEqual((0, 6000000), (plan.min_id, plan.max_id))
+        self.assertIn(235, plan)
+        self.assertNotIn(236, plan)
+        self.assertNotIn(6000001, plan)
+        self.assertListEqual([234, 235, 3045050, 3045051], list(itertools.islice(plan.iter_from(234), 4)))
+        self.assertEqual(2, plan.count_from(5999999))
+        self.assertEqual(len(plan) - 100, plan.count_from(100))
+        plan = IdPlan([12, 3, 5, 4, 3, 10, 11, 300])
+        self.assertEqual('[3-5, 10-12]', str(plan))
+        self.assertListEqual([3, 4, 5, 10, 11, 12], list(plan))
+        self.assertEqual(1, plan.removed_count)
+        self.assertEqual(3, plan.count_from(6))
+        print(f'{self._testMethodName} passed')
+
+    @test_prepare()
+    def test_worker_registries01(self):
+        async def no_scan(_: VideoInfo) -> DownloadResult:
+            return DownloadResult.SUCCESS
+
+        async def run_checks() -> None:
+            sequence = [VideoInfo(idi) for idi in (5, 6, 7, 6)]
+            with VideoScanWorker(sequence, no_scan) as scn, VideoDownloadWorker(sequence, no_scan, 0) as dwn:
+                sequence[3].set_state(VideoInfo.State.DONE)
+                self.assertIs(sequence[1], scn.find_vinfo(6))
+                self.assertIs(sequence[3], scn.find_vinfo(6, lambda vi: vi.state == VideoInfo.State.DONE))
+                self.assertTupleEqual((True, False), scn.get_id_stats(6))
+                self.assertIsNone(scn.find_vinfo(8))
+                self.assertTupleEqual((False, False), scn.get_id_stats(8))
+                extra = [VideoInfo(8), VideoInfo(5)]
+                scn.extend(extra)
+                self.assertEqual(4, len(sequence))
+                self.assertIs(extra[0], scn.find_vinfo(8))
+                self.assertIs(sequence[0], scn.find_vinfo(5))
+                # finished items are released, their ids remain in per-state index
+                extra[0].set_flag(VideoInfo.Flags.RETURNED_404)
+                scn.release(extra[0])
+                scn.release(sequence[3])
+                scn.release(sequence[3])
+                self.assertIsNone(scn.find_vinfo(8))
+                self.assertTupleEqual((True, True), scn.get_id_stats(8))
+                self.assertIs(sequence[1], scn.find_vinfo(6))
+                self.assertIsNone(scn.find_vinfo(6, lambda vi: vi.state == VideoInfo.State.DONE))
+                self.assertTrue(scn.has_id_in_states(6, VideoInfo.State.WRITING, VideoInfo.State.DONE))
+                self.assertFalse(scn.has_id_in_states(8, VideoInfo.State.DONE))
+                self.assertFalse(scn.has_id_in_states(7, VideoInfo.State.DONE))
+                sequence[2].set_state(VideoInfo.State.DONE)
+                self.assertTrue(scn.has_id_in_states(7, VideoInfo.State.DONE))
+                self.assertListEqual([sequence[0], extra[1], sequence[1], sequence[2]], scn.get_active_items())
+                self.assertFalse(await dwn.is_writing(VideoInfo(7)))
+                await dwn.add_to_writes(sequence[2])
+                self.assertTrue(await dwn.is_writing(VideoInfo(7)))
+                await dwn.remove_from_writes(VideoInfo(7))
+                await dwn.remove_from_writes(VideoInfo(7), True)
+                self.assertFalse(await dwn.is_writing(sequence[2]))
+
+        asyncio.run(run_checks())
+        print(f'{self._testMethodName} passed')
+
+    @test_prepare()
+    def test_video_info01(self):
+        vi = VideoInfo(1, m_subfolder=''.join(('sub', 'folder/')))
+        self.assertFalse(hasattr(vi, '__dict__'))
+        self.assertIs(sys.intern('subfolder/'), vi.subfolder)
+        vi.quality = Quality(''.join(('720', 'p')))
+        self.assertIs(QUALITY_720P, vi.quality)
+        vi.tags, vi.description, vi.comments = 'a b', 'desc', 'comm'
+        self.assertEqual(('a b', 'desc', 'comm'), (vi.tags, vi.description, vi.comments))
+        print(f'{self._testMethodName} passed')
+
+    @test_prepare()
+    def test_wait_for_key01(self):
+        if IS_WINDOWS:
+            return
+        import tty
+
+        async def press_keys(keys: str) -> None:
+            for ch in keys:
+                await asyncio.sleep(0.01)
+                os.write(master_fd, ch.encode())
+
+        async def wait_keys(keys: str) -> bool:
+            waiter = asyncio.get_running_loop().create_task(wait_for_key_reader('q', 2))
+            await press_keys(keys)
+            try:
+                return await asyncio.wait_for(asyncio.shield(waiter), 0.2)
+            except asyncio.TimeoutError:
+                waiter.cancel()
+                return False
+
+        master_fd, slave_fd = os.openpty()
+        tty.setraw(slave_fd)
+        try:
+            with patch('rv.input.sys.stdin', open(slave_fd, 'rb', buffering=0, closefd=False)):
+                self.assertTrue(asyncio.run(wait_keys('qq')))
+                self.assertTrue(asyncio.run(wait_keys('aqxqq')))
+                self.assertFalse(asyncio.run(wait_keys('qaq')))
+        finally:
+            os.close(master_fd)
+            os.close(slave_fd)
+        print(f'{self._testMethodName} passed')
+
+    @test_prepare()
+    def test_wait_for_key02(self):
+        if IS_WINDOWS:
+            return
+        import tty
+        called: list[int] = []
+
+        async def wait_keys(callback_arg: int) -> None:
+            await asyncio.wait_for(wait_for_key('q', 2, lambda: called.append(callback_arg)), 3.0)
+
+        # terminal hangup: watcher ends without calling back instead of spinning on readable stdin
+        master_fd, slave_fd = os.openpty()
+        tty.setraw(slave_fd)
+        os.close(master_fd)
+        try:
+            with (patch('rv.input.sys.stdin', open(slave_fd, 'rb', buffering=0, closefd=False)),
+                  patch('rv.input.set_terminal_raw', contextlib.nullcontext)):
+                asyncio.run(wait_keys(1))
+        finally:
+            os.close(slave_fd)
+        # regular file can't be watched by event loop, polled instead
+        with TemporaryDirectory(prefix=f'{APP_NAME}_{self._testMethodName}_') as tempdir:
+            for content, callback_arg in (('qq', 2), ('qa', 3)):
+                pathlib.Path(f'{tempdir}/stdin.txt').write_text(content)
+                with (open(f'{tempdir}/stdin.txt', 'rt') as stdin, patch('rv.input.sys.stdin', stdin),
+                      patch('rv.input.next_input', functools.partial(stdin.read, 1)),
+                      patch('rv.input.set_terminal_raw', contextlib.nullcontext)):
+                    asyncio.run(wait_keys(callback_arg))
+        self.assertListEqual([2], called)
+        print(f'{self._testMethodName} passed')
+
+
+class ExtractTests(TestCase):
+    VIDEO_PAGE_HTML = (
+        '<html><head><title>Some video</title></head><body><div class="popup">'
+        '<h1 class="title_video">Title &amp; more</h1>'
+        '<div class="info row"><div class="item"><span>12,345</span><span>2:05</span></div></div>'
+        '<div class="voters"><span class="voters count">80% (1,000)</span></div>'
+        '<div class="row"><div class="col"><div class="label">Artist</div>'
+        '<a href="/models/a1/"><span class="name">Artist One</span></a><a href="/models/a2/"><span class="name">ART2</span></a></div>'
+        '<div class="col"><div class="label">Categories</div><a href="/c/1/"><span>Cat One</span></a></div>'
+        '<div class="col"><div class="label">Uploaded by</div><a href="/members/1/"> Uploader1 </a></div></div>'
+        '<div class="row"><div class="label">Tags</div><a class="tag_item" href="/t/1/">tag one</a><a class="tag_item">3d</a></div>'
+        '<div class="row"><em>line1<br/>line2</em></div>'
+        '<div class="comment-info"><a href="/m/2/">user2</a><div class="coment-text">nice<br/>video </div></div>'
+        '<div class="comment-info"><a href="/m/1/">uploader1</a><div class="coment-text">my desc</div></div>'
+        '<div class="row"><div class="label">Download</div><a class="tag_item" href="https://a.b/1_360p.mp4/?x=1">MP4 360p</a>'
+        '<a class="tag_item" href="https://a.b/1_720p.mp4/?x=1">MP4 720p</a></div>'
+        '</div></body></html>'
+    )
+    LISTING_PAGE_HTML = (
+        '<html><body><div class="thumbs clearfix">'
+        '<a class="th js-open-popup" href="https://site/video/102/title-b/"><div class="img wrap_image"'
+        ' data-preview="https://site/previews/102_preview.mp4/"></div><div class="thumb_title">Title B</div><div class="time">1:00</div></a>'
+        '<a class="th js-open-popup" href="https://site/video/101/title-a/"><div class="img wrap_image"'
+        ' data-preview="https://site/previews/101_preview.mp4/"></div><div class="thumb_title">Title A</div><div class="time">10:01</div></a>'
+        '</div><div class="pagination"><a data-action="ajax" data-parameters="from:2">2</a>'
+        '<a data-action="ajax" data-parameters="q:a;from:17">Last</a></div></body></html>'
+    )
+
+    @test_prepare()
+    def test_extract_video_page01(self):
+        for parser in {'html.parser', HTML_PARSER}:
+            page = extract_video_page(make_soup(self.VIDEO_PAGE_HTML.encode(), parser), with_comments=True)
+            self.assertFalse(page.is_maintenance or page.is_404)
+            self.assertEqual('Title & more', page.title)
+            self.assertEqual('2:05', page.duration)
+            self.assertEqual('80% (1,000)', page.voters)
+            self.assertListEqual(['artist one', 'art2'], page.arts)
+            self.assertListEqual(['cat one'], page.cats)
+            self.assertEqual('uploader1', page.uploader)
+            self.assertListEqual(['tag one', '3d'], page.tags)
+            self.assertEqual('line1\nline2', page.description)
+            self.assertListEqual([('user2', 'nice\nvideo '), ('uploader1', 'my desc')], page.comments)
+            self.assertListEqual(['https://a.b/1_360p.mp4/?x=1', 'https://a.b/1_720p.mp4/?x=1'], [lin.second for lin in page.links])
+            self.assertIsNone(page.message)
+        page = extract_video_page(make_soup(b'<html><head><title>404 Not Found</title></head></html>'))
+        self.assertTrue(page.is_404)
+        page = extract_video_page(make_soup(b'<div><span class="message">This video was deleted</span></div>'))
+        self.assertIsNone(page.links)
+        self.assertIsNone(page.tags)
+        self.assertEqual('This video was deleted', page.message)
+        print(f'{self._testMethodName} passed')
+
+    @test_prepare()
+    def test_extract_listing_page01(self):
+        for parser in {'html.parser', HTML_PARSER}:
+            page = extract_listing_page(make_soup(self.LISTING_PAGE_HTML.encode(), parser), 'th js-open-popup', with_previews=True)
+            self.assertEqual(17, page.maxpage)
+            self.assertListEqual([('https://site/video/102/title-b/', 'Title B', '1:00'),
+                                  ('https://site/video/101/title-a/', 'Title A', '10:01')], page.video_refs)
+            self.assertListEqual(['https://site/previews/102_preview.mp4/', 'https://site/previews/101_preview.mp4/'],
+                                 [p[0] for p in page.previews])
+        print(f'{self._testMethodName} passed')
+
+
+class PagesTests(TestCase):
+    @staticmethod
+    def make_listing_page(page_num: int, maxpage: int) -> str:
+        refs = ''.join(f'<a class="th js-open-popup" href="https://site/video/{idi:d}/title-{idi:d}/"><div class="img wrap_image"'
+                       f' data-preview="https://site/previews/{idi:d}_preview.mp4/"></div><div class="thumb_title">T{idi:d}</div>'
+                       f'<div class="time">1:00</div></a>' for idi in (1000 - page_num * 2, 999 - page_num * 2))
+        return (f'<html><body><div class="thumbs clearfix">{refs}</div><div class="pagination">'
+                f'<a data-action="ajax" data-parameters="q:a;from:{maxpage:d}">Last</a></div></body></html>')
+
+    @test_prepare()
+    def test_pages_prefetch01(self):
+        maxpage = 10
+
+        async def fake_fetch_html_raw(url: str, **_) -> bytes:
+            page_num = int(url[url.rfind('=') + 1:])
+            fetched.append(page_num)
+            in_flight.append(page_num)
+            max_in_flight[0] = max(max_in_flight[0], len(in_flight))
+            await asyncio.sleep(0.01 * (maxpage - page_num))  # later pages arrive first
+            in_flight.remove(page_num)
+            return self.make_listing_page(page_num, maxpage).encode()
+
+        async def fake_download(entries: list[VideoInfo], *_) -> None:
+            results.append([vi.id for vi in entries])
+
+        results: list[list[int]] = []
+        for prefetch in ('0', '3'):
+            fetched: list[int] = []
+            in_flight: list[int] = []
+            max_in_flight = [0]
+            Config._reset()
+            prepare_arglist(['pages', '-pages', '20', '-stop_id', '991', '-prefetch', prefetch])
+            with (patch('rv.fetch_html.fetch_html_raw', fake_fetch_html_raw), patch('rv.pages.download', fake_download),
+                  patch('rv.pages.prefilter_existing_items')):
+                self.assertEqual(0, asyncio.run(process_pages()))
+            # page 5 has all ids below lower bound, with prefetch pages up to 8 may be requested but no further
+            self.assertListEqual([1, 2, 3, 4, 5], sorted(fetched)[:5])
+            self.assertLessEqual(max(fetched), 5 if prefetch == '0' else 8)
+            self.assertEqual(1 if prefetch == '0' else 1 + 3, max_in_flight[0])
+        self.assertListEqual(results[0], results[1])
+        self.assertListEqual(list(range(991, 999)), results[0])
+        print(f'{self._testMethodName} passed')
+
+    @test_prepare()
+    def test_pages_stream01(self):
+        maxpage = 6
+
+        async def fake_fetch_html_raw(url: str, **_) -> bytes:
+            page_num = int(url[url.rfind('=') + 1:])
+            await asyncio.sleep(0.25)  # longer than downloader queue polling interval
+            events.append(f'page{page_num:d}')
+            return self.make_listing_page(page_num, maxpage).encode()
+
+        async def fake_scan_video(vi: VideoInfo) -> DownloadResult:
+            events.append(f'scan{vi.id:d}')
+            return DownloadResult.SUCCESS
+
+        async def fake_process_video(vi: VideoInfo) -> DownloadResult:
+            events.append(f'download{vi.id:d}')
+            return DownloadResult.SUCCESS
+
+        with TemporaryDirectory(prefix=f'{APP_NAME}_{self._testMethodName}_') as tempdir:
+            pathlib.Path(f'{tempdir}/{PREFIX}995_720p.mp4').touch()
+            for quality in ('360p', 'preview'):
+                events: list[str] = []
+                Config._reset()
+                FoundFilesIndex._reset()
+                found_filenames_dict.clear()
+                prepare_arglist(['pages', '-pages', '20', '-path', tempdir, '-quality', quality, '-stream'])
+                with (patch('rv.fetch_html.fetch_html_raw', fake_fetch_html_raw), patch('rv.download.scan_video', fake_scan_video),
+                      patch('rv.download.process_video', fake_process_video)):
+                    self.assertEqual(0, asyncio.run(process_pages()))
+                downloaded = [int(e[8:]) for e in events if e.startswith('download')]
+                # 995 already exists, every page's entries are queued oldest to newest
+                self.assertListEqual([997, 998, 996, 993, 994, 991, 992, 989, 990, 987, 988], downloaded)
+                self.assertLess(events.index('download997'), events.index(f'page{maxpage:d}'))
+                if quality == 'preview':
+                    self.assertFalse(any(e.startswith('scan') for e in events))
+            for bounds in (('-stop_id', '5000'), ('-stop_id', '995', '-begin_id', '995')):  # none found, all exist
+                events = []
+                Config._reset()
+                FoundFilesIndex._reset()
+                found_filenames_dict.clear()
+                prepare_arglist(['pages', '-pages', '20', '-path', tempdir, '-quality', '360p', '-stream', *bounds])
+                with (patch('rv.fetch_html.fetch_html_raw', fake_fetch_html_raw), patch('rv.download.scan_video', fake_scan_video),
+                      patch('rv.download.process_video', fake_process_video)):
+                    self.assertEqual(-1, asyncio.run(process_pages()))
+                self.assertFalse(any(e.startswith('download') for e in events))
+        print(f'{self._testMethodName} passed')
+
+
+class ScanCacheTests(TestCase):
+    @test_prepare()
+    def test_scan_cache01(self):
+        with TemporaryDirectory(prefix=f'{APP_NAME}_{self._testMethodName}_') as tempdir:
+            Config.dest_base = f'{pathlib.Path(tempdir).as_posix()}/'
+            page = extract_video_page(make_soup(ExtractTests.VIDEO_PAGE_HTML.encode()))
+            with ScanCache(ScanCache.file_path(), 1) as scache:
+                self.assertIs(scache, ScanCache.get())
+                self.assertIsNone(scache.load(1, False))
+                scache.store(1, page, False)
+                self.assertEqual(page, scache.load(1, False))
+                self.assertIsNone(scache.load(1, True))
+            self.assertIsNone(ScanCache.get())
+            with ScanCache(ScanCache.file_path(), 1) as scache:
+                self.assertEqual(page, scache.load(1, False))
+                with patch('time.time', return_value=time.time() + 61.0):
+                    self.assertIsNone(scache.load(1, False))
+        print(f'{self._testMethodName} passed')
+
+
+class InfoListTests(TestCase):
+    @test_prepare()
+    def test_info_lists01(self):
+        def make_vi(id_: int, tags: str, description='', link='https://link/1.mp4') -> VideoInfo:
+            vi = VideoInfo(id_, m_link=link)
+            vi.tags, vi.description = tags, description
+            return vi
+
+        def read_file(filename: str) -> str:
+            with open(f'{Config.dest_base}{filename}', 'rt', encoding=UTF8) as ifile:
+                return ifile.read()
+
+        def write_file(filename: str, content: str) -> None:
+            with open(f'{Config.dest_base}{filename}', 'wt', encoding=UTF8) as ifile:
+                ifile.write(content)
+
+        with TemporaryDirectory(prefix=f'{APP_NAME}_{self._testMethodName}_') as tempdir:
+            Config.dest_base = f'{pathlib.Path(tempdir).as_posix()}/'
+            Config.save_tags = Config.save_descriptions = Config.merge_lists = True
+            write_file(f'{PREFIX}!tags_1-5.txt', f'{PREFIX}1: a b\n{PREFIX}5: c\n')
+            write_file(f'{PREFIX}!tags_5-7.txt', f'{PREFIX}5: old\n{PREFIX}7: d\n')
+            write_file(f'{PREFIX}!tags_seg20200101000000.txt', f'{PREFIX}9: e\n{PREFIX}3: f\n')  # left by crashed run
+            with InfoListWriter() as writer:
+                asyncio.run(writer.store(make_vi(5, 'new')))
+                asyncio.run(writer.store(vi4 := make_vi(4, 'g h', '\nupl:\ndesc\n')))
+                self.assertEqual(('', ''), (vi4.tags, vi4.description))
+                asyncio.run(writer.store(make_vi(8, 'not scanned', link='')))
+                segments = ''.join(read_file(f) for f in os.listdir(tempdir) if f.startswith(f'{PREFIX}!tags_seg'))
+                self.assertIn(f'{PREFIX}5: new\n{PREFIX}4: g h\n', segments)
+                self.assertNotIn(f'{PREFIX}8:', segments)
+                asyncio.run(export_video_info([make_vi(4, 'duplicate')]))
+            self.assertIsNone(InfoListWriter.get())
+            self.assertListEqual([f'{PREFIX}!descriptions_4-5.txt', f'{PREFIX}!tags_1-9.txt'], sorted(os.listdir(tempdir)))
+            self.assertEqual(f'{PREFIX}1: a b\n{PREFIX}3: f\n{PREFIX}4: g h\n{PREFIX}5: new\n{PREFIX}7: d\n{PREFIX}9: e\n',
+                             read_file(f'{PREFIX}!tags_1-9.txt'))
+            self.assertEqual(f'{PREFIX}4:\nupl:\ndesc\n\n{PREFIX}5:\n', read_file(f'{PREFIX}!descriptions_4-5.txt'))
+            Config.save_descriptions = False
+            write_file(f'{PREFIX}!tags_10-11.txt', f'{PREFIX}11: x\n{PREFIX}10: y\n')
+            asyncio.run(export_video_info([make_vi(12, 'z')]))
+            self.assertTrue(os.path.isfile(f'{Config.dest_base}{PREFIX}!descriptions_4-5.txt'))
+            self.assertEqual(f'{PREFIX}1: a b\n{PREFIX}3: f\n{PREFIX}4: g h\n{PREFIX}5: new\n{PREFIX}7: d\n{PREFIX}9: e\n'
+                             f'{PREFIX}10: y\n{PREFIX}11: x\n{PREFIX}12: z\n', read_file(f'{PREFIX}!tags_1-12.txt'))
+            self.assertFalse(os.path.isfile(f'{Config.dest_base}{PREFIX}!tags_1-9.txt'))
+        with TemporaryDirectory(prefix=f'{APP_NAME}_{self._testMethodName}_') as tempdir:
+            Config.dest_base = f'{pathlib.Path(tempdir).as_posix()}/'
+            Config.save_tags = Config.save_descriptions = False
+            Config.save_comments = True
+            vi5, vi6 = make_vi(5, ''), make_vi(6, '')
+            vi5.comments, vi6.comments = '\nuser1:\nhello\n\nuser2:\nworld\n', '\nuser3:\npara1\n\n\npara2\n'
+            comments_baseline = f'{PREFIX}5:\nuser1:\nhello\n\nuser2:\nworld\n\n{PREFIX}6:\nuser3:\npara1\n\n\npara2\n\n'
+            asyncio.run(export_video_info([vi6, vi5]))
+            self.assertEqual(comments_baseline, read_file(f'{PREFIX}!comments_5-6.txt'))
+            asyncio.run(export_video_info([make_vi(7, '')]))  # merged with existing list
+            self.assertEqual(f'{comments_baseline}{PREFIX}7:\n', read_file(f'{PREFIX}!comments_5-7.txt'))
+        print(f'{self._testMethodName} passed')
+
+
+class JournalTests(TestCase):
+    @test_prepare()
+    def test_journal01(self):
+        async def fake_scan(vi: VideoInfo) -> DownloadResult:
+            scanned.append(vi.id)
+            return DownloadResult.SUCCESS
+
+        async def no_keys(*_) -> None:
+            pass
+
+        async def run_scanner() -> list[VideoInfo]:
+            await scn.run()
+            fetched: list[VideoInfo] = []
+            while vi := await scn.try_fetch_next():
+                fetched.append(vi)
+            return fetched
+
+        with TemporaryDirectory(prefix=f'{APP_NAME}_{self._testMethodName}_') as tempdir:
+            Config.dest_base = f'{pathlib.Path(tempdir).as_posix()}/'
+            journal_path = JobJournal.file_path()
+            with JobJournal(journal_path) as journal:
+                self.assertEqual(journal_path, Config.journal_file)
+                vi1, vi2, vi3 = VideoInfo(1, 'title1', 'https://link/1.mp4', 'sub/', 'rv_1_title1.mp4'), VideoInfo(2), VideoInfo(3)
+                vi1.quality = QUALITY_720P
+                for vi in (vi1, vi3):
+                    vi.set_state(VideoInfo.State.SCANNED)
+                    asyncio.run(journal.record_scanned(vi))
+                vi2.set_state(VideoInfo.State.SCANNING)
+                asyncio.run(journal.record_result(vi2, DownloadResult.FAIL_NOT_FOUND))
+                vi3.set_state(VideoInfo.State.FAILED)
+                asyncio.run(journal.record_result(vi3, DownloadResult.FAIL_RETRIES))
+                Config.aborted = True
+            with open(journal_path, 'at', encoding=UTF8) as jfile:
+                jfile.write('{"id": 4, "sta')  # crashed mid-write
+            Config.aborted = False
+            Config.journal_file = None
+            scanned: list[int] = []
+            with (JobJournal(JobJournal.file_path()) as journal, patch('rv.dscanner.wait_for_key', no_keys),
+                  VideoScanWorker([], fake_scan, IdPlan(range(1, 5))) as scn):
+                self.assertTrue(journal.is_finished(2))
+                self.assertFalse(journal.is_finished(3))
+                self.assertIsNone(journal.restore_scanned(3))
+                scn.register_task_finish_callback(no_keys)
+                fetched = asyncio.run(run_scanner())
+                with open(journal_path, 'rt', encoding=UTF8) as jfile:
+                    records = [json.loads(line) for line in jfile.readlines()[5:] if line.strip()]
+            self.assertFalse(os.path.isfile(journal_path))
+        self.assertListEqual([3, 4], scanned)
+        self.assertListEqual([1, 3, 4], [vi.id for vi in fetched])
+        restored = fetched[0]
+        self.assertTupleEqual((vi1.link, vi1.filename, vi1.subfolder, vi1.title), (restored.link, restored.filename, restored.subfolder, restored.title))
+        self.assertIs(QUALITY_720P, restored.quality)
+        self.assertListEqual([3, 4], [record['id'] for record in records])
+        print(f'{self._testMethodName} passed')
+
+    @test_prepare()
+    def test_journal02(self):
+        class FakeResponse:
+            def __init__(self, status: int, content_range: str) -> None:
+                self.status, self.headers, self.content_length, self.closed = status, {'Content-Range': content_range}, 0, False
+
+            def close(self) -> None:
+                self.closed = True
+
+        async def fake_request(vi: VideoInfo, *_) -> FakeResponse:
+            requested.append(vi.link)
+            return FakeResponse(404, '/') if vi.link == 'https://link/old.mp4' else FakeResponse(416, '*/0')
+
+        async def fake_scan(vi: VideoInfo, *, rescan=False) -> DownloadResult:
+            rescans.append(rescan)
+            vi.link = 'https://link/new.mp4'
+            vi.set_state(VideoInfo.State.SCANNED)
+            return scan_result
+
+        with TemporaryDirectory(prefix=f'{APP_NAME}_{self._testMethodName}_') as tempdir:
+            Config.dest_base = f'{pathlib.Path(tempdir).as_posix()}/'
+            Config.throttle, Config.retries = 0, 2
+            journal_path = JobJournal.file_path()
+            with JobJournal(journal_path) as journal:
+                vi = VideoInfo(1, 'title1', 'https://link/old.mp4', '', 'rv_1_title1.mp4')
+                vi.quality = QUALITY_720P
+                vi.set_state(VideoInfo.State.SCANNED)
+                asyncio.run(journal.record_scanned(vi))
+                Config.aborted = True
+            with patch('rv.download.request_media', fake_request), patch('rv.download.scan_video', fake_scan):
+                for scan_result, expected_result in ((DownloadResult.FAIL_NOT_FOUND, DownloadResult.FAIL_NOT_FOUND),
+                                                     (DownloadResult.SUCCESS, DownloadResult.FAIL_ALREADY_EXISTS)):
+                    requested: list[str] = []
+                    rescans: list[bool] = []
+                    with JobJournal(journal_path) as journal:
+                        vi = journal.restore_scanned(1)
+                        self.assertTrue(vi.has_flag(VideoInfo.Flags.RESTORED))
+                        self.assertIs(expected_result, asyncio.run(download_video(vi)))
+                    self.assertFalse(vi.has_flag(VideoInfo.Flags.RESTORED))
+                    self.assertListEqual([True], rescans)
+                    self.assertListEqual(['https://link/old.mp4', 'https://link/new.mp4'][:len(requested)], requested)
+                    self.assertEqual(1 if scan_result == DownloadResult.FAIL_NOT_FOUND else 2, len(requested))
+            with JobJournal(journal_path) as journal:
+                self.assertEqual('https://link/new.mp4', journal.restore_scanned(1).link)
+                Config.aborted = True
+            # same for items filled from scan cache
+            scan_result, requested, rescans = DownloadResult.SUCCESS, [], []
+            vi = VideoInfo(2, 'title2', 'https://link/old.mp4', '', 'rv_2_title2.mp4')
+            vi.set_flag(VideoInfo.Flags.CACHED)
+            with patch('rv.download.request_media', fake_request), patch('rv.download.scan_video', fake_scan):
+                self.assertIs(DownloadResult.FAIL_ALREADY_EXISTS, asyncio.run(download_video(vi)))
+            self.assertFalse(vi.has_flag(VideoInfo.Flags.CACHED))
+            self.assertListEqual([True], rescans)
+            self.assertListEqual(['https://link/old.mp4', 'https://link/new.mp4'], requested)
+        print(f'{self._testMethodName} passed')
+
+
+class DownloadSegmentsTests(TestCase):
+    class FakeContent:
+        def __init__(self, data: bytes) -> None:
+            self._data = data
+
+        async def iter_chunked(self, size: int):
+            for i in range(0, len(self._data), size):
+                await asyncio.sleep(0)
+                yield self._data[i:i + size]
+
+    class FakeResponse:
+        def __init__(self, data: bytes, status: int) -> None:
+            self.content = DownloadSegmentsTests.FakeContent(data)
+            self.status = status
+            self.closed = False
+            self.connection = None
+
+        def raise_for_status(self) -> None:
+            pass
+
+        def close(self) -> None:
+            self.closed = True
+
+    @test_prepare()
+    def test_segments01(self):
+        data = bytes(i % 251 for i in range(1000003))
+        with TemporaryDirectory(prefix=f'{APP_NAME}_{self._testMethodName}_') as tempdir:
+            Config.dest_base = f'{pathlib.Path(tempdir).as_posix()}/'
+            Config.throttle = 0
+            vi = VideoInfo(1, m_filename='rv_1.mp4')
+            segs = DownloadSegments.create(vi.my_fullpath, len(data), 4)
+            self.assertEqual(4, len(segs.missing()))
+            self.assertEqual(len(data) - 1, segs.segments[-1][1])
+            segs.segments[2][2] = 1000
+            segs.save()
+            segs = DownloadSegments.load(vi.my_fullpath)
+            self.assertEqual(1000, segs.done_size())
+            self.assertTupleEqual((0, 250000 - 1), segs.first_missing_range())
+            with open(vi.my_fullpath, 'r+b') as outf:
+                outf.seek(500000)
+                outf.write(data[500000:501000])
+
+            requested: list[str] = []
+
+            async def request_func(headers: dict[str, str]) -> DownloadSegmentsTests.FakeResponse:
+                requested.append(headers['Range'])
+                start, end = (int(_) for _ in headers['Range'][len('bytes='):].split('-'))
+                return DownloadSegmentsTests.FakeResponse(data[start:end + 1], 206)
+
+            first_response = DownloadSegmentsTests.FakeResponse(data[:250000], 206)
+            asyncio.run(download_segments(vi, first_response, segs, ThrottleChecker(vi), request_func))
+            self.assertListEqual(['bytes=250000-499999', 'bytes=501000-749999', 'bytes=750000-1000002'], requested)
+            self.assertTrue(segs.is_complete())
+            self.assertEqual(len(data), vi.get_downloaded_size())
+            self.assertFalse(pathlib.Path(DownloadSegments.sidecar_path(vi.my_fullpath)).is_file())
+            with open(vi.my_fullpath, 'rb') as inf:
+                self.assertEqual(data, inf.read())
+        print(f'{self._testMethodName} passed')
+
+
+class ThrottleCheckerTests(TestCase):
+    @test_prepare()
+    def test_throttle_checker01(self):
+        async def run(speeds_kb: Sequence[int]) -> tuple[float | None, int]:
+            """Feeds data at given speeds (KB/s) for 0.1 seconds each, returns time connection got aborted at"""
+            vi = VideoInfo(1)
+            response = MagicMock()
+            checker = ThrottleChecker(vi)
+            checker.prepare(response, 1000)
+            checker.run()
+            time_start = time.perf_counter()
+            for speed_kb in speeds_kb:
+                for _ in range(10):
+                    await asyncio.sleep(0.01)
+                    vi.bytes_written += speed_kb * Mem.KB // 100
+                    if response.connection.transport.abort.called:
+                        checker.reset()
+                        return time.perf_counter() - time_start, vi.last_check_size
+            checker.reset()
+            return None, vi.last_check_size
+
+        Config.throttle = 100
+        dwn = MagicMock(is_writing=AsyncMock(return_value=True))
+        with (patch('rv.dthrottler.VideoDownloadWorker.get', return_value=dwn), patch('rv.dthrottler.THROTTLE_CHECK_INTERVAL', 0.05),
+              patch('rv.dthrottler.THROTTLE_CHECK_WINDOW', 0.3)):
+            abort_time, _ = asyncio.run(run([200] * 10))
+            self.assertIsNone(abort_time)
+            # window average drops below threshold a bit later than speed does, stall is detected within a window
+            abort_time, last_check_size = asyncio.run(run([200] * 5 + [0] * 5))
+            self.assertIsNotNone(abort_time)
+            self.assertGreater(abort_time, 0.5)
+            self.assertLess(abort_time, 0.5 + 0.3 + 0.1)
+            self.assertEqual(1000 + 5 * 20 * Mem.KB, last_check_size)
+        print(f'{self._testMethodName} passed')
+
+
+class FileWriterTests(TestCase):
+    @test_prepare()
+    def test_file_writer01(self):
+        async def write_chunks(writer: FileWriter, data: bytes, fail=False) -> None:
+            pos = 0
+            while pos < len(data):
+                chunk_size = rnd.randint(1, 200 * Mem.KB)
+                await writer.write(data[pos:pos + chunk_size])
+                pos += chunk_size
+            if fail:
+                raise OSError
+
+        async def write_file(fullpath: str, data: bytes, offset: int, total: int, fail=False) -> None:
+            async with FileWriter(fullpath, offset, total) as writer:
+                self.assertEqual(bool(total and hasattr(os, 'posix_fallocate')), writer.preallocated)
+                if writer.preallocated:
+                    self.assertEqual(total, os.stat(fullpath).st_size)
+                    self.assertTrue(os.path.isfile(DownloadSegments.sidecar_path(fullpath)))
+                await write_chunks(writer, data, fail)
+                self.assertEqual(offset + len(data), writer.written)
+
+        rnd = random.Random(19)
+        Config.write_buffer_size = 256
+        data = rnd.randbytes(3 * Mem.MB + 123)
+        with (TemporaryDirectory(prefix=f'{APP_NAME}_{self._testMethodName}_') as tempdir,
+              patch('os.pwrite', wraps=os.pwrite) as pwrite_mock):
+            fullpath = f'{tempdir}/file.mp4'
+            asyncio.run(write_file(fullpath, data[:1 * Mem.MB + 7], 0, len(data)))
+            with self.assertRaises(OSError):
+                asyncio.run(write_file(fullpath, data[1 * Mem.MB + 7:2 * Mem.MB], 1 * Mem.MB + 7, len(data), True))
+            self.assertEqual(2 * Mem.MB, os.stat(fullpath).st_size)
+            self.assertFalse(os.path.isfile(DownloadSegments.sidecar_path(fullpath)))
+            pwrite_mock.reset_mock()
+            asyncio.run(write_file(fullpath, data[2 * Mem.MB:], 2 * Mem.MB, len(data)))
+            with open(fullpath, 'rb') as wfile:
+                self.assertEqual(data, wfile.read())
+            self.assertFalse(os.path.isfile(DownloadSegments.sidecar_path(fullpath)))
+        writes = [(call.args[2], len(call.args[1])) for call in pwrite_mock.call_args_list]
+        self.assertLessEqual(len(writes), 6)
+        self.assertTrue(all((offset + size) % WRITE_ALIGNMENT == 0 for offset, size in writes[:-1]))
+        print(f'{self._testMethodName} passed')
+
+
+class RequestQueueTests(TestCase):
+    @test_prepare()
+    def test_request_queue01(self):
+        Config.request_rate = 20.0
+        Config.request_burst = 2
+        order: list[tuple[str, int]] = []
+
+        async def request(url: str, num: int) -> None:
+            await RequestQueue.until_ready(url)
+            order.append((url, num))
+
+        async def run_requests() -> float:
+            loop = asyncio.get_running_loop()
+            start = loop.time()
+            await asyncio.gather(*(request(url, i) for i in range(6) for url in ('http://a.org/', 'http://b.org/')))
+            return loop.time() - start
+
+        elapsed = asyncio.run(run_requests())
+        self.assertListEqual(list(range(6)), [num for url, num in order if url == 'http://a.org/'])
+        self.assertListEqual(list(range(6)), [num for url, num in order if url == 'http://b.org/'])
+        self.assertGreaterEqual(elapsed, 0.19)
+        self.assertLess(elapsed, 0.5)
+        print(f'{self._testMethodName} passed')
+
+
+class MetricsTests(TestCase):
+    @test_prepare()
+    def test_metrics01_record(self) -> None:
+        Metrics.inc('html_retries_total', status='429')
+        self.assertDictEqual({}, Metrics._counters)
+        Metrics.enabled = True
+        Metrics.inc('html_retries_total', status='429')
+        Metrics.inc('html_retries_total', 2, status='429')
+        Metrics.inc('html_retries_total', status='TimeoutError')
+        Metrics.observe('download_speed_bytes_per_second', 100.0 * 1024)
+        with Metrics.timer('html_parse_seconds', stage='soup'):
+            pass
+        self.assertEqual(3, Metrics._counters['html_retries_total'][(('status', '429'),)])
+        records = {(r['name'], tuple(r['labels'].items())): r for r in Metrics.snapshot()}
+        self.assertEqual(4, len(records))
+        speed = records[('download_speed_bytes_per_second', ())]
+        self.assertEqual(1, speed['count'])
+        self.assertEqual(0, speed['buckets']['65536'])
+        self.assertEqual(1, speed['buckets']['131072'])
+        self.assertEqual(1, speed['buckets']['+Inf'])
+        parse = records[('html_parse_seconds', (('stage', 'soup'),))]
+        self.assertEqual(1, parse['buckets']['0.005'])
+        text = Metrics.render_prometheus()
+        self.assertIn('# TYPE rv_html_retries_total counter', text)
+        self.assertIn('rv_html_retries_total{status="429"} 3', text)
+        self.assertIn('rv_html_parse_seconds_bucket{stage="soup",le="+Inf"} 1', text)
+        self.assertIn('rv_download_speed_bytes_per_second_count 1', text)
+        print(f'{self._testMethodName} passed')
+
+    @test_prepare()
+    def test_metrics02_export(self) -> None:
+        with TemporaryDirectory(prefix=f'{APP_NAME}_{self._testMethodName}_') as tempdir:
+            with socket.socket() as sock:
+                sock.bind(('127.0.0.1', 0))
+                port = sock.getsockname()[1]
+            Config.metrics_file = f'{tempdir}/metrics.jsonl'
+            Config.metrics_port = port
+
+            async def run() -> str:
+                async with MetricsExporter():
+                    self.assertTrue(Metrics.enabled)
+                    Metrics.inc('scan_results_total', result='SUCCESS')
+                    async with ClientSession() as s, s.get(f'http://127.0.0.1:{port:d}/metrics') as r:
+                        self.assertEqual(200, r.status)
+                        return await r.text()
+
+            served = asyncio.run(run())
+            self.assertFalse(Metrics.enabled)
+            self.assertIn('rv_scan_results_total{result="SUCCESS"} 1', served)
+            with open(Config.metrics_file, 'rt', encoding='utf-8') as mfile:
+                records = [json.loads(line) for line in mfile]
+            self.assertEqual(1, len(records))
+            self.assertEqual({'result': 'SUCCESS'}, records[0]['labels'])
+            self.assertEqual(1, records[0]['value'])
+        print(f'{self._testMethodName} passed')
+
+
+class AsyncFSTests(TestCase):
+    @test_prepare()
+    def test_afs01(self) -> None:
+        def slow_isdir(_: str) -> bool:
+            time.sleep(0.3)
+            return True
+
+        async def tick() -> None:
+            nonlocal ticks
+            while True:
+                await asyncio.sleep(0.01)
+                ticks += 1
+
+        async def run() -> bool:
+            ticker = asyncio.create_task(tick())
+            async with MetricsExporter():
+                result = await afs.isdir('/nfs/slow')
+                time.sleep(0.6)  # blocks the loop for real
+                await asyncio.sleep(0.3)
+            ticker.cancel()
+            return result
+
+        ticks = 0
+        with TemporaryDirectory(prefix=f'{APP_NAME}_{self._testMethodName}_') as tempdir:
+            Config.metrics_file = f'{tempdir}/metrics.jsonl'
+            with patch('os.path.isdir', slow_isdir):
+                self.assertTrue(asyncio.run(run()))
+        self.assertGreater(ticks, 10)
+        fs_calls = Metrics._histograms['fs_call_seconds'][(('op', 'isdir'),)]
+        self.assertEqual(1, fs_calls.count)
+        self.assertGreaterEqual(fs_calls.sum, 0.3)
+        self.assertGreaterEqual(max(h.sum for h in Metrics._histograms['event_loop_lag_seconds'].values()), 0.3)
+        print(f'{self._testMethodName} passed')
+
+
+class ScreenshotWorkerTests(TestCase):
+    @test_prepare()
+    def test_screenshots01(self):
+        from aiohttp import web
+        requested: list[str] = []
+
+        async def serve_screenshot(request: web.Request) -> web.Response:
+            requested.append(request.match_info['num'])
+            if request.match_info['num'] == '3':
+                return web.Response(status=404)
+            return web.Response(body=b'\x00' * 1000, content_type='image/jpeg')
+
+        async def run() -> None:
+            app = web.Application()
+            app.router.add_get('/contents/videos_screenshots/{group}/{id}/336x189/{num}.jpg', serve_screenshot)
+            runner = web.AppRunner(app)
+            await runner.setup()
+            await web.TCPSite(runner, '127.0.0.1', 0).start()
+            Config.site_base_url = f'http://127.0.0.1:{runner.addresses[0][1]:d}'
+            try:
+                with ScreenshotWorker() as scr:
+                    self.assertIs(scr, ScreenshotWorker.get())
+                    task = asyncio.create_task(scr.run())
+                    scr.queue(vi)
+                    scr.queue(vi)  # queued once
+                    await asyncio.sleep(0.1)
+                    scr.close_input()
+                    await task
+                self.assertIsNone(ScreenshotWorker.get())
+            finally:
+                await runner.cleanup()
+
+        with TemporaryDirectory(prefix=f'{APP_NAME}_{self._testMethodName}_') as tempdir:
+            Config.dest_base = f'{pathlib.Path(tempdir).as_posix()}/'
+            vi = VideoInfo(1001, m_filename='rv_1001.mp4')
+            scr_folder = pathlib.Path(f'{vi.my_folder}{PREFIX}{vi.id:d}')
+            scr_folder.mkdir()
+            scr_folder.joinpath('02.webp').write_bytes(b'\x01')
+            asyncio.run(run())
+            self.assertListEqual([str(num) for num in range(1, SCREENSHOTS_COUNT + 1) if num != 2], sorted(requested, key=int))
+            self.assertListEqual([f'{num:02d}.webp' for num in range(1, SCREENSHOTS_COUNT + 1) if num != 3],
+                                 sorted(f.name for f in scr_folder.iterdir()))
+            self.assertEqual(b'\x01', scr_folder.joinpath('02.webp').read_bytes())
+            self.assertEqual(1000, scr_folder.joinpath('01.webp').stat().st_size)
+        print(f'{self._testMethodName} passed')
+
+
+class ConnectionPoolTests(TestCase):
+    @test_prepare()
+    def test_connection_pools01(self) -> None:
+        from aiohttp import web
+
+        async def serve(_: web.Request) -> web.Response:
+            return web.Response(body=b'\x00' * 100)
+
+        async def run() -> None:
+            app = web.Application()
+            app.router.add_get('/{name}', serve)
+            runner = web.AppRunner(app)
+            await runner.setup()
+            await web.TCPSite(runner, '127.0.0.1', 0).start()
+            base_url = f'http://127.0.0.1:{runner.addresses[0][1]:d}'
+            try:
+                async with create_session() as sessionw:
+                    html_session = sessionw.get_session(ClientSessionWrapper.POOL_HTML, False)
+                    media_session = sessionw.get_session(ClientSessionWrapper.POOL_MEDIA, False)
+                    self.assertIsNot(html_session, media_session)
+                    self.assertIsNot(html_session, sessionw.get_session(ClientSessionWrapper.POOL_HTML, True))
+                    self.assertEqual(3, html_session.connector.limit)
+                    self.assertEqual(12, media_session.connector.limit)
+                    self.assertEqual(2, html_session.connector.limit_per_host)
+                    for name in ('a', 'b', 'c'):
+                        async with await wrap_request('GET', f'{base_url}/{name}') as r:
+                            await r.read()
+                    async with await wrap_request('GET', f'{base_url}/d', pool=ClientSessionWrapper.POOL_MEDIA) as r:
+                        await r.read()
+            finally:
+                await runner.cleanup()
+
+        Config.nodelay = True
+        Config.html_connections = 3
+        Config.media_connections = 12
+        Config.connections_per_host = 2
+        Metrics.enabled = True
+        asyncio.run(run())
+        self.assertEqual(1, Metrics._counters['http_connections_total'][(('kind', 'new'), ('pool', 'html'))])
+        self.assertEqual(2, Metrics._counters['http_connections_total'][(('kind', 'reused'), ('pool', 'html'))])
+        self.assertEqual(1, Metrics._counters['http_connections_total'][(('kind', 'new'), ('pool', 'media'))])
+        self.assertNotIn((('kind', 'reused'), ('pool', 'media')), Metrics._counters['http_connections_total'])
+        print(f'{self._testMethodName} passed')
+
+
+class ParsePoolTests(TestCase):
+    @test_prepare()
+    def test_parse_pool01(self) -> None:
+        async def fake_fetch_html_raw(url: str, **_) -> bytes | None:
+            return ExtractTests.VIDEO_PAGE_HTML.encode() if url.endswith('/1') else None
+
+        async def run() -> tuple[VideoPageData | None, VideoPageData | None]:
+            return (await fetch_page('https://site/video/1', extract_video_page, with_comments=True),
+                    await fetch_page('https://site/video/2', extract_video_page, with_comments=True))
+
+        with patch('rv.fetch_html.fetch_html_raw', fake_fetch_html_raw):
+            page_inline, page_none = asyncio.run(run())
+            self.assertIsNone(page_none)
+            with ParsePool(1) as pool:
+                self.assertIs(pool, ParsePool.get())
+                page_pooled, page_none = asyncio.run(run())
+            self.assertIsNone(ParsePool.get())
+        self.assertIsNone(page_none)
+        self.assertIsNotNone(page_inline)
+        self.assertEqual(page_inline, page_pooled)
+        self.assertEqual('Title & more', page_pooled.title)
+        print(f'{self._testMethodName} passed')
+
 
 class DownloadTests(TestCase):
     @test_prepare(True)
@@ -345,6 +1572,308 @@ class DownloadTests(TestCase):
             self.assertGreater(tempfile_fullpath.stat().st_size, 0)
         print(f'{self._testMethodName} passed')
 
+
+class BenchmarkTests(TestCase):
+    @test_prepare()
+    def test_bench_worker_handoff01(self):
+        if not RUN_BENCHMARKS:
+            return
+        items_count, scan_time = 5, 1.0
+        scan_finish_times: dict[int, float] = {}
+        handoff_times: list[float] = []
+
+        async def fake_scan(vi: VideoInfo) -> DownloadResult:
+            await asyncio.sleep(scan_time)
+            scan_finish_times[vi.id] = time.perf_counter()
+            return DownloadResult.SUCCESS
+
+        async def fake_process(vi: VideoInfo) -> DownloadResult:
+            handoff_times.append(time.perf_counter() - scan_finish_times[vi.id])
+            return DownloadResult.SUCCESS
+
+        async def no_keys(*_) -> None:
+            pass
+
+        async def run_workers() -> None:
+            sequence = [VideoInfo(idi) for idi in range(1, items_count + 1)]
+            with VideoScanWorker(sequence, fake_scan) as scn, VideoDownloadWorker(sequence, fake_process, 0) as dwn:
+                for cv in asyncio.as_completed([scn.run(), dwn.run()]):
+                    await cv
+
+        async def run_polling() -> None:
+            # reference: scanner -> downloader handoff by polling as done before workers became event-driven
+            scanned: list[int] = []
+            scan_done = False
+
+            async def scan() -> None:
+                nonlocal scan_done
+                for idi in range(1, items_count + 1):
+                    await fake_scan(VideoInfo(idi))
+                    scanned.append(idi)
+                scan_done = True
+
+            async def fetch() -> None:
+                while not scan_done or scanned:
+                    while not scanned and not scan_done:
+                        await asyncio.sleep(0.1)
+                    if scanned:
+                        queue.append(scanned.pop(0))
+                    await asyncio.sleep(0.2)
+
+            async def consume() -> None:
+                while not scan_done or scanned or queue:
+                    if queue:
+                        await fake_process(VideoInfo(queue.pop(0)))
+                    else:
+                        await asyncio.sleep(0.35)
+
+            queue: list[int] = []
+            await asyncio.gather(scan(), fetch(), consume())
+
+        def measure(coro_func: Callable[[], Coroutine]) -> tuple[float, float, float]:
+            handoff_times.clear()
+            loop = asyncio.new_event_loop()
+            select_orig = loop._selector.select
+            wakeups = 0
+
+            def select_counted(timeout=None):
+                nonlocal wakeups
+                wakeups += 1
+                return select_orig(timeout)
+
+            loop._selector.select = select_counted
+            time_start = time.perf_counter()
+            try:
+                loop.run_until_complete(coro_func())
+            finally:
+                loop.close()
+            return sum(handoff_times) / len(handoff_times), max(handoff_times), wakeups / (time.perf_counter() - time_start)
+
+        with patch('rv.dscanner.wait_for_key', no_keys):
+            avg_polling, max_polling, wakeups_polling = measure(run_polling)
+            avg_events, max_events, wakeups_events = measure(run_workers)
+        self.assertLess(avg_events, avg_polling)
+        self.assertLess(wakeups_events, wakeups_polling)
+        print(f'{self._testMethodName}: {items_count:d} items, scan {scan_time:.2f}s each: '
+              f'polling handoff avg {avg_polling * 1000:.1f}ms max {max_polling * 1000:.1f}ms ({wakeups_polling:.1f} loop wakeups/s), '
+              f'event-driven handoff avg {avg_events * 1000:.2f}ms max {max_events * 1000:.2f}ms ({wakeups_events:.1f} loop wakeups/s)')
+        print(f'{self._testMethodName} passed')
+
+    @test_prepare()
+    def test_bench_video_info_memory01(self):
+        if not RUN_BENCHMARKS:
+            return
+        ids_count = 1_000_000
+
+        class DictVideoInfo:
+            # reference: VideoInfo attributes stored in instance __dict__ as done before __slots__
+            def __init__(self, m_id: int) -> None:
+                for name in VideoInfo.__slots__:
+                    setattr(self, name.lstrip('_'), getattr(sample, name))
+                self.id = m_id
+
+        def measure(make: Callable[[int], object]) -> int:
+            tracemalloc.start()
+            try:
+                entries = [make(idi) for idi in range(1, ids_count + 1)]
+                mem_size = tracemalloc.get_traced_memory()[0]
+                del entries
+            finally:
+                tracemalloc.stop()
+            return mem_size
+
+        sample = VideoInfo(0)
+        size_dict = measure(DictVideoInfo)
+        size_slots = measure(VideoInfo)
+        self.assertLess(size_slots, size_dict)
+        print(f'{self._testMethodName}: {ids_count:d} ids: __dict__ {size_dict / Mem.MB:.1f} Mb ({size_dict / ids_count:.0f} b/item), '
+              f'__slots__ {size_slots / Mem.MB:.1f} Mb ({size_slots / ids_count:.0f} b/item)')
+        print(f'{self._testMethodName} passed')
+
+    @test_prepare()
+    def test_bench_id_plan01(self):
+        if not RUN_BENCHMARKS:
+            return
+        id_range = range(1, 6000001)
+
+        def startup_eager() -> int:
+            # reference: ids sequence materialized and made into items up front as done before IdPlan
+            id_sequence = list(itertools.filterfalse(lambda x: 236 <= x <= 3045049 or x < 0 or x > 6000000, id_range))
+            return len([VideoInfo(idi) for idi in id_sequence])
+
+        def startup_plan() -> int:
+            plan = IdPlan(id_range)
+            return len(plan) if [VideoInfo(idi) for idi in itertools.islice(plan, Config.scan_tasks)] else 0
+
+        timings: list[float] = []
+        for startup in (startup_eager, startup_plan):
+            time_start = time.perf_counter()
+            count = startup()
+            timings.append(time.perf_counter() - time_start)
+            self.assertEqual(6000000 - (3045049 - 236 + 1), count)
+        self.assertLess(timings[1], timings[0])
+        print(f'{self._testMethodName}: {len(id_range):d} ids startup: eager {timings[0]:.3f}s, planned {timings[1] * 1000:.3f}ms')
+        print(f'{self._testMethodName} passed')
+
+    @test_prepare()
+    def test_bench_found_files01(self):
+        if not RUN_BENCHMARKS:
+            return
+        folders_count, files_per_folder, lookups_count = 500, 1000, 200
+        for i in range(folders_count):
+            found_filenames_dict[f'/bench/f{i:d}/'] = [f'rv_{i * files_per_folder + j:d}_720p.mp4' for j in range(files_per_folder)]
+        FoundFilesIndex.build()
+        lookup_ids = [random.randrange(folders_count * files_per_folder) for _ in range(lookups_count)]
+        # reference: linear scan over every folder and file as done before the index was introduced
+        matches = {fname: get_media_file_match(fname) for filenames in found_filenames_dict.values() for fname in filenames}
+
+        def linear_lookup(idi: int) -> str:
+            for folder, filenames in found_filenames_dict.items():
+                for fname in filenames:
+                    f_id, f_quality = matches[fname]
+                    if f_id and str(idi) == f_id and QUALITY_480P <= f_quality:
+                        return f'{folder}{fname}'
+            return ''
+
+        time_start = time.perf_counter()
+        linear_results = [linear_lookup(idi) for idi in lookup_ids]
+        time_linear = time.perf_counter() - time_start
+        time_start = time.perf_counter()
+        indexed_results = [file_already_exists(idi, QUALITY_480P, False) for idi in lookup_ids]
+        time_indexed = time.perf_counter() - time_start
+        self.assertListEqual(linear_results, indexed_results)
+        print(f'{self._testMethodName}: {folders_count * files_per_folder:d} files, {lookups_count:d} lookups: '
+              f'linear {time_linear:.3f}s, indexed {time_indexed:.4f}s (x{time_linear / (time_indexed or 1e-9):.0f})')
+        print(f'{self._testMethodName} passed')
+
+    @test_prepare()
+    def test_bench_file_writer01(self):
+        if not RUN_BENCHMARKS:
+            return
+        from aiofile import async_open
+        from aiohttp import web
+        files_count, file_size = 8, 128 * Mem.MB
+        payload = os.urandom(file_size)
+
+        async def serve_file(request: web.Request) -> web.StreamResponse:
+            response = web.StreamResponse(headers={'Content-Length': str(file_size)})
+            await response.prepare(request)
+            for pos in range(0, file_size, Mem.MB):
+                await response.write(payload[pos:pos + Mem.MB])
+            return response
+
+        async def save_chunked(session: ClientSession, fullpath: str) -> None:
+            # reference: one aiofile write per 128 Kb chunk as done before buffered writer was introduced
+            async with session.get(url) as r, async_open(fullpath, 'ab') as outf:
+                async for chunk in r.content.iter_chunked(128 * Mem.KB):
+                    await outf.write(chunk)
+
+        async def save_buffered(session: ClientSession, fullpath: str) -> None:
+            async with session.get(url) as r, FileWriter(fullpath, 0, r.content_length or 0) as outf:
+                async for chunk in r.content.iter_any():
+                    await outf.write(chunk)
+
+        async def measure(save_func: Callable[[ClientSession, str], Coroutine]) -> tuple[float, float]:
+            with TemporaryDirectory(prefix=f'{APP_NAME}_{self._testMethodName}_') as tempdir:
+                cpu_start, time_start = time.process_time(), time.perf_counter()
+                async with ClientSession() as session:
+                    await asyncio.gather(*(save_func(session, f'{tempdir}/{i:d}.mp4') for i in range(files_count)))
+                result = time.perf_counter() - time_start, time.process_time() - cpu_start
+                self.assertTrue(all(os.stat(f'{tempdir}/{i:d}.mp4').st_size == file_size for i in range(files_count)))
+                return result
+
+        async def run() -> tuple[tuple[float, float], tuple[float, float]]:
+            app = web.Application()
+            app.router.add_get('/file.mp4', serve_file)
+            runner = web.AppRunner(app)
+            await runner.setup()
+            site = web.TCPSite(runner, '127.0.0.1', 0)
+            await site.start()
+            nonlocal url
+            url = f'http://127.0.0.1:{runner.addresses[0][1]:d}/file.mp4'
+            try:
+                return await measure(save_chunked), await measure(save_buffered)
+            finally:
+                await runner.cleanup()
+
+        url = ''
+        (time_chunked, cpu_chunked), (time_buffered, cpu_buffered) = asyncio.run(run())
+        print(f'{self._testMethodName}: {files_count:d} x {file_size // Mem.MB:d} Mb: chunked {time_chunked:.2f}s (cpu {cpu_chunked:.2f}s),'
+              f' buffered {time_buffered:.2f}s (cpu {cpu_buffered:.2f}s)')
+        print(f'{self._testMethodName} passed')
+
+    @test_prepare()
+    def test_bench_parse_pool01(self):
+        if not RUN_BENCHMARKS:
+            return
+        pages_count, refs_count = 16, 1000
+        refs = ''.join(f'<a class="th js-open-popup" href="https://site/video/{idi:d}/title-{idi:d}/"><div class="img wrap_image"'
+                       f' data-preview="https://site/previews/{idi:d}_preview.mp4/"></div><div class="thumb_title">T{idi:d}</div>'
+                       f'<div class="time">1:00</div></a>' for idi in range(refs_count))
+        raw = f'<html><body><div class="thumbs clearfix">{refs}</div></body></html>'.encode()
+
+        async def fake_fetch_html_raw(*_, **__) -> bytes:
+            await asyncio.sleep(0.01)
+            return raw
+
+        async def measure() -> tuple[float, float]:
+            lag_max = 0.0
+
+            async def tick() -> None:
+                nonlocal lag_max
+                while True:
+                    tick_start = time.perf_counter()
+                    await asyncio.sleep(0.005)
+                    lag_max = max(lag_max, time.perf_counter() - tick_start - 0.005)
+
+            ticker = asyncio.create_task(tick())
+            await asyncio.sleep(0.05)
+            time_start = time.perf_counter()
+            pages: list[ListingPageData] = await asyncio.gather(
+                *(fetch_page(f'https://site/{i:d}', extract_listing_page, 'th js-open-popup', with_previews=True)
+                  for i in range(pages_count)))
+            time_total = time.perf_counter() - time_start
+            await asyncio.sleep(0.05)  # let ticker register the last stall
+            result = time_total, lag_max
+            ticker.cancel()
+            self.assertTrue(all(len(page.video_refs) == refs_count for page in pages))
+            return result
+
+        with patch('rv.fetch_html.fetch_html_raw', fake_fetch_html_raw):
+            time_inline, lag_inline = asyncio.run(measure())
+            with ParsePool(4):
+                asyncio.run(measure())  # warm up worker processes
+                time_pooled, lag_pooled = asyncio.run(measure())
+        print(f'{self._testMethodName}: {pages_count:d} pages x {len(raw) // Mem.KB:d} Kb: inline {time_inline:.2f}s'
+              f' (max loop lag {lag_inline * 1000:.0f}ms), pooled {time_pooled:.2f}s (max loop lag {lag_pooled * 1000:.0f}ms)')
+        print(f'{self._testMethodName} passed')
+
+    @test_prepare()
+    def test_bench_end_to_end01(self):
+        if not RUN_BENCHMARKS:
+            return
+        file_size = 4 * Mem.MB
+        scenarios: list[tuple[str, StubSiteParams, list[str], int]] = [
+            ('scan', StubSiteParams(latency=0.02, ratio_404=0.25),
+             ['ids', '-start', '1', '-count', '200', '-dmode', 'skip', '-scantasks', '8'], 0),
+            ('download', StubSiteParams(latency=0.02, bandwidth=8 * Mem.MB, file_size=file_size),
+             ['ids', '-start', '1', '-count', '24', '-quality', '720p'], 24 * file_size),
+            ('pages', StubSiteParams(latency=0.02, file_size=file_size, listing_pages=2, page_size=12),
+             ['pages', '-pages', '2', '-quality', '360p', '-prefetch', '1'], 24 * file_size),
+            # throttled responses only get dropped after a full throttle check window, so this one takes a while
+            ('throttled', StubSiteParams(latency=0.02, file_size=Mem.MB * 3 // 2, throttle_after=Mem.MB, throttle_bandwidth=16 * Mem.KB),
+             ['ids', '-start', '1', '-count', '4', '-throttle', '256'], 4 * (Mem.MB * 3 // 2)),
+        ]
+        results: list[str] = []
+        for name, params, args, expected_bytes in scenarios:
+            with StubSite(params) as site, TemporaryDirectory(prefix=f'{APP_NAME}_{self._testMethodName}_') as tempdir:
+                result = site.run([*args, '-log', 'error'], tempdir)
+            self.assertEqual(0, result.exit_code)
+            self.assertEqual(expected_bytes, result.bytes_written)
+            results.append(f'{name}: {result!s}')
+        print(f'{self._testMethodName}:\n' + '\n'.join(results))
+        print(f'{self._testMethodName} passed')
+
 #
 #
 #########################################
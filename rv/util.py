@@ -8,7 +8,9 @@ Author: trickerer (https://github.com/trickerer, https://github.com/trickerer01)
 
 import datetime
 import time
-from collections.abc import Iterable, Sequence
+from asyncio import Event, wait_for
+from asyncio import TimeoutError as AsyncTimeoutError
+from collections.abc import Callable, Iterable, Sized
 
 from .config import Config
 from .defs import CONNECT_REQUEST_DELAY, DEFAULT_EXT, DOWNLOAD_MODE_FULL, SLASH, START_TIME
@@ -93,7 +95,7 @@ def calc_sleep_time(base_time: float) -> float:
     return base_time if Config.download_mode == DOWNLOAD_MODE_FULL else max(1.0, base_time / 3.0)
 
 
-def calculate_eta(container: Sequence) -> int:
+def calculate_eta(container: Sized) -> int:
     return int(2.0 + (CONNECT_REQUEST_DELAY + 0.2 + 0.02) * len(container))
 
 
@@ -113,6 +115,31 @@ def find_first_not_of(string: str, chars: str, *, start_idx=0, reverse=False) ->
             idx += 1
     return -1
 
+
+class StateSignal:
+    """
+    Broadcast wakeup for tasks waiting for some state to change.
+    Every task waiting at the moment of notify() is woken up to re-check its condition.
+    notify() is synchronous and can be called from anywhere within the event loop thread
+    """
+    def __init__(self) -> None:
+        self._event = Event()
+
+    def notify(self) -> None:
+        self._event.set()
+        self._event = Event()
+
+    async def wait_for(self, predicate: Callable[[], bool], timeout: float | None = None) -> bool:
+        """Waits until **predicate** is true or **timeout** expires. Returns predicate result"""
+        async def wait_predicate() -> None:
+            while not predicate():
+                await self._event.wait()
+        try:
+            await wait_for(wait_predicate(), timeout)
+        except AsyncTimeoutError:
+            pass
+        return predicate()
+
 #
 #
 #########################################
@@ -14,16 +14,27 @@ from aiohttp import ClientTimeout
 
 from .config import Config
 from .defs import (
+    CONNECT_KEEPALIVE_TIMEOUT_MAX,
+    CONNECT_POOL_SIZE_MAX,
+    CONNECT_REQUEST_BURST_MAX,
+    CONNECT_REQUEST_RATE_MAX,
     CONNECT_TIMEOUT_BASE,
     CONNECT_TIMEOUT_SOCKET_READ,
     DEFAULT_QUALITY,
     DOWNLOAD_POLICY_DEFAULT,
+    DOWNLOAD_SEGMENTS_MAX,
     DURATION_MAX,
     IDGAP_PREDICTION_OFF,
     LOGGING_FLAGS,
+    MAX_SCAN_QUEUE_SIZE,
+    MAX_SCAN_QUEUE_SIZE_LIMIT,
     NAMING_FLAGS,
+    PAGE_PREFETCH_MAX,
+    PARSE_PROCESSES_MAX,
     SEARCH_RULE_ALL,
     SLASH,
+    WRITE_BUFFER_SIZE_MAX,
+    WRITE_BUFFER_SIZE_MIN,
     Duration,
     LoggingFlags,
     NamingFlags,
@@ -89,6 +100,11 @@ def find_and_resolve_config_conflicts(full_download=True) -> bool:
             Config.predict_id_gaps = IDGAP_PREDICTION_OFF
             delay_for_message = True
 
+    if Config.scan_tasks > MAX_SCAN_QUEUE_SIZE and Config.predict_id_gaps not in (None, IDGAP_PREDICTION_OFF):
+        Log.info(f'Info: id gaps prediction requires sequential scan, limiting scan tasks to {MAX_SCAN_QUEUE_SIZE:d}')
+        Config.scan_tasks = MAX_SCAN_QUEUE_SIZE
+        delay_for_message = True
+
     if Config.scan_all_pages and Config.start_id <= 1:
         Log.info('Info: \'--scan-all-pages\' flag was set but post id lower bound was not provided, ignored')
         delay_for_message = True
@@ -180,6 +196,60 @@ def valid_lookahead(val: str) -> int:
     return valid_int(val, lb=-200, ub=200, nonzero=True)
 
 
+def valid_request_rate(val: str) -> float:
+    try:
+        val = float(val)
+        assert 0.0 < val <= CONNECT_REQUEST_RATE_MAX
+        return val
+    except Exception:
+        raise ArgumentError
+
+
+def valid_request_burst(val: str) -> int:
+    return valid_int(val, lb=1, ub=CONNECT_REQUEST_BURST_MAX)
+
+
+def valid_download_segments(val: str) -> int:
+    return valid_int(val, lb=1, ub=DOWNLOAD_SEGMENTS_MAX)
+
+
+def valid_write_buffer_size(val: str) -> int:
+    return valid_int(val, lb=WRITE_BUFFER_SIZE_MIN, ub=WRITE_BUFFER_SIZE_MAX)
+
+
+def valid_scan_tasks(val: str) -> int:
+    return valid_int(val, lb=1, ub=MAX_SCAN_QUEUE_SIZE_LIMIT)
+
+
+def valid_parse_processes(val: str) -> int:
+    return valid_int(val, lb=0, ub=PARSE_PROCESSES_MAX)
+
+
+def valid_pool_size(val: str) -> int:
+    return valid_int(val, lb=0, ub=CONNECT_POOL_SIZE_MAX)
+
+
+def valid_keepalive_timeout(val: str) -> int:
+    return valid_int(val, lb=0, ub=CONNECT_KEEPALIVE_TIMEOUT_MAX)
+
+
+def valid_page_prefetch(val: str) -> int:
+    return valid_int(val, lb=0, ub=PAGE_PREFETCH_MAX)
+
+
+def valid_port(val: str) -> int:
+    return valid_int(val, lb=1, ub=65535)
+
+
+def valid_filepath_new(pathstr: str) -> str:
+    try:
+        newpath = normalize_path(os.path.abspath(os.path.expanduser(pathstr.strip('\'"'))), False)
+        assert os.path.isdir(os.path.dirname(newpath)) and not os.path.isdir(newpath)
+        return newpath
+    except Exception:
+        raise ArgumentError
+
+
 def valid_path(pathstr: str) -> str:
     try:
         newpath = normalize_path(os.path.expanduser(pathstr.strip('\'"')))